@@ -0,0 +1,46 @@
+#!/usr/bin/env python
+
+import argparse
+
+import openstack_bugs
+from openstack_bugs import metrics
+from openstack_bugs import plans
+from openstack_bugs import worker
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Apply a plan written by --plan-out")
+    parser.add_argument('plan',
+                        help='The plan file to apply')
+    parser.add_argument('--workers', type=int, default=4,
+                        help=('Number of bugs to update in parallel. '
+                              'Default: 4'))
+    parser.add_argument('--rate', type=float, default=2.0,
+                        help=('Maximum launchpad writes per second, over '
+                              'all workers, 0 for no limit. Default: 2'))
+    parser.add_argument('--metrics-out', metavar='FILE',
+                        help=('Write API call counts, bytes and latencies '
+                              'to FILE at exit, as JSON, or in the '
+                              'Prometheus text format if FILE ends in '
+                              '.prom'))
+    parser.add_argument('--dryrun', action="store_true", default=False,
+                        help=('Only check what is still to do, without '
+                              'writing anything'))
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    if args.metrics_out:
+        metrics.report_at_exit(args.metrics_out)
+    actions = plans.read_plan(args.plan)
+    launchpad = openstack_bugs.launchpad_login()
+    counters = plans.apply_plan(launchpad, actions, workers=args.workers,
+                                rate=args.rate, dryrun=args.dryrun)
+    print "Total actions: %d, %s" % (len(actions), ", ".join(
+        "%s %d" % (k, v) for k, v in sorted(counters.items())))
+
+
+if __name__ == "__main__":
+    worker.run(main)
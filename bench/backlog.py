@@ -0,0 +1,223 @@
+#!/usr/bin/env python
+"""Generate or record backlogs for the fake launchpad and gerrit.
+
+  backlog.py generate --bugs 50000 --out nova-50k.jsonl
+  backlog.py record --project nova --out nova.jsonl
+
+generate makes up a synthetic backlog with a realistic mix of
+statuses, ages, assignees, review links and bug footers. record pulls
+the real backlog of a project from launchpad (which needs launchpadlib
+and credentials) along with the gerrit changes its bugs refer to. See
+openstack_bugs/fakes.py for the format.
+"""
+
+import argparse
+import datetime
+import json
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import bench_versions  # noqa
+import openstack_bugs  # noqa
+from openstack_bugs import gerrit  # noqa
+from openstack_bugs import store  # noqa
+
+STATUSES = (("New", 15), ("Incomplete", 8), ("Confirmed", 25),
+            ("Triaged", 10), ("In Progress", 20), ("Fix Committed", 4),
+            ("Fix Released", 10), ("Won't Fix", 3), ("Invalid", 3),
+            ("Opinion", 1), ("Expired", 1))
+REVIEW_STATUSES = (("NEW", 6), ("MERGED", 3), ("ABANDONED", 1))
+TAGS = ("libvirt", "api", "compute", "scheduler", "low-hanging-fruit",
+        "volumes", "network", "db", "needs-info")
+GERRIT_DATE = "%Y-%m-%d %H:%M:%S.000000000"
+
+
+def _weighted(rng, choices):
+    total = sum(weight for value, weight in choices)
+    pick = rng.uniform(0, total)
+    for value, weight in choices:
+        pick -= weight
+        if pick <= 0:
+            return value
+    return choices[-1][0]
+
+
+def _person(rng):
+    n = rng.randint(1, 400)
+    return "Developer %d (dev%d)" % (n, n), \
+        "https://api.launchpad.net/1.0/~dev%d" % n
+
+
+def _date(when):
+    return when.strftime(store.DATE_FORMAT)
+
+
+def make_bug(rng, bug_id, project, now, next_review):
+    """Return (bug record, [changes]) for one synthetic bug."""
+    created = now - datetime.timedelta(days=rng.randint(0, 1500),
+                                       seconds=rng.randint(0, 86400))
+    updated = created + datetime.timedelta(
+        seconds=(now - created).total_seconds() * rng.random() ** 3)
+    status = _weighted(rng, STATUSES)
+    assignee = None
+    activity = []
+    if status != "New":
+        activity.append(("%s: status" % project, "New", status,
+                         _date(created + (updated - created) / 2)))
+    if rng.random() < (0.85 if status == "In Progress" else 0.2):
+        name, assignee = _person(rng)
+        if rng.random() < 0.3:
+            activity.append(("%s: assignee" % project, _person(rng)[0],
+                             name, _date(updated)))
+    description = bench_versions.make_description(rng, project)
+    messages = [(description, _date(created))]
+    for i in range(rng.choice((0, 0, 1, 1, 2, 3, 6))):
+        messages.append((bench_versions._filler(rng), _date(updated)))
+    changes = []
+    if rng.random() < 0.4 or status == "In Progress":
+        review = next_review()
+        messages.append(("Fix proposed to branch: master\n"
+                         "Review: https://review.openstack.org/%d" % review,
+                         _date(updated)))
+        changes.append(make_change(rng, review, project, bug_id, updated))
+    elif rng.random() < 0.05:
+        # a fix nobody linked from the bug
+        changes.append(make_change(rng, next_review(), project, bug_id,
+                                   now - datetime.timedelta(hours=1),
+                                   status="NEW"))
+    link = "https://api.launchpad.net/1.0/%s/+bug/%d" % (project, bug_id)
+    tasks = [(project, status, rng.choice(openstack_bugs.ALL_STATUS),
+              assignee, int(status in (
+                  "Opinion", "Invalid", "Won't Fix", "Expired",
+                  "Fix Committed", "Fix Released")),
+              "https://bugs.launchpad.net/%s/+bug/%d" % (project, bug_id),
+              link)]
+    if rng.random() < 0.05:
+        series = rng.choice(("newton", "ocata"))
+        tasks.append(("%s/%s" % (project, series),
+                      rng.choice(("New", "Fix Committed", "In Progress")),
+                      "Undecided", None, 0,
+                      "https://bugs.launchpad.net/%s/%s/+bug/%d" % (
+                          project, series, bug_id),
+                      "https://api.launchpad.net/1.0/%s/%s/+bug/%d" % (
+                          project, series, bug_id)))
+    record = {
+        'id': bug_id,
+        'title': bench_versions._filler(rng)[:80],
+        'description': description,
+        'date_created': _date(created),
+        'date_last_updated': _date(updated),
+        'web_link': "https://bugs.launchpad.net/bugs/%d" % bug_id,
+        'tags': rng.sample(TAGS, rng.choice((0, 0, 1, 1, 2))),
+        'messages': messages,
+        'activity': activity,
+        'tasks': tasks,
+    }
+    return record, changes
+
+
+def make_change(rng, number, project, bug_id, updated, status=None):
+    footer = rng.choice(("Closes-Bug", "Closes-Bug", "Partial-Bug",
+                         "Related-Bug"))
+    return {
+        '_number': number,
+        'project': "openstack/%s" % project,
+        'branch': rng.choice(("master", "master", "master",
+                              "stable/ocata")),
+        'status': status or _weighted(rng, REVIEW_STATUSES),
+        'updated': updated.strftime(GERRIT_DATE),
+        'subject': "Fix bug %d" % bug_id,
+        'message': "Fix bug %d\n\n%s\n\n%s: #%d\nChange-Id: I%040x\n" % (
+            bug_id, bench_versions._filler(rng), footer, bug_id,
+            rng.getrandbits(160)),
+    }
+
+
+def generate(count, out, project='nova', seed=42):
+    rng = random.Random(seed)
+    now = datetime.datetime.utcnow()
+    reviews = iter(xrange(400000, 10000000))
+    with open(out, 'w') as f:
+        for i in range(count):
+            record, changes = make_bug(rng, 1000000 + i, project, now,
+                                       lambda: next(reviews))
+            f.write(json.dumps({'bug': record}) + "\n")
+            for change in changes:
+                f.write(json.dumps({'change': change}) + "\n")
+    print("Wrote %d bugs to %s" % (count, out))
+
+
+def _backlog_change(change):
+    revision = change.pop("revisions", {}).values()
+    if revision:
+        change['message'] = revision[0]["commit"]["message"]
+    return change
+
+
+def record(project, out, workers=4):
+    lp = openstack_bugs.launchpad_login()
+    tasks = lp.projects[project].searchTasks(status=store.ALL_TASK_STATUS)
+    reviews = set()
+    count = 0
+    with open(out, 'w') as f:
+        for bug in openstack_bugs.hydrate_bugs(
+                tasks, lp, project, workers=workers,
+                factory=store.fetch_bug):
+            f.write(json.dumps({'bug': bug}) + "\n")
+            for message in bug['messages']:
+                reviews |= set(openstack_bugs.RE_LINK.findall(message[0]))
+            count += 1
+        changes = {}
+        for change in gerrit.scan_changes(
+                'status:open project:openstack/%s message:"bug:"' %
+                project):
+            changes[change['_number']] = change
+        reviews = sorted(reviews)
+        batch = openstack_bugs.REVIEW_BATCH_SIZE
+        queries = [("/changes/", {
+            'q': " OR ".join("change:%s" % r for r in reviews[i:i + batch]),
+            'n': batch, 'o': list(gerrit.QUERY_OPTIONS)})
+            for i in range(0, len(reviews), batch)]
+        for result in gerrit.client().get_many(queries):
+            if isinstance(result, gerrit.GerritError):
+                print("ERROR: %s" % result)
+                continue
+            for change in result:
+                changes[change['_number']] = change
+        for number in sorted(changes):
+            f.write(json.dumps(
+                {'change': _backlog_change(changes[number])}) + "\n")
+    print("Recorded %d bugs and %d changes to %s" % (count, len(changes),
+                                                    out))
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Make backlogs for the fake launchpad and gerrit")
+    commands = parser.add_subparsers(dest='command')
+    gen = commands.add_parser('generate', help='Generate a synthetic backlog')
+    gen.add_argument('--bugs', type=int, default=10000,
+                     help='Number of bugs. Default: 10000')
+    gen.add_argument('--project', default='nova')
+    gen.add_argument('--seed', type=int, default=42)
+    gen.add_argument('--out', required=True)
+    rec = commands.add_parser('record', help='Record a real backlog')
+    rec.add_argument('--project', required=True)
+    rec.add_argument('--workers', type=int, default=4)
+    rec.add_argument('--out', required=True)
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    if args.command == 'generate':
+        generate(args.bugs, args.out, args.project, args.seed)
+    else:
+        record(args.project, args.out, args.workers)
+
+
+if __name__ == "__main__":
+    main()
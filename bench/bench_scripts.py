@@ -0,0 +1,200 @@
+#!/usr/bin/env python
+"""Benchmark the tools against a fake launchpad and gerrit.
+
+Every script runs in its own process in --dryrun mode, against a
+FakeLaunchpad replaying the backlog and a FakeGerrit serving its
+changes, each with a fresh cache directory so nothing is carried over
+between scripts. For each one this reports bugs/sec, launchpad and
+gerrit calls per bug, peak RSS, and how much RSS grew from the first
+bug loaded on (the fake backlog is in memory before that), which
+should stay flat however big the backlog is.
+
+  bench_scripts.py --bugs 5000 --latency 0.01 --workers 8
+
+The backlog is generated (see backlog.py) unless --backlog is given.
+"""
+
+import argparse
+import json
+import os
+import resource
+import runpy
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+
+import backlog  # noqa
+from openstack_bugs import fakes  # noqa
+
+# name, script, arguments (the project, --dryrun and --workers are added)
+SCRIPTS = (
+    ('close-old', 'close-old-bugs.py', []),
+    ('tag-needs-info', 'tag-needs-info.py', []),
+    ('fix-in-progress', 'fix-in-progress-bugs.py', []),
+    ('unassign', 'unassign-non-in-progress-bugs.py', []),
+    ('find-reviews', 'find-reviews-for-bugs.py', []),
+    ('triage', 'triage.py', ['--all']),
+)
+
+
+def rss_kb():
+    """The current RSS in kilobytes, None where we can't tell."""
+    try:
+        with open('/proc/self/statm') as f:
+            pages = int(f.read().split()[1])
+    except (IOError, IndexError, ValueError):
+        return None
+    return pages * resource.getpagesize() // 1024
+
+
+class ScanMemory(threading.Thread):
+    """Samples RSS, to see how much it grows once the scan starts."""
+    def __init__(self, interval=0.01):
+        super(ScanMemory, self).__init__()
+        self.daemon = True
+        self.interval = interval
+        self.start_kb = None
+        self.peak_kb = None
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            self.sample()
+
+    def sample(self):
+        rss = rss_kb()
+        if rss is None:
+            return
+        if self.start_kb is None and fakes.FakeLaunchpad.LOADED:
+            self.start_kb = self.peak_kb = rss
+        if self.start_kb is not None:
+            self.peak_kb = max(self.peak_kb, rss)
+
+    def growth_kb(self):
+        self.stopped.set()
+        self.sample()
+        if self.start_kb is None:
+            return None
+        return self.peak_kb - self.start_kb
+
+
+def child(stats_out, script, argv):
+    """Run a script in this process, then write out what it cost."""
+    sys.argv = [script] + argv
+    memory = ScanMemory()
+    memory.start()
+    start = time.time()
+    try:
+        runpy.run_path(os.path.join(ROOT, script), run_name='__main__')
+    except SystemExit:
+        pass
+    elapsed = time.time() - start
+    with open(stats_out, 'w') as f:
+        json.dump({
+            'elapsed': elapsed,
+            'bugs': len(fakes.FakeLaunchpad.LOADED),
+            'lp_calls': sum(fakes.FakeLaunchpad.CALLS.values()),
+            # kilobytes on linux
+            'rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+            'scan_kb': memory.growth_kb(),
+        }, f)
+
+
+def run_one(script, argv, env):
+    fd, stats_out = tempfile.mkstemp(suffix='.json')
+    os.close(fd)
+    try:
+        with open(os.devnull, 'w') as devnull:
+            subprocess.check_call(
+                [sys.executable, os.path.abspath(__file__), '--child',
+                 stats_out, script] + argv,
+                env=env, stdout=devnull)
+        with open(stats_out) as f:
+            return json.load(f)
+    finally:
+        os.remove(stats_out)
+
+
+def benchmark(args, path, changes):
+    gerrit = fakes.FakeGerrit(changes, latency=args.gerrit_latency).start()
+    print("%-16s %6s %8s %9s %8s %10s %8s %8s" % (
+        "script", "bugs", "seconds", "bugs/s", "lp/bug", "gerrit/bug",
+        "rss MB", "scan MB"))
+    try:
+        for name, script, extra in SCRIPTS:
+            if args.scripts and name not in args.scripts:
+                continue
+            cache = tempfile.mkdtemp()
+            env = dict(os.environ,
+                       OPENSTACK_BUGS_FAKE_LP=path,
+                       OPENSTACK_BUGS_FAKE_LATENCY=str(args.latency),
+                       OPENSTACK_BUGS_GERRIT_URL=gerrit.url,
+                       XDG_CACHE_HOME=cache)
+            gerrit.calls.clear()
+            try:
+                stats = run_one(script, ['--project', args.project,
+                                         '--workers', str(args.workers),
+                                         '--dryrun'] + extra, env)
+            finally:
+                shutil.rmtree(cache)
+            bugs = stats['bugs'] or 1
+            scan = stats['scan_kb']
+            print("%-16s %6d %8.2f %9.1f %8.2f %10.2f %8.1f %8s" % (
+                name, stats['bugs'], stats['elapsed'],
+                stats['bugs'] / stats['elapsed'],
+                float(stats['lp_calls']) / bugs,
+                float(sum(gerrit.calls.values())) / bugs,
+                stats['rss_kb'] / 1024.0,
+                "-" if scan is None else "%.1f" % (scan / 1024.0)))
+    finally:
+        gerrit.stop()
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Benchmark the tools against fake services")
+    parser.add_argument('--backlog',
+                        help='Backlog file to use, instead of generating '
+                        'one')
+    parser.add_argument('--bugs', type=int, default=2000,
+                        help='Number of bugs to generate. Default: 2000')
+    parser.add_argument('--project', default='nova')
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help='Seconds per launchpad call. Default: 0')
+    parser.add_argument('--gerrit-latency', type=float, default=0.0,
+                        help='Seconds per gerrit request. Default: 0')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='--workers for the scripts. Default: 1')
+    parser.add_argument('--scripts', nargs='*',
+                        help='Only run these, out of: %s' %
+                        ", ".join(name for name, script, extra in SCRIPTS))
+    return parser.parse_args()
+
+
+def main():
+    if len(sys.argv) > 1 and sys.argv[1] == '--child':
+        child(sys.argv[2], sys.argv[3], sys.argv[4:])
+        return
+    args = parse_args()
+    path = args.backlog
+    tmp = None
+    if path is None:
+        tmp = tempfile.mkdtemp()
+        path = os.path.join(tmp, 'backlog.jsonl')
+        backlog.generate(args.bugs, path, args.project)
+    try:
+        bugs, changes = fakes.load_backlog(path)
+        benchmark(args, path, changes)
+    finally:
+        if tmp:
+            shutil.rmtree(tmp)
+
+
+if __name__ == "__main__":
+    main()
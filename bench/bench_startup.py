@@ -0,0 +1,160 @@
+#!/usr/bin/env python
+"""Benchmark start up: the tools run cold, and through the worker.
+
+Each script is run --runs times as its own process, the way cron runs
+it, then --runs times again with a worker (run-bug-worker.py) started
+and OPENSTACK_BUGS_WORKER pointing at it. Both run in --dryrun mode
+against a FakeLaunchpad and FakeGerrit serving the same backlog, with
+--login-latency seconds added to each login to stand in for the
+handshake and service description fetch of a real one. The median
+wall clock time of a run, from the process starting to it exiting, is
+reported for each.
+
+  bench_startup.py --bugs 200 --runs 5 --login-latency 1.5
+
+The backlog is generated (see backlog.py) unless --backlog is given.
+"""
+
+import argparse
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+
+import backlog  # noqa
+from openstack_bugs import fakes  # noqa
+from openstack_bugs import worker  # noqa
+
+# name, script, arguments (the project and --dryrun are added)
+SCRIPTS = (
+    ('close-old', 'close-old-bugs.py', []),
+    ('tag-needs-info', 'tag-needs-info.py', []),
+    ('find-reviews', 'find-reviews-for-bugs.py', []),
+    ('triage', 'triage.py', ['--all']),
+)
+
+
+def median(values):
+    values = sorted(values)
+    middle = len(values) // 2
+    if len(values) % 2:
+        return values[middle]
+    return (values[middle - 1] + values[middle]) / 2.0
+
+
+def time_runs(script, argv, env, runs):
+    """Return the seconds each of runs runs of script took."""
+    times = []
+    with open(os.devnull, 'w') as devnull:
+        for i in range(runs):
+            start = time.time()
+            subprocess.check_call(
+                [sys.executable, os.path.join(ROOT, script)] + argv,
+                env=env, stdout=devnull)
+            times.append(time.time() - start)
+    return times
+
+
+def start_worker(path, env, timeout=60):
+    proc = subprocess.Popen(
+        [sys.executable, os.path.join(ROOT, 'run-bug-worker.py'),
+         '--socket', path], env=env, stdout=subprocess.PIPE)
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError("The worker exited with %s" % proc.returncode)
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(path)
+            return proc
+        except socket.error:
+            time.sleep(0.05)
+        finally:
+            probe.close()
+    proc.kill()
+    raise RuntimeError("The worker didn't start in %ds" % timeout)
+
+
+def benchmark(args, path, changes):
+    gerrit = fakes.FakeGerrit(changes, latency=args.gerrit_latency).start()
+    tmp = tempfile.mkdtemp()
+    env = dict(os.environ,
+               OPENSTACK_BUGS_FAKE_LP=path,
+               OPENSTACK_BUGS_FAKE_LATENCY=str(args.latency),
+               OPENSTACK_BUGS_FAKE_LOGIN_LATENCY=str(args.login_latency),
+               OPENSTACK_BUGS_GERRIT_URL=gerrit.url,
+               XDG_CACHE_HOME=os.path.join(tmp, 'cold'))
+    env.pop(worker.ENV, None)
+    scripts = [(name, script, ['--project', args.project, '--dryrun'] + extra)
+               for name, script, extra in SCRIPTS
+               if not args.scripts or name in args.scripts]
+    proc = None
+    try:
+        cold = dict((name, time_runs(script, argv, env, args.runs))
+                    for name, script, argv in scripts)
+        socket_path = os.path.join(tmp, 'worker.sock')
+        env['XDG_CACHE_HOME'] = os.path.join(tmp, 'warm')
+        proc = start_worker(socket_path, env)
+        env[worker.ENV] = socket_path
+        warm = dict((name, time_runs(script, argv, env, args.runs))
+                    for name, script, argv in scripts)
+    finally:
+        if proc is not None:
+            proc.terminate()
+            proc.wait()
+        gerrit.stop()
+        shutil.rmtree(tmp)
+    print("%-16s %10s %10s %8s" % ("script", "cold s", "warm s", "speedup"))
+    for name, script, argv in scripts:
+        print("%-16s %10.3f %10.3f %7.1fx" % (
+            name, median(cold[name]), median(warm[name]),
+            median(cold[name]) / median(warm[name])))
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Benchmark tool start up, cold and through the worker")
+    parser.add_argument('--backlog',
+                        help='Backlog file to use, instead of generating '
+                        'one')
+    parser.add_argument('--bugs', type=int, default=200,
+                        help='Number of bugs to generate. Default: 200')
+    parser.add_argument('--project', default='nova')
+    parser.add_argument('--runs', type=int, default=5,
+                        help='Runs of each script, each way. Default: 5')
+    parser.add_argument('--login-latency', type=float, default=1.5,
+                        help='Seconds per launchpad login. Default: 1.5')
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help='Seconds per launchpad call. Default: 0')
+    parser.add_argument('--gerrit-latency', type=float, default=0.0,
+                        help='Seconds per gerrit request. Default: 0')
+    parser.add_argument('--scripts', nargs='*',
+                        help='Only run these, out of: %s' %
+                        ", ".join(name for name, script, extra in SCRIPTS))
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    path = args.backlog
+    tmp = None
+    if path is None:
+        tmp = tempfile.mkdtemp()
+        path = os.path.join(tmp, 'backlog.jsonl')
+        backlog.generate(args.bugs, path, args.project)
+    try:
+        bugs, changes = fakes.load_backlog(path)
+        benchmark(args, path, changes)
+    finally:
+        if tmp:
+            shutil.rmtree(tmp)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,274 @@
+#!/usr/bin/env python
+"""Benchmark and golden output check for version / OS detection.
+
+The golden corpus in data/versions.jsonl holds synthetic bug
+descriptions along with what the original (pre compiled detector)
+implementation found in them. --check makes sure the current code
+still agrees, and the benchmark compares throughput of the current
+code against that original implementation over --count descriptions.
+"""
+
+import argparse
+import json
+import os
+import random
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import openstack_bugs  # noqa
+
+GOLDEN = os.path.join(os.path.dirname(__file__), 'data', 'versions.jsonl')
+
+
+# The implementation as it was before the compiled detector, kept here
+# verbatim as the reference for both output and speed.
+
+def legacy_version_normalize(version):
+    if not version:
+        return
+
+    version = version.rstrip().lstrip()
+    version = version.split(" ")[0].split("(")[0]
+    if len(version) > 40:
+        return None
+
+    if version.lower() == "master":
+        return None
+
+    mapping = {
+        "2013.1": "grizzly",
+        "2013.2": "havana",
+        "2014.1": "icehouse",
+        "2014.2": "juno",
+        "2015.1": "kilo",
+        "2015.2": "liberty",
+        "12.": "liberty",
+        "13.": "mitaka",
+        "14.": "newton",
+        "15.": "ocata",
+        "16.": "pike"
+    }
+
+    for k, v in mapping.items():
+        if version.startswith(k):
+            return v
+
+    if version.lower() in mapping.values():
+        return version.lower()
+
+    if version.startswith("stable/"):
+        strip_vers = version[7:]
+        if strip_vers.lower() in mapping.values():
+            return strip_vers.lower()
+
+    return version
+
+
+def legacy_discover_stack_version(project, desc):
+    known_versions = ("grizzly", "havana", "icehouse", "juno",
+                      "kilo", "liberty", "mitaka", "newton", "ocata", "pike")
+    matches = (
+        "(^|\n)openstack\s*version\s*:(?P<version>.*)",
+        "(^|\n)%s(\s*version)?\s*:(?P<version>.*)" % project,
+        "(^|\n)openstack-%s-common-(?P<version>.*)" % project,
+        "(^|\n)openstack-%s-compute-(?P<version>.*)" % project,
+        r"\b%s-common\s+\d\:(?P<version>.*)" % project,
+        r"(?P<version>\b(%s)\b)" % ("|".join(known_versions)),
+    )
+    found_version = None
+    for attempt in matches:
+        m = re.search(attempt, desc, re.IGNORECASE)
+        if m:
+            found_version = m.group('version')
+            if found_version:
+                break
+    return legacy_version_normalize(found_version)
+
+
+def legacy_discover_os_version(desc):
+    known_distros = ("ubuntu", "debian", "red\s*hat", "centos",
+                     "fedora", "(open)?suse")
+    found_version = None
+    matches = (
+        "(^|\n)(os|linux)\s*version\s*:(?P<version>.*)",
+        r"(?P<version>\b(%s))" % ("|".join(known_distros)),
+    )
+    for attempt in matches:
+        m = re.search(attempt, desc, re.IGNORECASE)
+        if m:
+            found_version = m.group('version')
+            if found_version:
+                break
+    return found_version
+
+
+# synthetic descriptions
+
+WORDS = ("instance", "boot", "fails", "when", "the", "scheduler", "volume",
+         "attach", "after", "upgrade", "libvirt", "compute", "node", "error",
+         "traceback", "log", "shows", "we", "see", "a", "timeout", "in",
+         "neutron", "port", "binding", "is", "not", "updated", "migration",
+         "resize", "quota", "flavor", "image", "glance", "keystone", "token",
+         "nova-api", "conductor", "rabbit", "database", "kilometer",
+         "junos", "pikes", "debianized", "suse's", "redhat", "openstack")
+VERSION_LINES = (
+    "Openstack Version: %(rel)s",
+    "OpenStack version:%(num)s",
+    "openstack version : %(num)s (%(rel)s)",
+    "openstack version:",
+    "%(project)s version: %(num)s",
+    "%(Project)s Version : stable/%(rel)s",
+    "%(project)s: %(sha)s",
+    "%(project)s version: master",
+    "%(project)s version:",
+    "%(project)s: %(url)s",
+    "openstack-%(project)s-common-%(num)s-1.el7.noarch",
+    "openstack-%(project)s-compute-%(num)s-2.el7.noarch",
+    "ii  %(project)s-common  2:%(num)s-0ubuntu1  all  OpenStack",
+    "we are running %(rel)s in production",
+    "this started after moving to %(Rel)s",
+    "Version: %(num)s",
+)
+OS_LINES = (
+    "OS version: %(distro)s %(dnum)s",
+    "Linux Version : %(distro)s",
+    "os version:",
+    "running on %(distro)s %(dnum)s",
+    "host is %(distro)s",
+)
+RELEASES = ("grizzly", "havana", "icehouse", "juno", "kilo", "liberty",
+            "mitaka", "newton", "ocata", "pike", "queens")
+NUMBERS = ("2013.1.4", "2013.2", "2014.1.3", "2014.2.1", "2015.1.0",
+           "2015.2", "12.0.0", "12.0.4", "13.0.0", "13.1.2", "14.0.0~b2",
+           "15.0.1", "16.0.0.0rc1", "17.0.0", "1:2015.1.1", "11.0.0")
+DISTROS = ("Ubuntu", "ubuntu", "Debian", "Red Hat", "RedHat", "CentOS",
+           "Fedora", "openSUSE", "SUSE", "Gentoo")
+
+
+def _filler(rng):
+    return " ".join(rng.choice(WORDS) for i in range(rng.randint(3, 18)))
+
+
+def make_description(rng, project):
+    values = {
+        'project': project,
+        'Project': project.capitalize(),
+        'rel': rng.choice(RELEASES),
+        'Rel': rng.choice(RELEASES).upper(),
+        'num': rng.choice(NUMBERS),
+        'sha': "%040x" % rng.getrandbits(160),
+        'url': "https://git.openstack.org/cgit/openstack/%s/commit/?id=%s"
+               % (project, "%040x" % rng.getrandbits(160)),
+        'distro': rng.choice(DISTROS),
+        'dnum': rng.choice(("14.04", "16.04", "7.2", "24", "8")),
+    }
+    lines = [_filler(rng) for i in range(rng.randint(1, 8))]
+    for i in range(rng.choice((0, 0, 1, 1, 1, 2, 3))):
+        lines.insert(rng.randint(0, len(lines)),
+                     rng.choice(VERSION_LINES) % values)
+    for i in range(rng.choice((0, 0, 1, 1, 2))):
+        lines.insert(rng.randint(0, len(lines)),
+                     rng.choice(OS_LINES) % values)
+    sep = rng.choice(("\n", "\n", "\n\n", "\r\n"))
+    return sep.join(lines)
+
+
+def make_corpus(count, seed=42):
+    rng = random.Random(seed)
+    corpus = []
+    for i in range(count):
+        project = rng.choice(("nova", "nova", "nova", "cinder",
+                              "oslo.messaging"))
+        # the module name spelling of a dotted project name, which the
+        # project name as a regex matches too
+        spelling = rng.choice((project, "nova", project.replace(".", "_")))
+        corpus.append((project, make_description(rng, spelling)))
+    return corpus
+
+
+# commands
+
+def write_golden(count):
+    cases = []
+    for project, desc in make_corpus(count):
+        cases.append({
+            'project': project,
+            'description': desc,
+            'stack_version': legacy_discover_stack_version(project, desc),
+            'os_version': legacy_discover_os_version(desc),
+        })
+    with open(GOLDEN, 'w') as f:
+        for case in cases:
+            f.write(json.dumps(case, sort_keys=True) + "\n")
+    print("Wrote %d cases to %s" % (len(cases), GOLDEN))
+
+
+def check_golden():
+    with open(GOLDEN) as f:
+        cases = [json.loads(line) for line in f]
+    failures = 0
+    for case in cases:
+        desc = case['description'].encode('utf-8')
+        project = str(case['project'])
+        stack = openstack_bugs.discover_stack_version(project, desc)
+        opsys = openstack_bugs.discover_os_version(desc)
+        if (stack != case['stack_version'] or
+                opsys != case['os_version']):
+            failures += 1
+            print("MISMATCH: %r\n  expected %r / %r\n  got %r / %r" % (
+                desc, case['stack_version'], case['os_version'],
+                stack, opsys))
+    print("Checked %d cases, %d mismatches" % (len(cases), failures))
+    return failures == 0
+
+
+def _throughput(name, stack, opsys, corpus):
+    start = time.time()
+    for project, desc in corpus:
+        stack(project, desc)
+        opsys(desc)
+    elapsed = time.time() - start
+    print("%-8s %8d descriptions in %6.2fs: %9.0f/s" % (
+        name, len(corpus), elapsed, len(corpus) / elapsed))
+    return elapsed
+
+
+def benchmark(count):
+    corpus = make_corpus(count, seed=7)
+    old = _throughput("legacy", legacy_discover_stack_version,
+                      legacy_discover_os_version, corpus)
+    new = _throughput("current", openstack_bugs.discover_stack_version,
+                      openstack_bugs.discover_os_version, corpus)
+    print("speedup: %.2fx" % (old / new))
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Benchmark version and OS discovery")
+    parser.add_argument('--count', type=int, default=100000,
+                        help='Number of descriptions to time. '
+                        'Default: 100000')
+    parser.add_argument('--check', action="store_true", default=False,
+                        help='Only check the golden corpus')
+    parser.add_argument('--write-golden', type=int, metavar='N',
+                        help=('Regenerate the golden corpus with N cases '
+                              'from the legacy implementation'))
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    if args.write_golden:
+        write_golden(args.write_golden)
+        return
+    ok = check_golden()
+    if not args.check:
+        benchmark(args.count)
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
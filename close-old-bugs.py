@@ -3,11 +3,12 @@
 import argparse
 
 import openstack_bugs
-from openstack_bugs.messages import INACTIVE_BUG
-
-from launchpadlib.launchpad import Launchpad
-
-LPSTATUS = ('New', 'Confirmed', 'Triaged', 'In Progress', 'Incomplete')
+from openstack_bugs import journal
+from openstack_bugs import metrics
+from openstack_bugs import plans
+from openstack_bugs import rules
+from openstack_bugs import store
+from openstack_bugs import worker
 
 
 def parse_args():
@@ -17,9 +18,29 @@ def parse_args():
                         help='The project to act on')
     parser.add_argument('--search',
                         help='Custom search terms for bug')
-    parser.add_argument('--no-activity', default=180,
+    parser.add_argument('--no-activity', type=int, default=180,
                         help=('Bugs that have no activity in the last N days '
                               'will be closed. Default: 180'))
+    parser.add_argument('--workers', type=int, default=1,
+                        help=('Number of bugs to load from launchpad in '
+                              'parallel. Default: 1'))
+    parser.add_argument('--from-store', action="store_true", default=False,
+                        help=('Read bugs from the local bug store (see '
+                              'sync-bug-store.py) instead of launchpad. '
+                              'Changes are still made in launchpad.'))
+    parser.add_argument('--resume', action="store_true", default=False,
+                        help=('Carry on with an earlier run with the same '
+                              'options that did not finish, skipping the '
+                              'bugs it already dealt with'))
+    parser.add_argument('--plan-out', metavar='FILE',
+                        help=('Write the changes that would be made to '
+                              'FILE as a plan for apply-plan.py, instead '
+                              'of making them. Implies --dryrun.'))
+    parser.add_argument('--metrics-out', metavar='FILE',
+                        help=('Write API call counts, bytes and latencies '
+                              'to FILE at exit, as JSON, or in the '
+                              'Prometheus text format if FILE ends in '
+                              '.prom'))
     parser.add_argument('--dryrun', action="store_true", default=False)
     parser.add_argument('--verbose', action="store_true", default=False)
     return parser.parse_args()
@@ -27,30 +48,38 @@ def parse_args():
 
 def main():
     args = parse_args()
-    launchpad = Launchpad.login_with('openstack-bugs', 'production')
-    project = launchpad.projects[args.project]
-    count = 0
-    fixed = 0
-
-    for task in project.searchTasks(status=LPSTATUS,
-                                    search_text=args.search,
-                                    omit_duplicates=True,
-                                    order_by='date_last_updated'):
-        bug = openstack_bugs.LPBug(task, launchpad, args.project)
-        count += 1
-        try:
-            if bug.last_updated > 180:
-                print(bug)
-                print("WOULD CLOSE: Last Updated: %s" % bug.last_updated)
-                fixed += 1
-                if not args.dryrun:
-                    bug.add_comment(INACTIVE_BUG %
-                                    (args.no_activity, args.project))
-                    bug.status = "Invalid"
-        except Exception as e:
-            print "ERROR: couldn't mark %s as invalid %s" % (bug, e)
-    print "Total found: %s, closed %s" % (count, fixed)
+    if args.metrics_out:
+        metrics.report_at_exit(args.metrics_out)
+    if args.plan_out:
+        args.dryrun = True
+    launchpad = openstack_bugs.launchpad_login()
+    if args.from_store:
+        launchpad = store.BugStore(lp=launchpad)
+    rule = rules.CloseOldBugs(args.project, no_activity=args.no_activity,
+                              verbose=args.verbose)
+    checkpoints = None
+    if not args.dryrun:
+        checkpoints = journal.Journal(
+            'close-old-bugs', args.project,
+            {'search': args.search,
+             'no_activity': args.no_activity},
+            resume=args.resume)
+        if checkpoints.resumed:
+            print "Resuming, %d bugs already done" % len(checkpoints.done)
+    plan = plans.sink(args.plan_out, keep=args.dryrun and args.verbose)
+    count, plan = rules.run_rules(launchpad, args.project, [rule],
+                                  search=args.search, workers=args.workers,
+                                  dryrun=args.dryrun,
+                                  journal=checkpoints, plan=plan)
+    if args.plan_out:
+        plan.close()
+        print "Wrote %d actions to %s" % (plan.actions, args.plan_out)
+    if args.dryrun and args.verbose:
+        rules.print_plan(plan)
+    print "Total found: %s, closed %s" % (count, rule.counters['closed'])
+    if args.verbose:
+        print openstack_bugs.LPBug.fetch_summary()
 
 
 if __name__ == "__main__":
-    main()
+    worker.run(main)
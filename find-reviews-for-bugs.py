@@ -2,37 +2,11 @@
 
 import argparse
 
-from launchpadlib.launchpad import Launchpad
-
 import openstack_bugs
-from openstack_bugs.messages import NO_REVIEWS
-
-import re
-BUG_REGEX = re.compile(".*bug\:\s*\#?(\d+)", re.IGNORECASE)
-
-URL = ("https://review.openstack.org/changes/?q=status:open+project:%s"
-       "+message:%%22bug:%%22&o=CURRENT_COMMIT&o=CURRENT_REVISION")
-
-
-def find_reviews_for_bugs(project):
-    import requests
-    import json
-    r = requests.get(URL % project)
-    results = json.loads(r.text[4:])
-    bug_rev_mapping = {}
-    for res in results:
-        revision = res["revisions"].values()[0]
-        message = revision["commit"]["message"]
-        bugs = BUG_REGEX.findall(message)
-        # print "%s => %s" % (res["_number"], bugs)
-        # if len(bugs) < 1:
-        #     print "No bugs found in message: %s" % message
-        for bug in bugs:
-            if bug in bug_rev_mapping:
-                bug_rev_mapping[bug].append((res["branch"], res["_number"]))
-            else:
-                bug_rev_mapping[bug] = [(res["branch"], res["_number"])]
-    return bug_rev_mapping
+from openstack_bugs import metrics
+from openstack_bugs import plans
+from openstack_bugs import rules
+from openstack_bugs import worker
 
 
 def parse_args():
@@ -42,43 +16,44 @@ def parse_args():
                         help='The project to act on')
     parser.add_argument('--search',
                         help='Custom search terms for bug')
+    parser.add_argument('--workers', type=int, default=1,
+                        help=('Number of bugs to load from launchpad in '
+                              'parallel. Default: 1'))
+    parser.add_argument('--full-scan', action="store_true", default=False,
+                        help=('Rebuild the gerrit review index from all '
+                              'open reviews, instead of only looking at '
+                              'reviews updated since the last run'))
+    parser.add_argument('--plan-out', metavar='FILE',
+                        help=('Write the changes that would be made to '
+                              'FILE as a plan for apply-plan.py, instead '
+                              'of making them. Implies --dryrun.'))
+    parser.add_argument('--metrics-out', metavar='FILE',
+                        help=('Write API call counts, bytes and latencies '
+                              'to FILE at exit, as JSON, or in the '
+                              'Prometheus text format if FILE ends in '
+                              '.prom'))
     parser.add_argument('--dryrun', action="store_true", default=False)
     return parser.parse_args()
 
 
 def main():
     args = parse_args()
-    launchpad = Launchpad.login_with('openstack-bugs', 'production')
-    # project = launchpad.projects[args.project]
-    bugs = find_reviews_for_bugs("openstack/%s" % args.project)
-    for bug_id, reviews in bugs.items():
-        try:
-            bug = openstack_bugs.LPBug(
-                "https://api.launchpad.net/1.0/bugs/%s" % (bug_id),
-                launchpad, args.project)
-            if bug.task is None:
-                print "Not a Nova Bug!"
-                continue
-            if bug.status not in ("In Progress", "Fix Released"):
-                print "Bug: %s " % bug
-                print "   Reviews: %s" % reviews
-                rev_msg = ""
-                for rev in reviews:
-                    rev_msg += ("review: https://review.openstack.org/%s "
-                                "in branch: %s\n" % (
-                                    rev[1], rev[0]))
-                msg = ("Found open reviews for this bug in gerrit, setting "
-                       "to In Progress. \n\n" + rev_msg)
-                print msg
-                if not args.dryrun:
-                    bug.status = "In Progress"
-                    bug.revert_to_last_assignee()
-                    bug.add_comment(msg)
-                    print("... set to In Progress")
-
-        except Exception as e:
-            print "Failed! https://bugs.launchpad.net/nova/+bug/%s => %s" % (bug_id, e)
+    if args.metrics_out:
+        metrics.report_at_exit(args.metrics_out)
+    if args.plan_out:
+        args.dryrun = True
+    launchpad = openstack_bugs.launchpad_login()
+    rule = rules.FindReviews(args.project, full_scan=args.full_scan)
+    plan = plans.sink(args.plan_out)
+    count, plan = rules.run_rules(launchpad, args.project, [rule],
+                                  workers=args.workers, dryrun=args.dryrun,
+                                  plan=plan)
+    if args.plan_out:
+        plan.close()
+        print "Wrote %d actions to %s" % (plan.actions, args.plan_out)
+    print "Total found: %s, in prog %s" % (count,
+                                           rule.counters['in progress'])
 
 
 if __name__ == "__main__":
-    main()
+    worker.run(main)
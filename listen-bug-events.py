@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+
+import argparse
+
+import openstack_bugs
+from openstack_bugs import cache
+from openstack_bugs import events
+from openstack_bugs import metrics
+from openstack_bugs import rules
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description=("Triage bugs as they change, driven by bug "
+                     "activity notifications"))
+    parser.add_argument('--project', required=True,
+                        help='The project to act on')
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--mqtt-host',
+                        help='MQTT broker to subscribe to')
+    source.add_argument('--events-file',
+                        help=('File of JSON events, one per line, to '
+                              'follow instead of MQTT'))
+    parser.add_argument('--mqtt-port', type=int, default=1883)
+    parser.add_argument('--topic', default='launchpad/#',
+                        help='MQTT topic to subscribe to. Default: '
+                        'launchpad/#')
+    parser.add_argument('--from-start', action="store_true", default=False,
+                        help=('Process the events already in the events '
+                              'file, not just new ones'))
+    parser.add_argument('--debounce', type=int, default=30,
+                        help=('Seconds a bug must be quiet before it is '
+                              'processed. Default: 30'))
+    parser.add_argument('--max-wait', type=int, default=300,
+                        help=('Process a bug after this many seconds even '
+                              'if events keep coming. Default: 300'))
+    parser.add_argument('--age', type=int, default=0,
+                        help=('tag-needs-info: Bugs that are less than this '
+                              'number of days old require versions to not '
+                              'be marked incomplete. Default: 0'))
+    parser.add_argument('--metrics-out', metavar='FILE',
+                        help=('Write API call counts, bytes and latencies '
+                              'to FILE at exit, as JSON, or in the '
+                              'Prometheus text format if FILE ends in '
+                              '.prom'))
+    parser.add_argument('--dryrun', action="store_true", default=False)
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    if args.metrics_out:
+        metrics.report_at_exit(args.metrics_out)
+    launchpad = openstack_bugs.launchpad_login()
+    openstack_bugs.configure_review_cache(cache.default_review_cache_path())
+    openstack_bugs.configure_message_index(cache.default_message_index_path())
+    if args.events_file:
+        source = events.FileSource(args.events_file,
+                                   from_start=args.from_start)
+    else:
+        source = events.MQTTSource(args.mqtt_host, args.topic,
+                                   port=args.mqtt_port)
+    enabled = [rule(args.project) for rule in rules.RULES
+               if rule.triggers != ()]
+    for rule in enabled:
+        if isinstance(rule, rules.TagNeedsInfo):
+            rule.age = args.age
+    stats = events.LatencyStats()
+    try:
+        events.consume(source, launchpad, args.project, enabled,
+                       quiet=args.debounce, max_wait=args.max_wait,
+                       dryrun=args.dryrun, stats=stats)
+    except KeyboardInterrupt:
+        pass
+    print stats.summary()
+    for rule in enabled:
+        print rule.summary()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,93 @@
+import collections
+import contextlib
 import datetime
+import os
 import re
-import json
-import requests
+import Queue
+import threading
+import time
+
+from openstack_bugs import cache
+from openstack_bugs import gerrit
+from openstack_bugs import throttle
+from openstack_bugs.gerrit import GERRIT_URL  # noqa
+from openstack_bugs.gerrit import gerrit_json  # noqa
+from openstack_bugs.timeline import Timeline
+from openstack_bugs.versions import discover_os_version  # noqa
+from openstack_bugs.versions import discover_stack_version  # noqa
+from openstack_bugs.versions import version_normalize  # noqa
 
 
 ALL_STATUS = ('Critical', 'High', 'Medium', 'Undecided', 'Low', 'Wishlist')
-RE_LINK = re.compile('https://review.openstack.org/\#?/?c?/?(\d+)')
+# review links in all the forms gerrit has used: /N, /#/c/N/, /c/N and
+# /c/openstack/nova/+/N
+RE_LINK = re.compile(r'https?://review\.(?:openstack|opendev)\.org/'
+                     r'(?:#/)?(?:c/)?(?:[\w.-]+(?:/[\w.-]+)*/\+/)?(\d+)')
+
+
+# {pid: Launchpad} once keep_login() is called
+_LOGINS = None
+
+
+def keep_login():
+    """Have launchpad_login() log in once and return that from then on.
+
+    For long running processes like the worker (see worker.py), that
+    run script after script. The login is per process, so processes
+    forked from this one still log in for themselves.
+    """
+    global _LOGINS
+    if _LOGINS is None:
+        _LOGINS = {}
+
+
+def launchpad_login():
+    """Log in to production launchpad.
+
+    If OPENSTACK_BUGS_FAKE_LP is set to a backlog file, a
+    fakes.FakeLaunchpad replaying it is returned instead, with
+    OPENSTACK_BUGS_FAKE_LATENCY seconds of latency per API call, after
+    OPENSTACK_BUGS_FAKE_LOGIN_LATENCY seconds standing in for the
+    handshake and service description fetch of a real login.
+
+    launchpadlib keeps an HTTP cache of its own (under ~/.launchpadlib)
+    and revalidates it with conditional requests, so unlike gerrit
+    (see get_review_statuses) bug responses need nothing more.
+    """
+    if _LOGINS is None:
+        return _login()
+    pid = os.getpid()
+    if pid not in _LOGINS:
+        _LOGINS.clear()
+        _LOGINS[pid] = _login()
+    return _LOGINS[pid]
+
+
+def _login():
+    backlog = os.environ.get('OPENSTACK_BUGS_FAKE_LP')
+    if backlog:
+        from openstack_bugs import fakes
+        time.sleep(float(os.environ.get('OPENSTACK_BUGS_FAKE_LOGIN_LATENCY',
+                                        0)))
+        return fakes.FakeLaunchpad.from_file(
+            backlog,
+            float(os.environ.get('OPENSTACK_BUGS_FAKE_LATENCY', 0)))
+    from launchpadlib.launchpad import Launchpad
+    return Launchpad.login_with('openstack-bugs', 'production')
+
+
+def new_session(lp):
+    """Return another launchpad session like lp, for a thread of its own.
+
+    launchpadlib, and httplib2 under it, aren't thread safe, so threads
+    mustn't talk to launchpad through the same Launchpad object at
+    once (see throttle). A real launchpad is logged in to again, with
+    the credentials stored by the first login, and the fakes and the
+    bug store make another of themselves.
+    """
+    if hasattr(type(lp), 'new_session'):
+        return lp.new_session()
+    return _login()
 
 
 def delta(date_value):
@@ -13,177 +95,547 @@ def delta(date_value):
     return delta.days
 
 
-def get_reviews_from_bug(bug):
-    """Return a list of gerrit reviews extracted from the bug's comments."""
+def reviews_from_messages(messages):
+    """Return the set of gerrit reviews linked in a list of messages."""
     reviews = set()
-    for comment in bug.messages:
+    for comment in messages:
         reviews |= set(RE_LINK.findall(comment.content))
     return reviews
 
 
+def _message_bytes(messages):
+    return sum(len(m.content) for m in messages)
+
+
+def messages_after(bug, scanned, messages=None, session=None):
+    """Return (message count, the bug's messages after the first scanned).
+
+    Only the messages after those are fetched, if the bug can say how
+    many it has. Pass messages if the bug's messages have already been
+    fetched, and session if it was loaded in another thread.
+    """
+    if messages is None and getattr(bug, 'message_count', None) is None:
+        # no way to tell what's new without fetching them all
+        messages = throttle.call(lambda: list(bug.messages),
+                                 session=session)
+    count = len(messages) if messages is not None else bug.message_count
+    if count <= scanned:
+        return count, []
+    if messages is not None:
+        return count, messages[scanned:]
+    # lazr.restfulclient refuses slices without an end
+    new = throttle.call(lambda: list(bug.messages[scanned:count]),
+                        session=session, metric='lp.messages',
+                        measure=_message_bytes)
+    LPBug.FETCHES['new_messages'] += 1
+    return count, new
+
+
+def get_reviews_from_bug(bug, messages=None, session=None):
+    """Return the set of gerrit reviews linked in the bug's comments.
+
+    The message index remembers what earlier runs found, so only the
+    messages added since are fetched and scanned. Pass messages if the
+    bug's messages have already been fetched, and session if it was
+    loaded in another thread.
+    """
+    scanned, reviews = _MESSAGE_INDEX.get(bug.id)
+    count, new = messages_after(bug, scanned, messages, session)
+    if count < scanned:
+        scanned, reviews = 0, set()
+        count, new = messages_after(bug, scanned, messages, session)
+    if new:
+        reviews |= reviews_from_messages(new)
+        _MESSAGE_INDEX.set(bug.id, scanned + len(new), reviews)
+    _MESSAGE_INDEX.tally(len(new), scanned)
+    return reviews
+
+
+# number of changes asked for in a single gerrit query, this keeps the
+# url well under common length limits.
+REVIEW_BATCH_SIZE = 50
+
+_REVIEW_CACHE = cache.ReviewCache()
+_MESSAGE_INDEX = cache.MessageIndex(pattern=RE_LINK.pattern)
+
+
+def gerrit_session():
+    """Return the requests session shared by all gerrit calls."""
+    return gerrit.client().session
+
+
+def configure_review_cache(path=None, ttl=cache.DEFAULT_REVIEW_TTL):
+    """Use a persistent review status cache at path for this run."""
+    global _REVIEW_CACHE
+    _REVIEW_CACHE = cache.ReviewCache(path, ttl)
+    return _REVIEW_CACHE
+
+
+def review_cache():
+    return _REVIEW_CACHE
+
+
+def configure_message_index(path=None):
+    """Use a persistent message index at path for this run."""
+    global _MESSAGE_INDEX
+    _MESSAGE_INDEX = cache.MessageIndex(path, RE_LINK.pattern)
+    return _MESSAGE_INDEX
+
+
+def message_index():
+    return _MESSAGE_INDEX
+
+
 def get_review_status(review_number):
-    """Return status of a given review number."""
-    r = requests.get("https://review.openstack.org:443/changes/%s"
-                     % review_number)
-    # strip off first few chars because 'the JSON response body starts with a
-    # magic prefix line that must be stripped before feeding the rest of the
-    # response body to a JSON parser'
-    # https://review.openstack.org/Documentation/rest-api.html
-    status = None
+    """Return status of a given review number, None if there is none."""
+    review_number = str(review_number)
+    found, status = _REVIEW_CACHE.get(review_number)
+    if found:
+        return status
+    etag = None
     try:
-        status = json.loads(r.text[4:])['status']
-    except ValueError:
-        status = r.text
+        etag, change = gerrit.client().revalidate("/changes/%s" %
+                                                  review_number)
+        status = change['status']
+    except gerrit.GerritError as e:
+        if e.status != 404:
+            raise
+        status = None
+    _REVIEW_CACHE.set(review_number, status, etag)
     return status
 
 
+def get_review_statuses(review_nums, batch_size=REVIEW_BATCH_SIZE):
+    """Return a {review: status} mapping for a set of review numbers.
+
+    Reviews are looked up REVIEW_BATCH_SIZE at a time with a single
+    'change:A OR change:B ...' query, and the queries are run
+    concurrently. Reviews gerrit doesn't know about map to None, and
+    reviews whose query failed are left out.
+
+    Reviews the cache has but no longer trusts are asked about one at a
+    time instead, with the ETag gerrit gave us last time, so that the
+    ones that haven't changed come back as an empty 304.
+    """
+    statuses = {}
+    missing = []
+    for review in set(str(r) for r in review_nums):
+        found, status = _REVIEW_CACHE.get(review)
+        if found:
+            statuses[review] = status
+        else:
+            missing.append(review)
+
+    expired = _REVIEW_CACHE.expired(missing)
+    statuses.update(_revalidate_reviews(expired))
+    missing = sorted(r for r in missing if r not in expired)
+    chunks = [missing[i:i + batch_size]
+              for i in range(0, len(missing), batch_size)]
+    queries = [("/changes/",
+                {'q': " OR ".join("change:%s" % review for review in chunk),
+                 'n': len(chunk)})
+               for chunk in chunks]
+    for chunk, (path, params), changes in zip(
+            chunks, queries, gerrit.client().get_many(queries)):
+        if isinstance(changes, gerrit.GerritError):
+            print "ERROR: gerrit query for %s failed: %s" % (params['q'],
+                                                             changes)
+            continue
+        found = dict((str(change['_number']), change['status'])
+                     for change in changes)
+        for review in chunk:
+            statuses[review] = found.get(review)
+        _REVIEW_CACHE.update(dict((review, found.get(review))
+                                  for review in chunk))
+    return statuses
+
+
+def _revalidate_reviews(expired):
+    statuses = {}
+    reviews = sorted(expired)
+    requests = [("/changes/%s" % review, expired[review][1])
+                for review in reviews]
+    for review, result in zip(reviews,
+                              gerrit.client().revalidate_many(requests)):
+        old_status = expired[review][0]
+        if isinstance(result, gerrit.GerritError):
+            if result.status != 404:
+                print "ERROR: gerrit lookup of %s failed: %s" % (review,
+                                                                 result)
+                continue
+            etag, status, modified = None, None, True
+        else:
+            etag, change = result
+            modified = change is not None
+            status = change['status'] if modified else old_status
+        statuses[review] = status
+        _REVIEW_CACHE.revalidate(review, status, etag, modified)
+    return statuses
+
+
+def prefetch_reviews(bugs, size=REVIEW_BATCH_SIZE):
+    """Resolve review status for bugs in batches as they go by.
+
+    This wraps a stream of LPBug objects, and for every batch of bugs
+    looks up all their reviews in gerrit at once, so that later calls
+    to open_reviews on those bugs don't need to go back to gerrit.
+    """
+    batch = []
+    for bug in bugs:
+        batch.append(bug)
+        if len(batch) >= size:
+            _prefetch_batch(batch)
+            for b in batch:
+                yield b
+            batch = []
+    _prefetch_batch(batch)
+    for b in batch:
+        yield b
+
+
+def _prefetch_batch(bugs):
+    reviews = set()
+    for bug in bugs:
+        try:
+            reviews |= bug.reviews
+        except Exception:
+            # the caller will hit this again and report it per bug
+            pass
+    if reviews:
+        get_review_statuses(reviews)
+
+
 def open_reviews(review_nums):
     """Figure out which of the reviews are open."""
+    statuses = get_review_statuses(review_nums)
     openrevs = []
     for review in review_nums:
-        status = get_review_status(review)
+        if str(review) not in statuses:
+            # don't guess, the caller would act on a review being closed
+            raise gerrit.GerritError("no status for review %s" % review)
+        status = statuses[str(review)]
         print "Status: %s => %s" % (review, status)
         if status == "NEW":
             openrevs.append(review)
     return openrevs
 
 
-def version_normalize(version):
-    """A set of normalizations found based on the info.
-
-    This normalizes data based on the project in question to get back
-    to an openstack release for tag name. It's hardcoded to nova after
-    we change versioning schemes.
+class _Hydration(object):
+    """A single pending bug load handed to the worker threads."""
+    def __init__(self, task):
+        self.task = task
+        self.bug = None
+        self.error = None
+        self.done = threading.Event()
 
-    TODO(sdague): project specific mapping.
 
+def _hydrate_worker(queue, lp, project, factory):
+    # a session of our own, made in this thread (the bug store's sqlite
+    # connection has to be)
+    try:
+        session, error = new_session(lp), None
+    except Exception as e:
+        session, error = None, e
+    while True:
+        item = queue.get()
+        if item is None:
+            return
+        try:
+            if error is not None:
+                raise error
+            item.bug = factory(item.task, session, project)
+        except Exception as e:
+            item.error = e
+        item.done.set()
+
+
+def hydrate_bugs(tasks, lp, project=None, workers=1, factory=None,
+                 failed=None):
+    """Build LPBug objects for tasks, loading up to N of them at once.
+
+    tasks can be anything LPBug accepts (searchTasks results or bug
+    urls). With more than 1 worker the bugs are loaded in background
+    threads, each with a launchpad session of its own (see
+    new_session), at most 2 * workers ahead of the consumer, and are
+    still yielded in the order of tasks. Bugs that fail to load are
+    reported and skipped, like the scripts do for any other failure,
+    and their tasks added to failed if it is given.
     """
-    if not version:
+    if factory is None:
+        factory = LPBug
+    if workers <= 1:
+        for task in tasks:
+            try:
+                yield factory(task, lp, project)
+            except Exception as e:
+                print "ERROR: couldn't load %s: %s" % (task, e)
+                if failed is not None:
+                    failed.append(task)
         return
 
-    version = version.rstrip().lstrip()
-    # split off some very standard compound versions markers
-    version = version.split(" ")[0].split("(")[0]
-    # this is a url and not even a git sha
-    if len(version) > 40:
-        return None
-
-    # master is not useful, given that it requires understanding point
-    # in time of the bug. Maybe some day we can manage to make this
-    # detect when it was, and bucket it. That's a whole different beast.
-    if version.lower() == "master":
-        return None
-
-    mapping = {
-        "2013.1": "grizzly",
-        "2013.2": "havana",
-        "2014.1": "icehouse",
-        "2014.2": "juno",
-        "2015.1": "kilo",
-        "2015.2": "liberty",
-        "12.": "liberty",
-        "13.": "mitaka",
-        "14.": "newton",
-        "15.": "ocata",
-        "16.": "pike"
-    }
-
-    for k, v in mapping.items():
-        if version.startswith(k):
-            return v
-
-    if version.lower() in mapping.values():
-        return version.lower()
-
-    if version.startswith("stable/"):
-        strip_vers = version[7:]
-        if strip_vers.lower() in mapping.values():
-            return strip_vers.lower()
-
-    return version
-
-
-def discover_stack_version(project, desc):
-    """Discover the OpenStack Version.
-
-    This attempts to pillage the bug description looking for things
-    that might indicate the version. We do these in sequence as the
-    ones near the top are a lot more trust worthy. Eventually there
-    should probably be some scoring system here.
+    queue = Queue.Queue()
+    threads = []
+    for i in range(workers):
+        t = threading.Thread(target=_hydrate_worker,
+                             args=(queue, lp, project, factory))
+        t.daemon = True
+        t.start()
+        threads.append(t)
+
+    pending = collections.deque()
+
+    def _next():
+        item = pending.popleft()
+        # wait in a loop with a timeout so ^C still works in python 2
+        while not item.done.wait(1):
+            pass
+        if item.error is not None:
+            print "ERROR: couldn't load %s: %s" % (item.task, item.error)
+            if failed is not None:
+                failed.append(item.task)
+        return item.bug
+
+    try:
+        for task in tasks:
+            item = _Hydration(task)
+            pending.append(item)
+            queue.put(item)
+            if len(pending) >= 2 * workers:
+                bug = _next()
+                if bug is not None:
+                    yield bug
+        while pending:
+            bug = _next()
+            if bug is not None:
+                yield bug
+    finally:
+        for t in threads:
+            queue.put(None)
+
+
+class Changes(object):
+    """Writes to a bug buffered by LPBug.batch().
+
+    mutations is the list of (field, value) changes in the order they
+    were made, where field is one of status, assignee, tags or
+    comment, and rules says which rule (if any) made each of them.
     """
-    known_versions = ("grizzly", "havana", "icehouse", "juno",
-                      "kilo", "liberty", "mitaka", "newton", "ocata", "pike")
-    #
-    # the ideal version is Openstack Version: ....
-    matches = (
-        "(^|\n)openstack\s*version\s*:(?P<version>.*)",  # ideal version
-        "(^|\n)%s(\s*version)?\s*:(?P<version>.*)" % project,  # nova version
-        "(^|\n)openstack-%s-common-(?P<version>.*)" % project,  # rhel version
-        "(^|\n)openstack-%s-compute-(?P<version>.*)" % project,  # rhel version
-        r"\b%s-common\s+\d\:(?P<version>.*)" % project,  # ubuntu dpkg
-                                                         # -l version
-        r"(?P<version>\b(%s)\b)" % ("|".join(known_versions)),  # keywords
-    )
-    found_version = None
-    for attempt in matches:
-        m = re.search(attempt, desc, re.IGNORECASE)
-        if m:
-            found_version = m.group('version')
-            if found_version:
-                break
-    return version_normalize(found_version)
-
-
-def discover_os_version(desc):
-    """Discover operating system version heuristically"""
-
-    known_distros = ("ubuntu", "debian", "red\s*hat", "centos",
-                     "fedora", "(open)?suse")
-    found_version = None
-
-    # the ideal version is OS Version: ....
-    matches = (
-        "(^|\n)(os|linux)\s*version\s*:(?P<version>.*)",  # ideal version
-        r"(?P<version>\b(%s))" % ("|".join(known_distros)),  # keywords
-    )
-
-    for attempt in matches:
-        m = re.search(attempt, desc, re.IGNORECASE)
-        if m:
-            found_version = m.group('version')
-            if found_version:
-                break
-    return found_version
+    def __init__(self, dryrun=False):
+        self.dryrun = dryrun
+        self.bug = {}
+        self.task = {}
+        self.comments = []
+        self.mutations = []
+        self.rules = []
+        # set by whoever is making the changes, see rules.apply_rules
+        self.rule = None
+
+    def record(self, field, value):
+        self.mutations.append((field, value))
+        self.rules.append(self.rule)
+
+    def __nonzero__(self):
+        return bool(self.mutations)
+
+    def __str__(self):
+        lines = []
+        for field, value in self.mutations:
+            if field == 'comment':
+                lines.append("add comment: %s" % value)
+            else:
+                lines.append("set %s to %s" % (field, value))
+        return "\n".join(lines)
+
+
+class BugRecord(object):
+    """What the tools keep of a bug once the rules are done with it.
+
+    An LPBug holds on to launchpadlib objects with their whole
+    representation, this only has the fields the tools use, so a long
+    scan can keep a record of every bug it changed without its memory
+    growing with the backlog. status, assignee (a link) and tags are as
+    launchpad had them, description and reviews are None unless they
+    were needed while the rules ran.
+    """
+    __slots__ = ('id', 'bug_link', 'task_link', 'web_link', 'title',
+                 'status', 'assignee', 'tags', 'date_created',
+                 'date_last_updated', 'description', 'reviews')
+
+    def __init__(self, **fields):
+        for name in self.__slots__:
+            setattr(self, name, fields.get(name))
+
+    @classmethod
+    def from_bug(cls, bug):
+        """Make a record of an LPBug, without any more API calls."""
+        return cls(id=bug.bug.id, bug_link=bug.bug.self_link,
+                   task_link=bug.task.self_link,
+                   web_link=bug.task.web_link, title=bug.title,
+                   status=bug.task.status,
+                   # .assignee would be another request, for the person
+                   assignee=bug.task.assignee_link,
+                   tags=tuple(bug.bug.tags),
+                   date_created=bug.bug.date_created,
+                   date_last_updated=bug.bug.date_last_updated,
+                   description=(bug.description
+                                if bug._messages is not None else None),
+                   reviews=(frozenset(bug._reviews)
+                            if bug._reviews is not None else None))
+
+    def __repr__(self):
+        return '<LPBug title="%s" status="%s" link="%s">' % \
+            (unicode(self.title), self.status, self.web_link)
 
 
 class LPBug(object):
+    """A bug, as seen from the task of a single project.
+
+    Everything read from launchpad is fetched at most once per
+    instance (messages, activity, tags and the task fields), and
+    forgotten again when we write something that would change it.
+    FETCHES counts the collection fetches over all bugs, which is
+    handy to make sure that stays true, and WRITES the lp_save and
+    newMessage calls.
+    """
+    FETCHES = collections.Counter()
+    WRITES = collections.Counter()
+
     def __init__(self, task, lp, project=None):
+        # the session the bug was loaded with, and so is used with
+        self.session = lp
         self._project = project
+        self._messages = None
         self._activity = None
-        if type(task) in (str, unicode):
-            self.bug = lp.load(task)
-        else:
-            self.bug = lp.load(task.bug_link)
+        self._timeline = None
+        self._tags = None
+        self._reviews = None
+        self._fields = {}
+        self._changes = None
+        if type(task) not in (str, unicode):
+            task = task.bug_link
+        self.bug = throttle.call(lp.load, task, session=lp,
+                                 metric='lp.load')
+        LPBug.FETCHES['bugs'] += 1
         self.task = None
-        for task in self.bug.bug_tasks:
+        tasks = throttle.call(lambda: list(self.bug.bug_tasks),
+                              session=lp, metric='lp.bug_tasks')
+        for task in tasks:
             if task.bug_target_name == project:
                 self.task = task
 
+    @classmethod
+    def fetch_summary(cls):
+        bugs = cls.FETCHES['bugs'] or 1
+        return "Launchpad fetches: %s; writes: %s" % (
+            ", ".join("%s %d (%.2f/bug)" % (name, count, float(count) / bugs)
+                      for name, count in sorted(cls.FETCHES.items())),
+            ", ".join("%s %d" % (name, count)
+                      for name, count in sorted(cls.WRITES.items())))
+
+    @contextlib.contextmanager
+    def batch(self, dryrun=False):
+        """Buffer all writes to the bug until the end of the block.
+
+        At most one lp_save is done for the bug and one for the task,
+        followed by any comments. With dryrun nothing is written at
+        all, and the returned Changes says what would have been. If
+        the block raises, the buffered writes are dropped.
+        """
+        changes = Changes(dryrun)
+        self._changes = changes
+        try:
+            yield changes
+        finally:
+            self._changes = None
+        if not dryrun:
+            self._flush(changes)
+
+    def _flush(self, changes):
+        if changes.bug:
+            for name, value in changes.bug.items():
+                setattr(self.bug, name, value)
+            self._save(self.bug)
+        if changes.task:
+            for name, value in changes.task.items():
+                setattr(self.task, name, value)
+            self._save(self.task)
+        for msg in changes.comments:
+            self._comment(msg)
+
+    def _save(self, entry):
+        throttle.call(entry.lp_save, session=self.session,
+                      metric='lp.lp_save')
+        LPBug.WRITES['lp_save'] += 1
+        # the change shows up in the activity log
+        self._activity = None
+        self._timeline = None
+
+    def _comment(self, msg):
+        throttle.call(self.bug.newMessage, content=msg, idempotent=False,
+                      session=self.session, metric='lp.newMessage')
+        LPBug.WRITES['newMessage'] += 1
+        self._messages = None
+        self._reviews = None
+
+    def _task_field(self, name):
+        if name not in self._fields:
+            self._fields[name] = getattr(self.task, name)
+        return self._fields[name]
+
+    def _set_task_field(self, name, value):
+        if self._changes is not None:
+            self._changes.task[name] = value
+            self._changes.record(name, value)
+        else:
+            setattr(self.task, name, value)
+            self._save(self.task)
+        self._fields[name] = value
+
+    @property
+    def messages(self):
+        if self._messages is None:
+            self._messages = throttle.call(
+                lambda: list(self.bug.messages), session=self.session,
+                metric='lp.messages', measure=_message_bytes)
+            LPBug.FETCHES['messages'] += 1
+        return self._messages
+
+    @property
+    def activity(self):
+        if self._activity is None:
+            self._activity = throttle.call(
+                lambda: list(self.bug.activity), session=self.session,
+                metric='lp.activity')
+            LPBug.FETCHES['activity'] += 1
+        return self._activity
+
+    @property
+    def timeline(self):
+        if self._timeline is None:
+            # bugs from the store come with theirs
+            self._timeline = getattr(self.bug, 'timeline', None)
+        if self._timeline is None:
+            self._timeline = Timeline.from_activity(self.activity)
+        return self._timeline
+
     @property
     def title(self):
         return self.bug.title
 
     @property
     def status(self):
-        return self.task.status
+        return self._task_field('status')
 
     @status.setter
     def status(self, value):
-        self.task.status = value
-        self.task.lp_save()
+        self._set_task_field('status', value)
 
     def add_comment(self, msg):
-        self.bug.newMessage(content=msg)
+        if self._changes is not None:
+            self._changes.comments.append(msg)
+            self._changes.record('comment', msg)
+        else:
+            self._comment(msg)
 
     @property
     def age(self):
@@ -191,34 +643,64 @@ class LPBug(object):
 
     @property
     def last_updated(self):
+        if self._changes:
+            # pending changes will update the bug
+            return 0
         return delta(self.bug.date_last_updated)
 
     @property
     def assignee(self):
-        return self.task.assignee
+        return self._task_field('assignee')
 
     @assignee.setter
     def assignee(self, name):
-        self.task.assignee = name
-        self.task.lp_save()
+        self._set_task_field('assignee', name)
+
+    def _messages_for_scan(self, scanned):
+        # a bug with nothing scanned yet needs all its messages, fetch
+        # them once and keep them for everything else that wants them
+        if self._messages is None and not scanned:
+            return self.messages
+        return self._messages
 
     @property
     def reviews(self):
-        return get_reviews_from_bug(self.bug)
+        if self._reviews is None:
+            scanned = _MESSAGE_INDEX.get(self.bug.id)[0]
+            self._reviews = get_reviews_from_bug(
+                self.bug, self._messages_for_scan(scanned), self.session)
+        reviews = set(self._reviews)
+        if self._changes is not None:
+            for msg in self._changes.comments:
+                reviews |= set(RE_LINK.findall(msg))
+        return reviews
+
+    def messages_after(self, scanned):
+        """Return (message count, the messages after the first scanned)."""
+        return messages_after(self.bug, scanned,
+                              self._messages_for_scan(scanned), self.session)
 
     @property
     def description(self):
-        msg = self.bug.messages[0]
-        return msg.content.encode("utf-8")
+        # comes with the bug, unlike the first message
+        return self.bug.description.encode("utf-8")
 
     @property
     def tags(self):
-        return list(self.bug.tags)
+        if self._tags is None:
+            self._tags = list(self.bug.tags)
+            LPBug.FETCHES['tags'] += 1
+        return list(self._tags)
 
     @tags.setter
     def tags(self, tag_list):
-        self.bug.tags = tag_list
-        self.bug.lp_save()
+        if self._changes is not None:
+            self._changes.bug['tags'] = tag_list
+            self._changes.record('tags', list(tag_list))
+        else:
+            self.bug.tags = tag_list
+            self._save(self.bug)
+        self._tags = list(tag_list)
 
     def add_tag(self, tag):
         # return True if we add a tag, False if we don't
@@ -237,31 +719,16 @@ class LPBug(object):
 
     @property
     def last_status(self):
-        last = "New"
-        for a in self.bug.activity:
-            if a.whatchanged == ("%s: status" % self._project):
-                last = a.oldvalue
-        return last
+        return self.timeline.last_status(self._project)
 
     def revert_to_last_status(self):
         self.status = self.last_status
 
     def revert_to_last_assignee(self):
-        last = None
-        for a in self.bug.activity:
-            if a.whatchanged == ("%s: assignee" % self._project):
-                if a.oldvalue is not None:
-                    last = a.oldvalue
-
+        last = self.timeline.last_assignee(self._project)
         if last is None:
             return False
-
-        # launchpad is a little rediculous that they give you activity
-        # in a format that you can't actively work with. So
-        # heuristically build the correct url to assigne things.
-        person = last.split("(")[1].split(")")[0]
-        person_url = "https://api.launchpad.net/1.0/~" + person
-        self.assignee = person_url
+        self.assignee = last
 
     def __repr__(self):
         return '<LPBug title="%s" status="%s" link="%s">' % \
@@ -0,0 +1,203 @@
+"""On disk caches shared between runs of the tools."""
+
+import errno
+import os
+import sqlite3
+import threading
+import time
+
+
+# gerrit states a change can never leave
+TERMINAL_STATES = ('MERGED', 'ABANDONED')
+# how long (in seconds) a change in any other state is trusted
+DEFAULT_REVIEW_TTL = 3600
+# how long to wait on another process writing to the same sqlite file
+LOCK_TIMEOUT = 60
+
+
+def cache_dir():
+    """Return (and create) the directory the tools keep their state in."""
+    base = os.environ.get('XDG_CACHE_HOME',
+                          os.path.expanduser(os.path.join('~', '.cache')))
+    path = os.path.join(base, 'openstack-bugs')
+    try:
+        os.makedirs(path)
+    except OSError as e:
+        # several processes can get here at once
+        if e.errno != errno.EEXIST:
+            raise
+    return path
+
+
+class ReviewCache(object):
+    """Gerrit review status cache, backed by sqlite.
+
+    MERGED and ABANDONED reviews are kept forever, anything else
+    (generally NEW) is only trusted for ttl seconds after we last
+    asked gerrit about it. Once that's up we keep the ETag gerrit gave
+    us for the review, so it can be asked again with If-None-Match and
+    answer 304 if nothing changed. Passing path=None keeps the cache in
+    memory for the length of the run only.
+    """
+    def __init__(self, path=None, ttl=DEFAULT_REVIEW_TTL):
+        self.path = path
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.revalidated = 0
+        self.not_modified = 0
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path or ':memory:',
+                                   timeout=LOCK_TIMEOUT,
+                                   check_same_thread=False)
+        self._db.execute("CREATE TABLE IF NOT EXISTS reviews ("
+                         "number TEXT PRIMARY KEY, "
+                         "status TEXT, "
+                         "fetched REAL, "
+                         "etag TEXT)")
+        if 'etag' not in [row[1] for row in self._db.execute(
+                "PRAGMA table_info(reviews)")]:
+            # caches made before we kept ETags, those reviews get one
+            # the next time they are fetched
+            self._db.execute("ALTER TABLE reviews ADD COLUMN etag TEXT")
+        self._db.commit()
+
+    def get(self, review):
+        """Return (found, status) for a review number."""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT status, fetched FROM reviews WHERE number = ?",
+                (str(review),)).fetchone()
+            if row is not None:
+                status, fetched = row
+                if (status in TERMINAL_STATES or
+                        time.time() - fetched < self.ttl):
+                    self.hits += 1
+                    return True, status
+            self.misses += 1
+            return False, None
+
+    def expired(self, reviews):
+        """Return {review: (status, etag)} for the reviews we have but
+        no longer trust, etag None where gerrit didn't give one."""
+        found = {}
+        with self._lock:
+            for review in reviews:
+                row = self._db.execute(
+                    "SELECT status, etag FROM reviews WHERE number = ?",
+                    (str(review),)).fetchone()
+                if row is not None:
+                    found[str(review)] = row
+        return found
+
+    def set(self, review, status, etag=None):
+        self.update({review: status}, {review: etag})
+
+    def update(self, statuses, etags=None):
+        """Store a {review: status} mapping we just got from gerrit,
+        and the {review: etag} that came with them, if any."""
+        etags = etags or {}
+        now = time.time()
+        with self._lock:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO reviews VALUES (?, ?, ?, ?)",
+                [(str(k), v, now, etags.get(k))
+                 for k, v in statuses.items()])
+            self._db.commit()
+
+    def revalidate(self, review, status, etag, modified):
+        """Store the answer to asking gerrit about an expired review
+        with its ETag; not modified keeps the status we had."""
+        with self._lock:
+            self.revalidated += 1
+            if not modified:
+                self.not_modified += 1
+        self.set(review, status, etag)
+
+    def summary(self):
+        total = self.hits + self.misses
+        rate = (100.0 * self.hits / total) if total else 0.0
+        unchanged = ((100.0 * self.not_modified / self.revalidated)
+                     if self.revalidated else 0.0)
+        return ("Review cache: %d hits, %d misses (%.0f%% hit rate), "
+                "%d revalidated (%.0f%% not modified)" % (
+                    self.hits, self.misses, rate,
+                    self.revalidated, unchanged))
+
+
+def default_review_cache_path():
+    return os.path.join(cache_dir(), 'reviews.sqlite')
+
+
+class MessageIndex(object):
+    """The review links found in each bug's comments, backed by sqlite.
+
+    For every bug we keep how many of its messages have been scanned,
+    and the reviews linked from them, so a later run only has to fetch
+    and scan the messages added since. Entries scanned with a different
+    link pattern don't count, so changing the pattern rescans
+    everything once. Passing path=None keeps the index in memory for
+    the length of the run only.
+
+    The triage macros keep track of the comments they have acted on
+    with one of these too, in a file of their own. created is when the
+    index was first made, as a UTC "%Y-%m-%dT%H:%M:%S" string.
+    """
+    def __init__(self, path=None, pattern=''):
+        self.path = path
+        self.pattern = pattern
+        self.scanned = 0
+        self.skipped = 0
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path or ':memory:',
+                                   timeout=LOCK_TIMEOUT,
+                                   check_same_thread=False)
+        self._db.execute("CREATE TABLE IF NOT EXISTS bug_messages ("
+                         "bug_id TEXT PRIMARY KEY, "
+                         "pattern TEXT, "
+                         "scanned INTEGER, "
+                         "reviews TEXT)")
+        self._db.execute("CREATE TABLE IF NOT EXISTS info ("
+                         "key TEXT PRIMARY KEY, value TEXT)")
+        self._db.execute("INSERT OR IGNORE INTO info VALUES ('created', ?)",
+                         (time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime()),))
+        self._db.commit()
+        self.created = self._db.execute(
+            "SELECT value FROM info WHERE key = 'created'").fetchone()[0]
+
+    def get(self, bug_id):
+        """Return (messages scanned, set of reviews) for a bug."""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT pattern, scanned, reviews FROM bug_messages "
+                "WHERE bug_id = ?", (str(bug_id),)).fetchone()
+        if row is None or row[0] != self.pattern:
+            return 0, set()
+        return row[1], set(r for r in row[2].split(',') if r)
+
+    def tally(self, scanned, skipped):
+        """Count messages scanned, and ones we didn't need to."""
+        with self._lock:
+            self.scanned += scanned
+            self.skipped += skipped
+
+    def set(self, bug_id, scanned, reviews):
+        """Store the reviews found in the first scanned messages."""
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO bug_messages VALUES (?, ?, ?, ?)",
+                (str(bug_id), self.pattern, scanned,
+                 ",".join(sorted(reviews))))
+            self._db.commit()
+
+    def summary(self):
+        return "Message index: %d messages scanned, %d skipped" % (
+            self.scanned, self.skipped)
+
+
+def default_message_index_path():
+    return os.path.join(cache_dir(), 'messages.sqlite')
+
+
+def default_macro_index_path():
+    return os.path.join(cache_dir(), 'macros.sqlite')
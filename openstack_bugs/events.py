@@ -0,0 +1,268 @@
+"""Incremental triage driven by a stream of bug activity events.
+
+Instead of polling the whole backlog, listen for notifications about
+bugs that changed and rerun the relevant rules on just that bug. The
+events come from MQTT (paho-mqtt needs to be installed for that), or
+from a file of JSON lines, one event per line, which is handy for
+testing or for feeding events from somewhere else.
+
+An event is a JSON object that has at least the bug, as 'bug_id',
+'bug' or a link to it ('bug_link' or 'link'). It can also say what
+changed ('changed' or 'whatchanged', as a string or list in the format
+of launchpad's bug activity, e.g. 'nova: status'), which project it
+is about ('project'), and when it happened ('timestamp', as unix time).
+
+Events for the same bug are coalesced: a bug is only processed once it
+has been quiet for a while (the debounce period), or once it has been
+waiting max_wait seconds, whichever comes first.
+"""
+
+import heapq
+import json
+import os
+import Queue
+import time
+
+import openstack_bugs
+from openstack_bugs import rules as triage_rules
+
+
+# what launchpad activity is about, reduced to the event kinds that
+# rules listen for (see Rule.triggers)
+KINDS = {
+    'bug': 'created',
+    'description': 'description',
+    'summary': 'description',
+    'tags': 'tags',
+    'status': 'status',
+    'assignee': 'assignee',
+    'importance': 'importance',
+    'message': 'comment',
+    'comment': 'comment',
+    'attachment': 'comment',
+}
+
+
+class Event(object):
+    def __init__(self, bug_id, kinds=None, project=None, timestamp=None,
+                 received=None):
+        self.bug_id = str(bug_id)
+        # None means we don't know what changed
+        self.kinds = kinds
+        self.project = project
+        self.received = received or time.time()
+        self.timestamp = timestamp or self.received
+
+
+def _kind(whatchanged):
+    # 'nova: status' -> 'status'
+    what = whatchanged.split(':')[-1].strip().lower()
+    return KINDS.get(what)
+
+
+def parse_event(payload, received=None):
+    """Turn a raw notification into an Event, or None if it isn't one."""
+    try:
+        data = json.loads(payload)
+    except ValueError:
+        return None
+    if not isinstance(data, dict):
+        return None
+
+    bug_id = data.get('bug_id') or data.get('bug')
+    link = data.get('bug_link') or data.get('link')
+    if not bug_id and link and '/bugs/' in link:
+        bug_id = triage_rules.bug_id_from_link(link)
+    if not bug_id or not str(bug_id).isdigit():
+        return None
+
+    changed = data.get('changed', data.get('whatchanged'))
+    kinds = None
+    if changed:
+        if not isinstance(changed, list):
+            changed = [changed]
+        kinds = set(_kind(c) for c in changed)
+        if None in kinds:
+            # something we don't have a name for, let everything look
+            kinds = None
+    return Event(bug_id, kinds=kinds, project=data.get('project'),
+                 timestamp=data.get('timestamp'), received=received)
+
+
+class Debouncer(object):
+    """Coalesce events per bug until the bug has been quiet for a bit."""
+    def __init__(self, quiet=30, max_wait=300):
+        self.quiet = quiet
+        self.max_wait = max_wait
+        # bug_id -> [first event, last received, kinds]
+        self.pending = {}
+        self._heap = []
+        self.events = 0
+        self.duplicates = 0
+
+    def add(self, event):
+        self.events += 1
+        entry = self.pending.get(event.bug_id)
+        if entry is None:
+            self.pending[event.bug_id] = [event, event.received,
+                                          event.kinds]
+        else:
+            self.duplicates += 1
+            entry[1] = event.received
+            if entry[2] is not None and event.kinds is not None:
+                entry[2] = entry[2] | event.kinds
+            else:
+                entry[2] = None
+        heapq.heappush(self._heap, (self._due(event.bug_id), event.bug_id))
+
+    def _due(self, bug_id):
+        first, last, kinds = self.pending[bug_id]
+        return min(last + self.quiet, first.received + self.max_wait)
+
+    def next_due(self, now=None):
+        """Seconds until the next bug is ready, or None if none pending."""
+        now = now or time.time()
+        while self._heap:
+            due, bug_id = self._heap[0]
+            if bug_id not in self.pending or due != self._due(bug_id):
+                # stale entry, the bug got more events since
+                heapq.heappop(self._heap)
+                continue
+            return max(0, due - now)
+        return None
+
+    def ready(self, now=None):
+        """Return [(first event, kinds)] for every bug that is due."""
+        now = now or time.time()
+        due = []
+        while True:
+            wait = self.next_due(now)
+            if wait is None or wait > 0:
+                return due
+            due_at, bug_id = heapq.heappop(self._heap)
+            first, last, kinds = self.pending.pop(bug_id)
+            due.append((first, kinds))
+
+
+class LatencyStats(object):
+    def __init__(self):
+        self.samples = []
+
+    def add(self, seconds):
+        self.samples.append(seconds)
+
+    def percentile(self, pct):
+        if not self.samples:
+            return 0.0
+        ordered = sorted(self.samples)
+        i = min(len(ordered) - 1, int(round(pct / 100.0 * len(ordered))))
+        return ordered[i]
+
+    def summary(self):
+        return ("%d bugs, event to action latency p50 %.1fs, p90 %.1fs, "
+                "max %.1fs" % (len(self.samples), self.percentile(50),
+                               self.percentile(90),
+                               max(self.samples or [0])))
+
+
+class FileSource(object):
+    """Events as JSON lines appended to a file, like tail -f."""
+    def __init__(self, path, from_start=False, poll=1.0):
+        self.path = path
+        self.poll = poll
+        self._file = open(path)
+        if not from_start:
+            self._file.seek(0, os.SEEK_END)
+        self._partial = ''
+
+    def get(self, timeout=None):
+        deadline = None if timeout is None else time.time() + timeout
+        while True:
+            line = self._file.readline()
+            if line:
+                line = self._partial + line
+                if not line.endswith('\n'):
+                    # the writer isn't done with this line yet
+                    self._partial = line
+                    continue
+                self._partial = ''
+                return line
+            if deadline is not None and time.time() >= deadline:
+                return None
+            wait = self.poll
+            if deadline is not None:
+                wait = min(wait, max(0, deadline - time.time()))
+            time.sleep(wait)
+
+
+class MQTTSource(object):
+    """Events from an MQTT topic, e.g. the openstack firehose."""
+    def __init__(self, host, topic, port=1883):
+        import paho.mqtt.client as mqtt
+        self._queue = Queue.Queue()
+        self._client = mqtt.Client()
+        self._client.on_connect = lambda client, userdata, flags, rc: \
+            client.subscribe(topic)
+        self._client.on_message = lambda client, userdata, msg: \
+            self._queue.put(msg.payload)
+        self._client.connect(host, port)
+        self._client.loop_start()
+
+    def get(self, timeout=None):
+        try:
+            return self._queue.get(timeout=timeout)
+        except Queue.Empty:
+            return None
+
+
+def relevant_rules(rules, kinds):
+    """The rules that should rerun for a bug with these kinds of events."""
+    relevant = []
+    for rule in rules:
+        if rule.triggers is None:
+            relevant.append(rule)
+        elif rule.triggers and (kinds is None or kinds & set(rule.triggers)):
+            relevant.append(rule)
+    return relevant
+
+
+def consume(source, lp, project, rules, quiet=30, max_wait=300,
+            dryrun=False, stats=None, factory=None, limit=None):
+    """Process bugs as events about them come in from source.
+
+    Runs until interrupted, or until limit bugs have been processed.
+    """
+    rules = triage_rules.prepare_rules(lp, rules)
+    if factory is None:
+        factory = openstack_bugs.LPBug
+    debouncer = Debouncer(quiet, max_wait)
+    if stats is None:
+        stats = LatencyStats()
+    processed = 0
+    while limit is None or processed < limit:
+        payload = source.get(timeout=debouncer.next_due())
+        if payload is not None:
+            event = parse_event(payload)
+            if event and event.project in (None, project):
+                debouncer.add(event)
+        for event, kinds in debouncer.ready():
+            todo = relevant_rules(rules, kinds)
+            if not todo:
+                continue
+            try:
+                bug = factory(
+                    "https://api.launchpad.net/1.0/bugs/%s" % event.bug_id,
+                    lp, project)
+            except Exception as e:
+                print "ERROR: couldn't load bug %s: %s" % (event.bug_id, e)
+                continue
+            changes = triage_rules.apply_rules(bug, todo, dryrun=dryrun)
+            latency = time.time() - event.timestamp
+            stats.add(latency)
+            processed += 1
+            print("Bug %s (%s): %s, %.1fs after the event" % (
+                event.bug_id, ", ".join(sorted(kinds or ['any'])),
+                "changed" if changes else "no changes", latency))
+            if dryrun and changes:
+                print(changes)
+    return stats
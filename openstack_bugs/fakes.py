@@ -0,0 +1,429 @@
+"""In memory stand-ins for launchpad and gerrit, for offline runs.
+
+A backlog is a file of JSON lines, each either {"bug": record}, where
+record is what store.fetch_bug returns for a bug, or {"change": change}
+with a gerrit ChangeInfo (the fields the tools use, plus the current
+revision's commit message). bench/backlog.py can generate synthetic
+ones, or record them from the real services.
+
+FakeLaunchpad replays the bugs with enough of the launchpadlib object
+model for the tools, and FakeGerrit serves the changes over HTTP. Both
+can add latency to every call, and count what they were asked for.
+
+Every project's bug supervisor is a team with just TRIAGER in it, who
+wrote the messages of the backlog that don't say who did. Comments the
+tools post are BOT's.
+"""
+
+import BaseHTTPServer
+import collections
+import copy
+import datetime
+import hashlib
+import json
+import SocketServer
+import threading
+import time
+import urlparse
+
+from openstack_bugs import store
+from openstack_bugs import timeline
+
+
+# launchpad collections are fetched in pages of this many entries
+LP_PAGE_SIZE = 75
+COMPLETE_STATUS = ("Opinion", "Invalid", "Won't Fix", "Expired",
+                   "Fix Committed", "Fix Released")
+TRIAGER = timeline.PERSON_URL % 'triager'
+BOT = timeline.PERSON_URL % 'bug-bot'
+
+
+def load_backlog(path):
+    """Return ([bug records], [changes]) read from a backlog file."""
+    bugs = []
+    changes = []
+    with open(path) as f:
+        for line in f:
+            item = json.loads(line)
+            if 'bug' in item:
+                bugs.append(item['bug'])
+            else:
+                changes.append(item['change'])
+    return bugs, changes
+
+
+def _date(value):
+    if value is None or isinstance(value, datetime.datetime):
+        return value
+    return store._date(value)
+
+
+class FakeEntry(object):
+    """A message, activity or other entry that is never written."""
+    def __init__(self, **fields):
+        self.__dict__.update(fields)
+
+
+class FakeCollection(object):
+    """A collection that is only paid for when it is read.
+
+    Like launchpadlib's, iterating fetches every entry, and a slice
+    fetches just the pages it covers. As in lazr.restfulclient, a slice
+    has to say where it ends.
+    """
+    def __init__(self, lp, name, entries):
+        self._lp = lp
+        self._name = name
+        self._entries = entries
+
+    def __iter__(self):
+        self._lp._collection(self._name, len(self._entries))
+        return iter(list(self._entries))
+
+    def __getitem__(self, key):
+        if isinstance(key, slice) and (key.stop is None or key.stop < 0):
+            raise ValueError("Collection slices must have a definite, "
+                             "nonnegative end point.")
+        entries = self._entries[key]
+        if isinstance(key, slice):
+            self._lp._collection(self._name, len(entries))
+        else:
+            self._lp._call(self._name)
+        return entries
+
+
+class FakeTask(object):
+    def __init__(self, lp, bug, target, status, importance, assignee,
+                 is_complete, web_link, self_link):
+        self._lp = lp
+        self._bug = bug
+        self.bug_link = bug.self_link
+        self.bug_target_name = target
+        self.status = status
+        self.importance = importance
+        self.assignee = assignee
+        self.is_complete = bool(is_complete)
+        self.web_link = web_link
+        self.self_link = self_link
+
+    @property
+    def assignee_link(self):
+        # the assignee is only ever kept as its link here
+        return self.assignee
+
+    def lp_save(self):
+        self._lp._call('lp_save')
+        self.is_complete = self.status in COMPLETE_STATUS
+        self._bug.date_last_updated = datetime.datetime.utcnow()
+
+
+class FakeBug(object):
+    def __init__(self, lp, record):
+        self._lp = lp
+        self.id = record['id']
+        self.self_link = store.BUG_URL % self.id
+        self.title = record['title']
+        self.description = record['description']
+        self.date_created = _date(record['date_created'])
+        self.date_last_updated = _date(record['date_last_updated'])
+        self.web_link = record['web_link']
+        self.tags = list(record['tags'])
+        self._messages = [FakeEntry(content=m[0], date_created=_date(m[1]),
+                                    owner_link=m[2] if len(m) > 2 else
+                                    TRIAGER)
+                          for m in record['messages']]
+        self._activity = [FakeEntry(whatchanged=what, oldvalue=old,
+                                    newvalue=new, datechanged=_date(when))
+                          for what, old, new, when in record['activity']]
+        self._tasks = [FakeTask(lp, self, *task) for task in record['tasks']]
+
+    @property
+    def messages(self):
+        return FakeCollection(self._lp, 'messages', self._messages)
+
+    @property
+    def message_count(self):
+        return len(self._messages)
+
+    @property
+    def activity(self):
+        self._lp._collection('activity', len(self._activity))
+        return list(self._activity)
+
+    @property
+    def bug_tasks(self):
+        self._lp._collection('bug_tasks', len(self._tasks))
+        return list(self._tasks)
+
+    def lp_save(self):
+        self._lp._call('lp_save')
+        self.date_last_updated = datetime.datetime.utcnow()
+
+    def newMessage(self, content, subject=None):
+        self._lp._call('newMessage')
+        now = datetime.datetime.utcnow()
+        self._messages.append(FakeEntry(content=content, date_created=now,
+                                        owner_link=BOT))
+        self.date_last_updated = now
+
+
+class _FakeProject(object):
+    def __init__(self, lp, name):
+        self._lp = lp
+        self.name = name
+
+    def getSeries(self, name):
+        self._lp._call('getSeries')
+        return _FakeProject(self._lp, "%s/%s" % (self.name, name))
+
+    @property
+    def bug_supervisor(self):
+        self._lp._call('load')
+        name = "%s-bugs" % self.name
+        return FakeEntry(name=name, self_link=timeline.PERSON_URL % name,
+                         is_team=True, participants=FakeCollection(
+                             self._lp, 'participants',
+                             [FakeEntry(name='triager', self_link=TRIAGER)]))
+
+    def searchTasks(self, status=None, importance=None, search_text=None,
+                    modified_since=None, created_before=None, order_by=None,
+                    **kwargs):
+        tasks = []
+        for bug in self._lp.bugs.values():
+            for task in bug._tasks:
+                if task.bug_target_name != self.name:
+                    continue
+                if status is not None and task.status not in status:
+                    continue
+                if (importance is not None and
+                        task.importance not in importance):
+                    continue
+                if search_text and (search_text not in bug.title and
+                                    search_text not in bug.description):
+                    continue
+                if modified_since:
+                    since = modified_since
+                    if not hasattr(since, 'strftime'):
+                        since = store._date(since)
+                    if bug.date_last_updated < since:
+                        continue
+                if (created_before and
+                        bug.date_created >= _date(created_before)):
+                    continue
+                tasks.append(task)
+        if order_by in ('date_last_updated', '-date_last_updated'):
+            tasks.sort(key=lambda t: t._bug.date_last_updated,
+                       reverse=order_by.startswith('-'))
+        else:
+            tasks.sort(key=lambda t: t._bug.id, reverse=True)
+        return FakeCollection(self._lp, 'searchTasks', tasks)
+
+
+class _FakeProjects(object):
+    def __init__(self, lp):
+        self._lp = lp
+
+    def __getitem__(self, name):
+        return _FakeProject(self._lp, name)
+
+
+class _FakeProjectGroups(object):
+    """Every group has all the projects of the backlog in it."""
+    def __init__(self, lp):
+        self._lp = lp
+
+    def __getitem__(self, name):
+        self._lp._call('load')
+        targets = sorted(set(task.bug_target_name
+                             for task in self._lp.tasks.values()
+                             if '/' not in task.bug_target_name))
+        return FakeEntry(name=name, projects=FakeCollection(
+            self._lp, 'projects', [FakeEntry(name=t) for t in targets]))
+
+
+class FakeLaunchpad(object):
+    """A launchpad holding a backlog of bugs in memory.
+
+    Every API call launchpadlib would make sleeps latency seconds, and
+    is counted in CALLS (fetching a collection costs a call per page).
+    LOADED is the set of bugs that were loaded at least once.
+    """
+    CALLS = collections.Counter()
+    LOADED = set()
+
+    def __init__(self, records=(), latency=0.0):
+        self.latency = latency
+        self.bugs = {}
+        self.tasks = {}
+        self.projects = _FakeProjects(self)
+        self.project_groups = _FakeProjectGroups(self)
+        self._lock = threading.Lock()
+        for record in records:
+            self.add(record)
+
+    @classmethod
+    def from_file(cls, path, latency=0.0):
+        return cls(load_backlog(path)[0], latency)
+
+    def new_session(self):
+        """Another session onto the same bugs, like a second login."""
+        session = copy.copy(self)
+        session.projects = _FakeProjects(session)
+        session.project_groups = _FakeProjectGroups(session)
+        return session
+
+    @classmethod
+    def summary(cls):
+        bugs = len(cls.LOADED) or 1
+        return "Launchpad calls: %d (%.2f/bug); %s" % (
+            sum(cls.CALLS.values()), float(sum(cls.CALLS.values())) / bugs,
+            ", ".join("%s %d" % (name, count)
+                      for name, count in sorted(cls.CALLS.items())))
+
+    def add(self, record):
+        bug = FakeBug(self, record)
+        self.bugs[bug.self_link] = bug
+        for task in bug._tasks:
+            self.tasks[task.self_link] = task
+        return bug
+
+    def _call(self, name, count=1):
+        with self._lock:
+            FakeLaunchpad.CALLS[name] += count
+        if self.latency:
+            time.sleep(self.latency * count)
+
+    def _collection(self, name, size):
+        self._call(name, max(1, -(-size // LP_PAGE_SIZE)))
+
+    def load(self, link):
+        self._call('load')
+        if link in self.tasks:
+            return self.tasks[link]
+        bug_id = int(link.rstrip('/').split('/bugs/')[1].split('/')[0])
+        with self._lock:
+            FakeLaunchpad.LOADED.add(bug_id)
+        return self.bugs[store.BUG_URL % bug_id]
+
+
+class _GerritHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def _reply(self, code, body, etag=None):
+        if etag and self.headers.get('If-None-Match') == etag:
+            gerrit = self.server.gerrit
+            with gerrit._lock:
+                gerrit.calls['not modified'] += 1
+            code, body = 304, ''
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        if etag:
+            self.send_header('ETag', etag)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        gerrit = self.server.gerrit
+        url = urlparse.urlparse(self.path)
+        params = urlparse.parse_qs(url.query)
+        gerrit._call(url.path)
+        if url.path.rstrip('/') == '/changes':
+            changes = gerrit.query(params.get('q', [''])[0],
+                                   int(params.get('n', [500])[0]),
+                                   int(params.get('S', [0])[0]),
+                                   params.get('o', []))
+            self._reply(200, ")]}'\n" + json.dumps(changes))
+            return
+        number = url.path.rstrip('/').split('/')[-1]
+        change = gerrit.changes.get(number)
+        if url.path.startswith('/changes/') and change:
+            body = ")]}'\n" + json.dumps(gerrit.change_info(change, []))
+            self._reply(200, body,
+                        '"%s"' % hashlib.md5(body).hexdigest())
+        else:
+            self._reply(404, "Not found\n")
+
+
+class _ThreadingHTTPServer(SocketServer.ThreadingMixIn,
+                           BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+
+
+class FakeGerrit(object):
+    """A gerrit REST API serving a fixed set of changes.
+
+    Understands the queries the tools make: 'change:N OR change:M',
+    and any of status:, project:, message: and -age: together, with
+    S= / n= paging. Single changes come with an ETag, and a 304 if it
+    matches If-None-Match, as in gerrit. Every request sleeps latency
+    seconds, and is counted in calls.
+    """
+    def __init__(self, changes=(), latency=0.0, port=0):
+        self.changes = dict((str(c['_number']), c) for c in changes)
+        self.latency = latency
+        self.calls = collections.Counter()
+        self._lock = threading.Lock()
+        self._server = _ThreadingHTTPServer(('127.0.0.1', port),
+                                            _GerritHandler)
+        self._server.gerrit = self
+        self.url = "http://127.0.0.1:%d" % self._server.server_address[1]
+
+    def start(self):
+        thread = threading.Thread(target=self._server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _call(self, path):
+        with self._lock:
+            self.calls['/changes/' if path.rstrip('/') == '/changes'
+                       else '/changes/N'] += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def change_info(self, change, options):
+        info = dict((k, v) for k, v in change.items() if k != 'message')
+        if 'CURRENT_COMMIT' in options:
+            info['revisions'] = {change.get('revision', 'current'): {
+                'commit': {'message': change.get('message', '')}}}
+        return info
+
+    def _matches(self, change, term):
+        field, _, value = term.lstrip('-').partition(':')
+        value = value.strip('"')
+        if field == 'change':
+            return str(change['_number']) == value
+        if field == 'status':
+            return (value == 'open') == (change['status'] == 'NEW')
+        if field == 'project':
+            return change['project'] == value
+        if field == 'message':
+            return value.lower() in change.get('message', '').lower()
+        if field == 'age':
+            seconds = int(value.rstrip('s'))
+            updated = datetime.datetime.strptime(change['updated'][:19],
+                                                 "%Y-%m-%d %H:%M:%S")
+            age = (datetime.datetime.utcnow() - updated).total_seconds()
+            return age >= seconds
+        return True
+
+    def query(self, q, n=500, start=0, options=()):
+        alternatives = [alt.split() for alt in q.split(' OR ')]
+        found = []
+        for change in self.changes.values():
+            for terms in alternatives:
+                if all(self._matches(change, term) != term.startswith('-')
+                       for term in terms):
+                    found.append(change)
+                    break
+        found.sort(key=lambda c: (c['updated'], c['_number']), reverse=True)
+        page = [self.change_info(c, options) for c in found[start:start + n]]
+        if page and start + n < len(found):
+            page[-1]['_more_changes'] = True
+        return page
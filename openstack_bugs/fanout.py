@@ -0,0 +1,109 @@
+"""Run a tool over many projects at once, a process per project.
+
+Projects are scanned in parallel from a multiprocessing pool, each in
+a fresh process, so a slow project doesn't hold up the rest and every
+scan starts with its own counters. The parent logs in to launchpad
+first, which stores the credentials for the children to log in with
+without another handshake, and they all share the on disk caches (the
+review cache, message index, gerrit index, bug store and journal are
+sqlite files, fine to use from several processes). The launchpad
+concurrency limit is split between the processes, so together they
+don't ask more of launchpad than a single run would.
+
+Each project's run returns a dict of what happened, and merge() adds
+them up. A project whose run raises is reported and listed under
+'failed' instead, so the projects that worked still count.
+"""
+
+import functools
+import multiprocessing
+import traceback
+
+from openstack_bugs import gerrit
+from openstack_bugs import metrics
+from openstack_bugs import throttle
+
+
+def project_names(lp, projects=None, group=None):
+    """The projects in a comma separated list and/or a project group."""
+    names = []
+    if projects:
+        names.extend(p.strip() for p in projects.split(',') if p.strip())
+    if group:
+        members = throttle.call(lambda: lp.project_groups[group].projects)
+        names.extend(p.name for p in throttle.pages(members))
+    # in order, without repeats
+    return [n for i, n in enumerate(names) if n not in names[:i]]
+
+
+def _run_child(fn, share, project):
+    # a gerrit session of our own, not the pooled connections of the
+    # parent (which can be a long running worker)
+    gerrit.configure_client()
+    governor = throttle.governor()
+    limit = max(1, governor.max_limit // share)
+    throttle.configure(limit=min(limit, governor.limit), max_limit=limit)
+    try:
+        result = fn(project)
+    except Exception:
+        # report it here, where the traceback is, and let the other
+        # projects carry on
+        print "ERROR: %s failed:" % project
+        traceback.print_exc()
+        result = {'failed': [project]}
+    result['metrics'] = metrics.REGISTRY.as_dict()
+    return result
+
+
+def run_projects(fn, projects, processes=None):
+    """Return [fn(project), ...] for projects, run in a process pool.
+
+    fn has to return a dict (see merge) and be picklable, so a module
+    level function or a functools.partial of one. If fn raises, the
+    project's result is {'failed': [project]} instead.
+    """
+    if processes is None:
+        processes = multiprocessing.cpu_count()
+    processes = max(1, min(processes, len(projects)))
+    pool = multiprocessing.Pool(processes, maxtasksperchild=1)
+    try:
+        pending = pool.map_async(
+            functools.partial(_run_child, fn, processes), projects,
+            chunksize=1)
+        # wait in a loop with a timeout so ^C still works in python 2
+        while not pending.ready():
+            pending.wait(1)
+        results = pending.get()
+    except KeyboardInterrupt:
+        pool.terminate()
+        raise
+    pool.close()
+    pool.join()
+    return results
+
+
+def _add(total, value):
+    if total is None:
+        return value
+    if isinstance(value, dict):
+        merged = dict(total)
+        for k, v in value.items():
+            merged[k] = _add(merged.get(k), v)
+        return merged
+    return total + value
+
+
+def merge(results):
+    """Add up the results of run_projects.
+
+    Numbers are added, lists joined and dicts merged key by key. The
+    metrics of each process are added to metrics.REGISTRY.
+    """
+    total = {}
+    for result in results:
+        for key, value in result.items():
+            if key == 'metrics':
+                metrics.REGISTRY.merge(value)
+            else:
+                total[key] = _add(total.get(key), value)
+    return total
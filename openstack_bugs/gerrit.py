@@ -0,0 +1,324 @@
+"""Talking to gerrit, and scanning it for reviews that fix bugs.
+
+GerritClient is a thread safe REST client: it bounds the number of
+requests in flight, puts a timeout on every request, and retries
+connection errors, timeouts and 429/5xx responses with jittered
+exponential backoff. get_many() runs a list of queries concurrently
+and hands back the results in order, so callers that are otherwise
+synchronous can resolve hundreds of reviews at once.
+
+Open changes are fetched a page at a time (following _more_changes),
+and the bugs they reference are kept in a persistent index, so that
+after the first full scan only changes updated since the last one need
+to be fetched again.
+"""
+
+import collections
+import json
+import os
+import Queue
+import random
+import re
+import sqlite3
+import threading
+import time
+
+import requests
+
+from openstack_bugs import cache
+from openstack_bugs import metrics
+
+
+GERRIT_URL = os.environ.get('OPENSTACK_BUGS_GERRIT_URL',
+                            "https://review.openstack.org:443")
+# gerrit prefixes JSON responses with this to defeat XSSI
+MAGIC_PREFIX = ")]}'"
+RETRY_STATUS = (429, 500, 502, 503, 504)
+
+PAGE_SIZE = 250
+# the commit message is all we need from a change, which takes the
+# current revision and commit. Don't have gerrit work out mergeability.
+QUERY_OPTIONS = ('CURRENT_REVISION', 'CURRENT_COMMIT', 'SKIP_MERGEABLE')
+# bug footers, e.g. "Closes-Bug: #1234567" or "Related-Bug: 1234567"
+BUG_FOOTER_RE = re.compile(r"^[ \t]*(?:[a-z]+-)?bug:[ \t]*#?(\d+)",
+                           re.IGNORECASE | re.MULTILINE)
+# rebuild the index from scratch if it hasn't been refreshed this long
+FULL_REFRESH = 7 * 24 * 3600
+# extra overlap on incremental scans, for clock skew and slow scans
+SLACK = 600
+
+
+class GerritError(Exception):
+    def __init__(self, message, status=None):
+        super(GerritError, self).__init__(message)
+        # the HTTP status, if we got that far
+        self.status = status
+
+
+def gerrit_json(text):
+    """Parse a gerrit REST response body."""
+    # 'the JSON response body starts with a magic prefix line that must
+    # be stripped before feeding the rest of the response body to a JSON
+    # parser' https://review.openstack.org/Documentation/rest-api.html
+    if text.startswith(MAGIC_PREFIX):
+        text = text[len(MAGIC_PREFIX):]
+    return json.loads(text)
+
+
+class GerritClient(object):
+    def __init__(self, url=GERRIT_URL, concurrency=8, timeout=30,
+                 retries=4, backoff=0.5, max_backoff=30, session=None):
+        self.url = url
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.session = session or requests.Session()
+        self.stats = collections.Counter()
+        self._slots = threading.BoundedSemaphore(concurrency)
+
+    def _sleep(self, attempt):
+        # "full jitter", so that retrying threads don't move in lock step
+        time.sleep(random.uniform(
+            0, min(self.max_backoff, self.backoff * 2 ** attempt)))
+
+    def _request(self, path, params=None, headers=None):
+        """GET a REST path, retrying, and return the response.
+
+        Raises GerritError if the request still fails after retrying,
+        or fails in a way that retrying won't fix.
+        """
+        attempt = 0
+        while True:
+            self.stats['requests'] += 1
+            try:
+                with self._slots, metrics.timed('gerrit.get') as sample:
+                    r = self.session.get(self.url + path, params=params,
+                                         headers=headers,
+                                         timeout=self.timeout)
+                    sample.bytes = len(r.content)
+                    sample.error = r.status_code >= 400
+            except (requests.ConnectionError, requests.Timeout) as e:
+                error = GerritError("%s: %s" % (path, e))
+            else:
+                if r.status_code < 400:
+                    return r
+                error = GerritError("%s: HTTP %s" % (path, r.status_code),
+                                    r.status_code)
+                if r.status_code not in RETRY_STATUS:
+                    raise error
+            if attempt >= self.retries:
+                self.stats['failures'] += 1
+                raise error
+            self.stats['retries'] += 1
+            self._sleep(attempt)
+            attempt += 1
+
+    def _json(self, path, r):
+        try:
+            return gerrit_json(r.text)
+        except ValueError:
+            raise GerritError("%s: bad response %r" % (path, r.text[:200]),
+                              r.status_code)
+
+    def get(self, path, params=None):
+        """GET a REST path (e.g. /changes/), return the parsed JSON.
+
+        Raises GerritError if the request still fails after retrying,
+        or fails in a way that retrying won't fix.
+        """
+        return self._json(path, self._request(path, params))
+
+    def revalidate(self, path, etag=None):
+        """GET a REST path, unless it still matches etag.
+
+        Returns (etag, parsed JSON), or (etag, None) if gerrit says
+        the response hasn't changed since it gave us etag. Gerrit only
+        sends ETags for single changes, not for queries.
+        """
+        headers = {'If-None-Match': etag} if etag else None
+        r = self._request(path, headers=headers)
+        if r.status_code == 304:
+            self.stats['not modified'] += 1
+            return etag, None
+        return r.headers.get('ETag'), self._json(path, r)
+
+    def get_many(self, queries):
+        """Run a list of (path, params) GETs concurrently.
+
+        Returns the results in the same order, with a GerritError in
+        place of the result for any query that failed.
+        """
+        return self._concurrently(self.get, queries)
+
+    def revalidate_many(self, items):
+        """Run a list of (path, etag) revalidations concurrently.
+
+        As get_many, with revalidate's (etag, JSON or None) results.
+        """
+        return self._concurrently(self.revalidate, items)
+
+    def _concurrently(self, fn, calls):
+        results = [None] * len(calls)
+        todo = Queue.Queue()
+        for item in enumerate(calls):
+            todo.put(item)
+
+        def worker():
+            while True:
+                try:
+                    i, args = todo.get_nowait()
+                except Queue.Empty:
+                    return
+                try:
+                    results[i] = fn(*args)
+                except GerritError as e:
+                    results[i] = e
+
+        threads = [threading.Thread(target=worker)
+                   for i in range(min(self.concurrency, len(calls)))]
+        for t in threads:
+            t.daemon = True
+            t.start()
+        for t in threads:
+            t.join()
+        return results
+
+
+_CLIENT = None
+
+
+def client():
+    """Return the GerritClient shared by all gerrit calls."""
+    global _CLIENT
+    if _CLIENT is None:
+        _CLIENT = GerritClient()
+    return _CLIENT
+
+
+def configure_client(**kwargs):
+    """Replace the shared GerritClient, see GerritClient for options."""
+    global _CLIENT
+    _CLIENT = GerritClient(**kwargs)
+    return _CLIENT
+
+
+def default_index_path():
+    return os.path.join(cache.cache_dir(), 'gerrit-bugs.sqlite')
+
+
+def bugs_from_message(message):
+    return BUG_FOOTER_RE.findall(message)
+
+
+def scan_changes(query, page_size=PAGE_SIZE, options=QUERY_OPTIONS):
+    """Yield every change matching query, fetching a page at a time."""
+    start = 0
+    while True:
+        changes = client().get("/changes/", {
+            'q': query, 'n': page_size, 'S': start, 'o': list(options)})
+        for change in changes:
+            yield change
+        if not changes or not changes[-1].get('_more_changes'):
+            return
+        start += len(changes)
+
+
+class ReviewIndex(object):
+    """Persistent bug -> open review index for gerrit projects."""
+    def __init__(self, path=None):
+        self.path = path or default_index_path()
+        self._db = sqlite3.connect(self.path, timeout=cache.LOCK_TIMEOUT)
+        self._db.execute("CREATE TABLE IF NOT EXISTS changes ("
+                         "number INTEGER PRIMARY KEY, project TEXT, "
+                         "branch TEXT, updated TEXT)")
+        self._db.execute("CREATE TABLE IF NOT EXISTS bug_changes ("
+                         "bug TEXT, number INTEGER)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS bug_changes_number "
+                         "ON bug_changes (number)")
+        self._db.execute("CREATE TABLE IF NOT EXISTS scans ("
+                         "project TEXT PRIMARY KEY, started REAL)")
+        self._db.commit()
+
+    def last_scan(self, project):
+        row = self._db.execute("SELECT started FROM scans WHERE project = ?",
+                               (project,)).fetchone()
+        return row[0] if row else None
+
+    def remove(self, number):
+        self._db.execute("DELETE FROM changes WHERE number = ?", (number,))
+        self._db.execute("DELETE FROM bug_changes WHERE number = ?",
+                         (number,))
+
+    def update(self, project, change):
+        """Record (or forget) a change, depending on its state."""
+        number = change['_number']
+        self.remove(number)
+        if change.get('status', 'NEW') != 'NEW':
+            return
+        revision = change["revisions"].values()[0]
+        bugs = bugs_from_message(revision["commit"]["message"])
+        if not bugs:
+            return
+        self._db.execute("INSERT INTO changes VALUES (?, ?, ?, ?)",
+                         (number, project, change['branch'],
+                          change.get('updated')))
+        self._db.executemany("INSERT INTO bug_changes VALUES (?, ?)",
+                             [(bug, number) for bug in set(bugs)])
+
+    def refresh(self, project, full=False, max_age=FULL_REFRESH):
+        """Bring the index up to date for project, return changes seen.
+
+        Incremental refreshes ask for changes in any state updated since
+        the last scan, so merged and abandoned ones drop out. Every
+        max_age a full scan of open changes is done instead, to catch
+        changes that lost their bug footer.
+        """
+        started = time.time()
+        last = self.last_scan(project)
+        if full or last is None or started - last > max_age:
+            full = True
+            query = 'status:open project:%s message:"bug:"' % project
+        else:
+            query = 'project:%s message:"bug:" -age:%ds' % (
+                project, int(started - last + SLACK))
+        seen = set()
+        for change in scan_changes(query):
+            self.update(project, change)
+            seen.add(change['_number'])
+        if full:
+            stale = [row[0] for row in self._db.execute(
+                "SELECT number FROM changes WHERE project = ?", (project,))
+                if row[0] not in seen]
+            for number in stale:
+                self.remove(number)
+        self._db.execute("INSERT OR REPLACE INTO scans VALUES (?, ?)",
+                         (project, started))
+        self._db.commit()
+        return len(seen)
+
+    def bugs(self, project):
+        """Return {bug: [(branch, review), ...]} of open reviews."""
+        mapping = {}
+        for bug, branch, number in self._db.execute(
+                "SELECT bug_changes.bug, changes.branch, changes.number "
+                "FROM bug_changes JOIN changes "
+                "ON changes.number = bug_changes.number "
+                "WHERE changes.project = ? ORDER BY changes.number",
+                (project,)):
+            mapping.setdefault(str(bug), []).append((branch, number))
+        return mapping
+
+
+def find_reviews_for_bugs(project, index=None, full=False):
+    """Return a {bug: [(branch, review), ...]} mapping of open reviews.
+
+    project is the gerrit project name (e.g. openstack/nova), and bug
+    numbers are found in the commit message footers of its open
+    reviews.
+    """
+    if index is None:
+        index = ReviewIndex()
+    index.refresh(project, full=full)
+    return index.bugs(project)
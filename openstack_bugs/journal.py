@@ -0,0 +1,103 @@
+"""Checkpoints for long scans, so a run that dies can be resumed.
+
+A run is identified by the tool, the project and the options that
+decide what it does. The journal records every bug the run finished
+with, along with the changes it made to it, and a later run with the
+same key and resume=True skips those bugs without loading them again.
+
+Finished bugs are written out in batches, so keeping the journal
+costs next to nothing. A crash can lose the last batch, which just
+means those bugs get looked at again; the rules don't change a bug
+that is already the way they want it.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import time
+
+from openstack_bugs import cache
+
+
+BATCH_SIZE = 50
+# flush at least this often, in seconds, however slowly bugs go by
+FLUSH_INTERVAL = 30
+
+
+def default_journal_path():
+    return os.path.join(cache.cache_dir(), 'journal.sqlite')
+
+
+def run_key(tool, project, options):
+    blob = json.dumps([tool, project, options], sort_keys=True)
+    return hashlib.sha1(blob).hexdigest()
+
+
+class Journal(object):
+    def __init__(self, tool, project, options=None, resume=False,
+                 path=None, batch_size=BATCH_SIZE):
+        self.path = path or default_journal_path()
+        self.key = run_key(tool, project, options or {})
+        self.batch_size = batch_size
+        self._pending = []
+        self._flushed = time.time()
+        self._db = sqlite3.connect(self.path, timeout=cache.LOCK_TIMEOUT)
+        self._db.execute("CREATE TABLE IF NOT EXISTS runs ("
+                         "key TEXT PRIMARY KEY, tool TEXT, project TEXT, "
+                         "options TEXT, started REAL, finished REAL)")
+        self._db.execute("CREATE TABLE IF NOT EXISTS done ("
+                         "key TEXT, bug_id TEXT, actions TEXT, "
+                         "PRIMARY KEY (key, bug_id))")
+        row = self._db.execute("SELECT finished FROM runs WHERE key = ?",
+                               (self.key,)).fetchone()
+        # only an unfinished run can be resumed
+        self.resumed = bool(resume and row and row[0] is None)
+        if self.resumed:
+            self.done = set(r[0] for r in self._db.execute(
+                "SELECT bug_id FROM done WHERE key = ?", (self.key,)))
+        else:
+            self.done = set()
+            self._db.execute("DELETE FROM done WHERE key = ?", (self.key,))
+            self._db.execute("INSERT OR REPLACE INTO runs "
+                             "VALUES (?, ?, ?, ?, ?, NULL)",
+                             (self.key, tool, project,
+                              json.dumps(options, sort_keys=True),
+                              time.time()))
+        self._db.commit()
+
+    def is_done(self, bug_id):
+        return str(bug_id) in self.done
+
+    def record(self, bug_id, changes=None):
+        """Note that we are finished with a bug, and what we did to it."""
+        bug_id = str(bug_id)
+        self.done.add(bug_id)
+        actions = changes.mutations if changes else []
+        self._pending.append((self.key, bug_id, json.dumps(actions)))
+        if (len(self._pending) >= self.batch_size or
+                time.time() - self._flushed > FLUSH_INTERVAL):
+            self.flush()
+
+    def flush(self):
+        if self._pending:
+            self._db.executemany("INSERT OR REPLACE INTO done "
+                                 "VALUES (?, ?, ?)", self._pending)
+            self._db.commit()
+            self._pending = []
+        self._flushed = time.time()
+
+    def finish(self):
+        """Mark the run complete, the next one starts from scratch."""
+        self.flush()
+        self._db.execute("UPDATE runs SET finished = ? WHERE key = ?",
+                         (time.time(), self.key))
+        self._db.commit()
+
+    def actions(self, bug_id):
+        """The changes recorded for a bug in this run, or None."""
+        self.flush()
+        row = self._db.execute("SELECT actions FROM done "
+                               "WHERE key = ? AND bug_id = ?",
+                               (self.key, str(bug_id))).fetchone()
+        return json.loads(row[0]) if row else None
@@ -0,0 +1,155 @@
+"""#hashtag triage macros.
+
+Triaging in bulk means saying the same few things over and over: this
+needs logs, this needs a version, this needs confirming on master.
+Rather than making every one of those changes by hand, a triager can
+leave a comment with a hashtag, like #needs-logs, and the
+triage-macros rule (see rules.TriageMacros) makes the changes and
+posts the explanation for them.
+
+MACROS is the table of what each hashtag does, any of:
+
+  remove_tags  regex of tags to remove (LPBug.remove_tags_by_regex)
+  add_tags     tags to add
+  status       status to set
+  comment      comment to post, formatted with the project as
+               %(project)s, only if the macro changed anything
+
+Hashtags are found with a single pass over the text of each comment,
+looking each one up in the table, so it costs the same however many
+macros there are. Only comments that haven't been scanned before are
+fetched and scanned at all, the macro index keeps track of how many
+each bug has had.
+
+Only macros from the project's triagers are acted on (see triagers()),
+anyone can comment on a bug. Nor are comments older than the macro
+index, so the first run doesn't act on every hashtag ever left on the
+open bugs.
+"""
+
+import re
+
+from openstack_bugs import cache
+from openstack_bugs import messages
+from openstack_bugs import store
+from openstack_bugs import throttle
+
+
+MACROS = {
+    'needs-logs': {
+        'add_tags': ('needs.logs',),
+        'status': 'Incomplete',
+        'comment': messages.NEEDS_LOGS,
+    },
+    'needs-version': {
+        'add_tags': ('needs.openstack-version',),
+        'status': 'Incomplete',
+        'comment': messages.NEEDS_VERSION,
+    },
+    'needs-reproduce': {
+        'add_tags': ('needs.reproduce',),
+        'status': 'Incomplete',
+        'comment': messages.NEEDS_REPRODUCE,
+    },
+    'confirm-master': {
+        'add_tags': ('needs.confirm-master',),
+        'comment': messages.CONFIRM_MASTER,
+    },
+    'confirmed': {
+        'remove_tags': r'^needs\.',
+        'status': 'Confirmed',
+    },
+}
+
+# a '#' that doesn't follow a word, an html entity or a url, then the
+# characters launchpad allows in a tag
+RE_HASHTAG = re.compile(r'(?<![\w&/])#([a-z0-9][a-z0-9+.-]*)')
+
+# MessageIndex keeps scans with a different pattern apart, this one
+# isn't a regex, it never changes so a new table doesn't rescan
+# comments that have already been acted on
+INDEX_PATTERN = 'macros'
+
+
+def hashtags(text, table=MACROS):
+    """The names of the macros used in text, in order."""
+    found = []
+    for tag in RE_HASHTAG.findall(text.lower()):
+        # a hashtag can end a sentence
+        tag = tag.rstrip('.')
+        if tag in table:
+            found.append(tag)
+    return found
+
+
+def macro_index(path=None):
+    """The index of comments already scanned for macros.
+
+    This has to be kept between runs, otherwise every run would act
+    on the same comments again, so it is in the cache directory
+    unless a path is given.
+    """
+    return cache.MessageIndex(path or cache.default_macro_index_path(),
+                              INDEX_PATTERN)
+
+
+def triagers(lp, project):
+    """The links of the people whose macros are acted on for project.
+
+    That is the project's bug supervisor, and everyone in it if it is
+    a team, as it usually is (e.g. ~nova-bugs).
+    """
+    supervisor = throttle.call(lambda: lp.projects[project].bug_supervisor,
+                               session=lp)
+    if supervisor is None:
+        return frozenset()
+    links = set([supervisor.self_link])
+    if supervisor.is_team:
+        links.update(person.self_link for person in
+                     throttle.pages(supervisor.participants, session=lp))
+    return frozenset(links)
+
+
+def scan(bug, index, trusted, table=MACROS):
+    """Return (messages scanned, [macro names], [ignored]) for an LPBug.
+
+    The macros are the ones used in the messages the index hasn't
+    seen yet by the people in trusted (see triagers()), the ones used
+    by anyone else are ignored. On a bug the index has never seen,
+    messages from before the index was made don't count at all.
+    Nothing is stored, index.set the count once acted on.
+    """
+    scanned = index.get(bug.bug.id)[0]
+    count, new = bug.messages_after(scanned)
+    index.tally(len(new), scanned)
+    found = []
+    ignored = []
+    for message in new:
+        used = hashtags(message.content, table)
+        if not used:
+            continue
+        if (not scanned and message.date_created.strftime(
+                store.DATE_FORMAT) < index.created):
+            continue
+        if message.owner_link in trusted:
+            found.extend(used)
+        else:
+            ignored.extend(used)
+    return count, found, ignored
+
+
+def expand(bug, name, project, table=MACROS):
+    """Make the changes macro name stands for, return if there were any."""
+    macro = table[name]
+    tags = bug.tags
+    if macro.get('remove_tags'):
+        bug.remove_tags_by_regex(macro['remove_tags'])
+    for tag in macro.get('add_tags', ()):
+        bug.add_tag(tag)
+    changed = bug.tags != tags
+    if macro.get('status') and bug.status != macro['status']:
+        bug.status = macro['status']
+        changed = True
+    if changed and macro.get('comment'):
+        bug.add_comment(macro['comment'] % {'project': project})
+    return changed
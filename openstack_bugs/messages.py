@@ -27,3 +27,28 @@ INACTIVE_BUG = (
     "is a fast moving project and we'd like to get the tracker down to "
     "currently actionable bugs, this is getting marked as Invalid. If the "
     "issue still exists, please feel free to reopen it.")
+
+# triage macros, see openstack_bugs/macros.py. These are formatted with
+# the project name as %(project)s.
+
+NEEDS_LOGS = (
+    "Marking this Incomplete as we need logs to go further. Please "
+    "attach the logs of the services involved (at debug level if you "
+    "can) from around the time of the failure, then set the bug back to "
+    "New.")
+
+NEEDS_VERSION = (
+    "Marking this Incomplete as we need to know what version of "
+    "%(project)s this happened on. Please update the bug description to "
+    "include '%(project)s version: ...', then set the bug back to New.")
+
+NEEDS_REPRODUCE = (
+    "Marking this Incomplete as we have not been able to reproduce it. "
+    "Please add the exact steps that lead to the problem, including "
+    "the commands run and the configuration used, then set the bug back "
+    "to New.")
+
+CONFIRM_MASTER = (
+    "This needs confirming on the current development branch before it "
+    "can be worked on. If you are able to reproduce it on master, "
+    "please say so in a comment, with the steps you took.")
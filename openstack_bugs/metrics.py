@@ -0,0 +1,217 @@
+"""Where the time goes: counts, bytes and latency of API round trips.
+
+Every launchpad and gerrit round trip goes through timed() or
+observe(), which record it in REGISTRY under its call type (e.g.
+lp.messages, gerrit.get) and the rule that was running at the time
+(see rule()), if any. Launchpad calls are timed by throttle.call, one
+sample per attempt, so waiting for a slot or backing off isn't counted.
+Bytes are the size of what came back where we know it: the raw
+response for gerrit, the message text for launchpad messages.
+
+report_at_exit() writes it all out when the run is over, as JSON, or
+in the Prometheus text format if the file name ends in .prom.
+"""
+
+import atexit
+import collections
+import contextlib
+import json
+import threading
+import time
+
+
+# latency histogram bucket upper bounds, in seconds
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0,
+           10.0, 30.0)
+NO_RULE = 'none'
+PREFIX = 'openstack_bugs'
+
+
+class _Series(object):
+    """Everything recorded for one (call, rule)."""
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.bytes = 0
+        self.seconds = 0.0
+        self.buckets = [0] * (len(BUCKETS) + 1)
+
+    def observe(self, seconds, nbytes, error):
+        self.count += 1
+        self.errors += int(error)
+        self.bytes += nbytes
+        self.seconds += seconds
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                self.buckets[i] += 1
+                break
+        else:
+            self.buckets[-1] += 1
+
+    def merge(self, data):
+        """Add in a series given as by as_dict()."""
+        self.count += data['count']
+        self.errors += data['errors']
+        self.bytes += data['bytes']
+        self.seconds += data['seconds']
+        for i, bound in enumerate([str(b) for b in BUCKETS] + ['+Inf']):
+            self.buckets[i] += data['buckets'].get(bound, 0)
+
+    def as_dict(self):
+        return {
+            'count': self.count,
+            'errors': self.errors,
+            'bytes': self.bytes,
+            'seconds': round(self.seconds, 6),
+            'buckets': dict(zip([str(b) for b in BUCKETS] + ['+Inf'],
+                                self.buckets)),
+        }
+
+
+class Metrics(object):
+    def __init__(self):
+        self.started = time.time()
+        self.series = collections.defaultdict(_Series)
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    @property
+    def current_rule(self):
+        return getattr(self._local, 'rule', None) or NO_RULE
+
+    @contextlib.contextmanager
+    def rule(self, name):
+        """Attribute calls made in this thread to rule name."""
+        previous = getattr(self._local, 'rule', None)
+        self._local.rule = name
+        try:
+            yield
+        finally:
+            self._local.rule = previous
+
+    @contextlib.contextmanager
+    def timed(self, call):
+        """Time a round trip.
+
+        Set .bytes on what this yields if the size is known, and .error
+        if the call failed without raising.
+        """
+        sample = _Sample()
+        start = time.time()
+        error = True
+        try:
+            yield sample
+            error = sample.error
+        finally:
+            self.observe(call, time.time() - start, sample.bytes, error)
+
+    def observe(self, call, seconds, nbytes=0, error=False):
+        with self._lock:
+            self.series[(call, self.current_rule)].observe(
+                seconds, nbytes, error)
+
+    def merge(self, data):
+        """Add in the metrics of another process, as given by as_dict()."""
+        with self._lock:
+            for call, rules in data['calls'].items():
+                for rule, series in rules.items():
+                    self.series[(call, rule)].merge(series)
+
+    def as_dict(self):
+        with self._lock:
+            calls = {}
+            for (call, rule), series in sorted(self.series.items()):
+                calls.setdefault(call, {})[rule] = series.as_dict()
+        return {'started': self.started,
+                'elapsed': round(time.time() - self.started, 6),
+                'buckets': list(BUCKETS),
+                'calls': calls}
+
+    def prometheus(self):
+        """The metrics in the Prometheus text exposition format."""
+        lines = [
+            "# HELP %s_run_seconds Wall time of the run." % PREFIX,
+            "# TYPE %s_run_seconds gauge" % PREFIX,
+            "%s_run_seconds %f" % (PREFIX, time.time() - self.started),
+        ]
+        with self._lock:
+            series = sorted(self.series.items())
+        for name, kind, what, value in (
+                ('calls_total', 'counter', 'API round trips.',
+                 lambda s: s.count),
+                ('errors_total', 'counter', 'API round trips that failed.',
+                 lambda s: s.errors),
+                ('bytes_total', 'counter', 'Payload bytes received.',
+                 lambda s: s.bytes)):
+            lines.append("# HELP %s_api_%s %s" % (PREFIX, name, what))
+            lines.append("# TYPE %s_api_%s %s" % (PREFIX, name, kind))
+            for (call, rule), s in series:
+                lines.append('%s_api_%s{call="%s",rule="%s"} %d' % (
+                    PREFIX, name, call, rule, value(s)))
+        name = "%s_api_latency_seconds" % PREFIX
+        lines.append("# HELP %s API round trip latency." % name)
+        lines.append("# TYPE %s histogram" % name)
+        for (call, rule), s in series:
+            labels = 'call="%s",rule="%s"' % (call, rule)
+            total = 0
+            for bound, count in zip(BUCKETS, s.buckets):
+                total += count
+                lines.append('%s_bucket{%s,le="%s"} %d' % (
+                    name, labels, bound, total))
+            lines.append('%s_bucket{%s,le="+Inf"} %d' % (
+                name, labels, s.count))
+            lines.append('%s_sum{%s} %f' % (name, labels, s.seconds))
+            lines.append('%s_count{%s} %d' % (name, labels, s.count))
+        return "\n".join(lines) + "\n"
+
+    def write(self, path):
+        with open(path, 'w') as f:
+            if path.endswith('.prom'):
+                f.write(self.prometheus())
+            else:
+                json.dump(self.as_dict(), f, indent=2, sort_keys=True)
+                f.write("\n")
+
+
+class _Sample(object):
+    def __init__(self):
+        self.bytes = 0
+        self.error = False
+
+
+REGISTRY = Metrics()
+
+
+def timed(call):
+    return REGISTRY.timed(call)
+
+
+def observe(call, seconds, nbytes=0, error=False):
+    REGISTRY.observe(call, seconds, nbytes, error)
+
+
+def rule(name):
+    return REGISTRY.rule(name)
+
+
+_REPORTS = []
+_AT_EXIT = False
+
+
+def report_at_exit(path):
+    """Write the metrics to path when the process exits."""
+    global _AT_EXIT
+    if not _AT_EXIT:
+        atexit.register(write_reports)
+        _AT_EXIT = True
+    _REPORTS.append(path)
+
+
+def write_reports():
+    """Write the metrics out to the report_at_exit paths now.
+
+    The worker runs many scripts in one process, so it does this at
+    the end of each instead of waiting for the process to exit.
+    """
+    while _REPORTS:
+        REGISTRY.write(_REPORTS.pop(0))
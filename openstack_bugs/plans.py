@@ -0,0 +1,307 @@
+"""Triage plans: what a run would change, written down to apply later.
+
+A plan is a file of JSON lines, one action per line:
+
+  bug        the bug id
+  bug_link   the API link of the bug
+  task_link  the API link of the project's task on the bug
+  action     set_status, set_assignee, add_tag, remove_tag or add_comment
+  value      the new status, assignee link, tag or comment
+  expect     for set_status and set_assignee, the value when planned
+  rule       the rule that wanted the change
+  reason     the comment the rule left to explain itself, if any
+
+Actions for the same bug are applied together, in order, with one
+lp_save for the bug and one for the task. Actions already in effect are
+skipped, and if a bug changed in a way that contradicts the plan since
+it was made (a status or assignee isn't what was expected), none of
+its actions are applied.
+"""
+
+import collections
+import json
+import Queue
+import threading
+import time
+
+import openstack_bugs
+from openstack_bugs import store
+from openstack_bugs import throttle
+
+
+ACTIONS = ('set_status', 'set_assignee', 'add_tag', 'remove_tag',
+           'add_comment')
+
+
+def plan_actions(bug, changes):
+    """The actions for a bug's Changes, made with dryrun.
+
+    bug is the BugRecord run_rules keeps for it.
+    """
+    reasons = {}
+    for (field, value), rule in zip(changes.mutations, changes.rules):
+        if field == 'comment':
+            reasons.setdefault(rule, value)
+    current = {'status': bug.status, 'assignee': bug.assignee}
+    tags = list(bug.tags)
+    actions = []
+    for (field, value), rule in zip(changes.mutations, changes.rules):
+        base = {'bug': bug.id, 'bug_link': bug.bug_link,
+                'task_link': bug.task_link, 'rule': rule,
+                'reason': reasons.get(rule)}
+        if field in ('status', 'assignee'):
+            value = store._link(value)
+            if value != current[field]:
+                actions.append(dict(base, action='set_%s' % field,
+                                    value=value, expect=current[field]))
+                current[field] = value
+        elif field == 'tags':
+            for tag in value:
+                if tag not in tags:
+                    actions.append(dict(base, action='add_tag', value=tag))
+            for tag in tags:
+                if tag not in value:
+                    actions.append(dict(base, action='remove_tag',
+                                        value=tag))
+            tags = list(value)
+        elif field == 'comment':
+            actions.append(dict(base, action='add_comment', value=value))
+    return actions
+
+
+def write_actions(actions, path):
+    """Write a list of actions to path as a plan, return how many."""
+    count = 0
+    with open(path, 'w') as f:
+        for action in actions:
+            f.write(json.dumps(action, sort_keys=True) + "\n")
+            count += 1
+    return count
+
+
+class PlanWriter(object):
+    """A plan for run_rules that is written out, instead of kept.
+
+    The actions for each bug are written to path as soon as the rules
+    are done with it, so a long dryrun doesn't hold on to the plan.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.bugs = 0
+        self.actions = 0
+        self._file = open(path, 'w')
+
+    def append(self, item):
+        bug, changes = item
+        for action in plan_actions(bug, changes):
+            self._file.write(json.dumps(action, sort_keys=True) + "\n")
+            self.actions += 1
+        self.bugs += 1
+
+    def __len__(self):
+        return self.bugs
+
+    def __iter__(self):
+        return iter(())
+
+    def close(self):
+        self._file.close()
+
+
+class Tally(PlanWriter):
+    """A plan for run_rules that only counts the bugs in it."""
+    def __init__(self):
+        self.bugs = 0
+
+    def append(self, item):
+        self.bugs += 1
+
+    def close(self):
+        pass
+
+
+def sink(path=None, keep=False):
+    """Where run_rules should put the plan.
+
+    Written out to path if there is one, otherwise kept in a list if
+    keep (to print it at the end), otherwise just counted.
+    """
+    if path:
+        return PlanWriter(path)
+    if keep:
+        return []
+    return Tally()
+
+
+def read_plan(path):
+    actions = []
+    with open(path) as f:
+        for n, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            action = json.loads(line)
+            if action.get('action') not in ACTIONS:
+                raise ValueError("%s:%d: unknown action %r" %
+                                 (path, n, action.get('action')))
+            actions.append(action)
+    return actions
+
+
+class RateLimiter(object):
+    """Space calls out to at most rate a second, across threads."""
+    def __init__(self, rate=None):
+        self.interval = 1.0 / rate if rate else 0
+        self._next = 0
+        self._lock = threading.Lock()
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.time()
+            at = max(now, self._next)
+            self._next = at + self.interval
+        if at > now:
+            time.sleep(at - now)
+
+
+def _check(actions, task, bug, session=None):
+    """Work out what to do about each action, against the live bug.
+
+    Returns a list of results (applied, done or stale) and the new
+    task fields, tags and comments to write.
+    """
+    fields = {}
+    tags = list(bug.tags)
+    messages = None
+    comments = []
+    results = []
+    for action in actions:
+        kind, value = action['action'], action['value']
+        result = 'applied'
+        if kind in ('set_status', 'set_assignee'):
+            field = kind[4:]
+            # the link, not the person, which would be another request
+            live = task.status if field == 'status' else task.assignee_link
+            current = fields.get(field, live)
+            if current == value:
+                result = 'done'
+            elif current != action['expect']:
+                result = 'stale'
+            else:
+                fields[field] = value
+        elif kind == 'add_tag':
+            if value in tags:
+                result = 'done'
+            else:
+                tags.append(value)
+        elif kind == 'remove_tag':
+            if value not in tags:
+                result = 'done'
+            else:
+                tags.remove(value)
+        elif kind == 'add_comment':
+            if messages is None:
+                messages = throttle.call(
+                    lambda: [m.content for m in bug.messages],
+                    session=session, metric='lp.messages',
+                    measure=lambda contents: sum(map(len, contents)))
+            if value in messages or value in comments:
+                result = 'done'
+            else:
+                comments.append(value)
+        results.append(result)
+    if tags == list(bug.tags):
+        tags = None
+    return results, fields, tags, comments
+
+
+def apply_bug(lp, actions, limiter=None, dryrun=False):
+    """Apply the actions for a single bug, return a result per action."""
+    limiter = limiter or RateLimiter()
+    bug = throttle.call(lp.load, actions[0]['bug_link'], session=lp,
+                        metric='lp.load')
+    task = throttle.call(lp.load, actions[0]['task_link'], session=lp,
+                         metric='lp.load')
+    results, fields, tags, comments = _check(actions, task, bug, lp)
+    if 'stale' in results:
+        return ['stale'] * len(actions)
+    if dryrun:
+        return results
+    if tags is not None:
+        bug.tags = tags
+        limiter.wait()
+        throttle.call(bug.lp_save, session=lp, metric='lp.lp_save')
+    if fields:
+        for name, value in fields.items():
+            setattr(task, name, value)
+        limiter.wait()
+        throttle.call(task.lp_save, session=lp, metric='lp.lp_save')
+    for comment in comments:
+        limiter.wait()
+        throttle.call(bug.newMessage, content=comment, idempotent=False,
+                      session=lp, metric='lp.newMessage')
+    return results
+
+
+def _apply_worker(queue, lp, limiter, dryrun, counters, lock, share):
+    # unless it's the only one, a session of our own made in this thread
+    session, login_error = lp, None
+    if not share:
+        try:
+            session = openstack_bugs.new_session(lp)
+        except Exception as e:
+            login_error = e
+    while True:
+        item = queue.get()
+        if item is None:
+            return
+        bug_id, actions = item
+        error = None
+        try:
+            if login_error is not None:
+                raise login_error
+            results = apply_bug(session, actions, limiter, dryrun)
+        except Exception as e:
+            error = e
+            results = ['failed'] * len(actions)
+        summary = collections.Counter(results)
+        with lock:
+            if error is not None:
+                print "ERROR: couldn't apply plan for bug %s: %s" % (bug_id,
+                                                                     error)
+            print "Bug %s: %s" % (bug_id, ", ".join(
+                "%s %d" % (k, v) for k, v in sorted(summary.items())))
+            counters.update(summary)
+
+
+def apply_plan(lp, actions, workers=4, rate=None, dryrun=False):
+    """Apply a plan, workers bugs at a time, at most rate writes a second.
+
+    Returns a Counter of action results: applied, done (already in
+    effect), stale (the bug changed since the plan was made) and
+    failed. With dryrun nothing is written. With more than one worker
+    each has a launchpad session of its own (see
+    openstack_bugs.new_session).
+    """
+    bugs = collections.OrderedDict()
+    for action in actions:
+        bugs.setdefault(action['bug'], []).append(action)
+    limiter = RateLimiter(rate)
+    counters = collections.Counter()
+    lock = threading.Lock()
+    queue = Queue.Queue()
+    for item in bugs.items():
+        queue.put(item)
+    workers = max(1, workers)
+    threads = [threading.Thread(target=_apply_worker,
+                                args=(queue, lp, limiter, dryrun, counters,
+                                      lock, workers == 1))
+               for i in range(workers)]
+    for t in threads:
+        queue.put(None)
+        t.daemon = True
+        t.start()
+    for t in threads:
+        t.join()
+    return counters
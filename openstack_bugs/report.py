@@ -0,0 +1,157 @@
+"""A quick look at a project's backlog, straight out of the bug store.
+
+Picking thresholds like close-old-bugs.py's --no-activity or
+tag-needs-info.py's --age is easier with some numbers in front of you.
+Backlog reads the few fields that needs for every bug of a project
+out of the store's indexes, into a column (an array) per field, with
+no launchpad calls at all. A column is sorted once, by status and then
+value, after which counting the bugs of some statuses between two
+values is a few bisects, so histograms and trying out many thresholds
+cost next to nothing.
+"""
+
+import array
+import bisect
+import datetime
+import itertools
+
+from openstack_bugs import rules
+from openstack_bugs import store
+
+
+# bucket edges, in days, for the age and last updated histograms
+DAY_EDGES = (7, 30, 90, 180, 365, 730, 1460)
+# more days than any bug will be old
+SPAN = 1 << 20
+
+VERSION_PREFIX = 'openstack-version.'
+VERSION_TAGS = ('needs.openstack-version',)
+TAG_PREFIXES = (VERSION_PREFIX, 'opsys-type.')
+
+IMPORTANCES = ('Critical', 'High', 'Medium', 'Low', 'Wishlist',
+               'Undecided', 'Unknown')
+
+
+class Backlog(object):
+    """The bugs of a project in the store, as columns.
+
+    Row i of every column is the same bug: its id, the status and
+    importance of the project's task (as indexes into statuses and
+    importances, which end with "Other" for anything unexpected), its
+    age and days since last updated (as LPBug.age and last_updated
+    count them), and whether it has a needs.openstack-version or
+    openstack-version.* tag. tags has the number of bugs with each of
+    the TAG_PREFIXES tags.
+    """
+    def __init__(self, project, today=None):
+        self.project = project
+        self.today = today or datetime.date.today()
+        self.statuses = store.ALL_TASK_STATUS + ("Other",)
+        self.importances = IMPORTANCES + ("Other",)
+        self.ids = array.array('l')
+        self.status = array.array('B')
+        self.importance = array.array('B')
+        self.age = array.array('l')
+        self.idle = array.array('l')
+        self.versioned = array.array('B')
+        self.tags = {}
+        self._indexes = {}
+
+    def __len__(self):
+        return len(self.ids)
+
+    @classmethod
+    def load(cls, bugs, project, today=None):
+        """Read project's bugs out of a BugStore."""
+        backlog = cls(project, today)
+        rows = bugs.task_rows(project, backlog.today, backlog.statuses[:-1],
+                              backlog.importances[:-1])
+        ids, status, importance, age, idle = zip(*rows) or ((),) * 5
+        backlog.ids.extend(ids)
+        backlog.status.extend(status)
+        backlog.importance.extend(importance)
+        backlog.age.extend(age)
+        backlog.idle.extend(idle)
+        versioned = bugs.tagged(VERSION_TAGS, (VERSION_PREFIX,))
+        backlog.versioned.extend(i in versioned for i in ids)
+        backlog.tags = bugs.tag_counts(project, TAG_PREFIXES)
+        return backlog
+
+    def _index(self, name):
+        """The values of a column, sorted by status and version tag.
+
+        Each bug is a single number, (status * 2 + versioned) * SPAN +
+        value, so the bugs of a status, with or without a version tag,
+        are a run of the sorted list with their values in order, and
+        how many of them are between two values is two bisects.
+        """
+        if name not in self._indexes:
+            self._indexes[name] = sorted(
+                (s * 2 + v) * SPAN + x for s, v, x in
+                zip(self.status, self.versioned, getattr(self, name)))
+        return self._indexes[name]
+
+    def count(self, name, low=0, high=SPAN, statuses=None, versioned=None):
+        """How many bugs have low <= name < high.
+
+        Only counting bugs in statuses (names, or any), and with or
+        without a version tag if versioned is True or False.
+        """
+        index = self._index(name)
+        codes = [i for i, s in enumerate(self.statuses)
+                 if statuses is None or s in statuses]
+        flags = (0, 1) if versioned is None else (int(bool(versioned)),)
+        total = 0
+        for base in [(c * 2 + f) * SPAN for c in codes for f in flags]:
+            total += (bisect.bisect_left(index, base + min(high, SPAN)) -
+                      bisect.bisect_left(index, base + low))
+        return total
+
+    def histogram(self, name, edges=DAY_EDGES, statuses=None):
+        """Return [(label, count)] of a column, bucketed by edges."""
+        counts = []
+        low = 0
+        for edge in edges:
+            counts.append(("%d-%d" % (low, edge - 1),
+                           self.count(name, low, edge, statuses)))
+            low = edge
+        counts.append(("%d+" % low, self.count(name, low, SPAN, statuses)))
+        return counts
+
+    def status_importance(self):
+        """Return {(status, importance): count}."""
+        width = len(self.importances)
+        keys = sorted(s * width + i
+                      for s, i in zip(self.status, self.importance))
+        return dict(((self.statuses[k // width], self.importances[k % width]),
+                     len(list(group)))
+                    for k, group in itertools.groupby(keys))
+
+    def tag_counts(self, prefix):
+        """Return [(tag, count)] of the tags starting with prefix."""
+        return sorted(((t, n) for t, n in self.tags.items()
+                       if t.startswith(prefix)),
+                      key=lambda tn: (-tn[1], tn[0]))
+
+    def close_old(self, thresholds):
+        """Return [(days, count)] close-old-bugs would close per days.
+
+        That is the open bugs not updated for more than days.
+        """
+        return [(days, self.count('idle', days + 1,
+                                  statuses=rules.CloseOldBugs.statuses))
+                for days in thresholds]
+
+    def needs_info(self, ages):
+        """Return [(age, count)] tag-needs-info could mark Incomplete.
+
+        This can only be an upper bound: the bugs no older than age,
+        in its statuses but not already Incomplete, that have no
+        openstack version tag. Whether a version can be found in the
+        description is left for the rule to find out.
+        """
+        statuses = [s for s in rules.TagNeedsInfo.statuses
+                    if s != "Incomplete"]
+        return [(days, self.count('age', 0, days + 1, statuses,
+                                  versioned=False))
+                for days in ages]
@@ -0,0 +1,465 @@
+"""Triage rules, and a runner that applies many of them in one scan.
+
+Each of the maintenance scripts is a Rule: which bug statuses it cares
+about, and what to do with a bug. run_rules() does a single
+searchTasks for the union of what all the enabled rules need, loads
+every bug once, and hands it to each rule in turn. All the changes the
+rules make to a bug are flushed together through LPBug.batch().
+
+Rules can narrow the search with search_filters(), and say with
+exhausted() when, given the sort order, no later bug can concern them;
+once that is true for every rule the scan stops.
+"""
+
+import collections
+import datetime
+
+import openstack_bugs
+from openstack_bugs import gerrit
+from openstack_bugs import macros
+from openstack_bugs import metrics
+from openstack_bugs import store
+from openstack_bugs import throttle
+from openstack_bugs.messages import DISCOVERED_STACK_VERS
+from openstack_bugs.messages import INACTIVE_BUG
+from openstack_bugs.messages import NO_REVIEWS
+from openstack_bugs.messages import NO_STACK_VERS_FOUND
+
+
+def bug_id_from_link(link):
+    return link.rstrip('/').split('/bugs/')[1].split('/')[0]
+
+
+class Rule(object):
+    """One piece of triage logic, run against one bug at a time.
+
+    statuses and importances are what the rule wants searchTasks to
+    return (None meaning any importance), order_by how it would like
+    them sorted. counters are for the summary at the end of the run.
+    """
+    name = None
+    statuses = ()
+    importances = None
+    order_by = 'date_last_updated'
+    # rules that look at reviews get them resolved in batches
+    needs_reviews = False
+    # the kinds of bug events (see openstack_bugs.events) that should
+    # rerun this rule, None meaning any of them.
+    triggers = None
+
+    def __init__(self, project, verbose=False):
+        self.project = project
+        self.verbose = verbose
+        self.counters = collections.Counter()
+
+    def prepare(self, lp):
+        """Any one off work needed before the scan starts."""
+        pass
+
+    def extra_links(self, seen):
+        """Bug links the rule wants that the search didn't return."""
+        return []
+
+    def search_filters(self):
+        """More searchTasks arguments, ruling out bugs run won't change.
+
+        These are only used if every rule in the scan asks for the
+        same value, anything else would hide bugs from the others.
+        """
+        return {}
+
+    def exhausted(self, bug):
+        """Whether no bug after this one, in order_by order, applies."""
+        return False
+
+    def applies(self, bug):
+        if bug.task is None or bug.status not in self.statuses:
+            return False
+        if self.importances is not None:
+            return bug.task.importance in self.importances
+        return True
+
+    def run(self, bug):
+        raise NotImplementedError()
+
+    def saved(self, bug):
+        """Called once the changes run made to bug are in launchpad.
+
+        Not called with dryrun, or if saving them failed.
+        """
+        pass
+
+    def summary(self):
+        return "%s: %s" % (self.name, ", ".join(
+            "%s %s" % (k, v) for k, v in sorted(self.counters.items())))
+
+
+class CloseOldBugs(Rule):
+    name = 'close-old-bugs'
+    statuses = ('New', 'Confirmed', 'Triaged', 'In Progress', 'Incomplete')
+    # a bug that just changed isn't old
+    triggers = ()
+
+    def __init__(self, project, no_activity=180, **kwargs):
+        super(CloseOldBugs, self).__init__(project, **kwargs)
+        self.no_activity = no_activity
+
+    def search_filters(self):
+        # a bug can't have been idle for longer than it has existed
+        cutoff = (datetime.datetime.utcnow() -
+                  datetime.timedelta(days=self.no_activity))
+        return {'created_before': store._date_str(cutoff) + "+00:00"}
+
+    def exhausted(self, bug):
+        # oldest updates come first, once one is recent they all are
+        return bug.last_updated <= self.no_activity
+
+    def run(self, bug):
+        if bug.last_updated > self.no_activity:
+            print(bug)
+            print("WOULD CLOSE: Last Updated: %s" % bug.last_updated)
+            self.counters['closed'] += 1
+            bug.add_comment(INACTIVE_BUG % (self.no_activity, self.project))
+            bug.status = "Invalid"
+
+
+class TagNeedsInfo(Rule):
+    name = 'tag-needs-info'
+    statuses = ('New', 'In Progress', 'Incomplete', 'Confirmed', 'Triaged')
+    triggers = ('created', 'description', 'tags')
+
+    def __init__(self, project, age=0, **kwargs):
+        super(TagNeedsInfo, self).__init__(project, **kwargs)
+        self.age = age
+
+    def run(self, bug):
+        print(bug)
+        version = openstack_bugs.discover_stack_version(
+            self.project, bug.description)
+        opsys = openstack_bugs.discover_os_version(bug.description)
+        if self.verbose:
+            print(bug.description)
+
+        tags = bug.tags
+        if opsys is not None:
+            new_tag = "opsys-type.%s" % opsys
+            print("Found operating system: %s" % new_tag)
+
+        if version is not None:
+            new_tag = "openstack-version.%s" % version
+            print("Found tags: %s" % tags)
+            self.counters['tagged'] += 1
+            if new_tag not in tags:
+                print("Adding %s to tags" % new_tag)
+                bug.add_tag(new_tag)
+                bug.add_comment(DISCOVERED_STACK_VERS
+                                % (version, self.project))
+        if version is None and self.age and bug.age <= self.age:
+            if (bug.status != "Incomplete" and
+                    "needs.openstack-version" not in bug.tags):
+                self.counters['incomplete'] += 1
+                print("Marking bug incomplete - no openstack version "
+                      "specified")
+                if bug.add_tag("needs.openstack-version"):
+                    bug.status = "Incomplete"
+                    bug.add_comment(NO_STACK_VERS_FOUND % (self.project))
+        if self.verbose:
+            # make it easier to sort out bugs
+            print("\n\n")
+
+
+class FixInProgress(Rule):
+    name = 'fix-in-progress'
+    statuses = ('In Progress',)
+    importances = openstack_bugs.ALL_STATUS
+    needs_reviews = True
+    triggers = ('status', 'assignee', 'comment')
+
+    def run(self, bug):
+        reviews = openstack_bugs.open_reviews(bug.reviews)
+        print(bug)
+        if len(reviews) > 0:
+            print("... found open reviews")
+        else:
+            print("... no open reviews, should change status")
+            self.counters['fixed'] += 1
+            last_status = bug.last_status
+            bug.status = last_status
+            bug.add_comment(NO_REVIEWS)
+            bug.assignee = None
+            print("... changed to %s" % last_status)
+
+
+class UnassignNonInProgress(Rule):
+    name = 'unassign-non-in-progress'
+    statuses = ('New', 'Incomplete', 'Confirmed', 'Triaged')
+    order_by = '-date_last_updated'
+    needs_reviews = True
+    triggers = ('status', 'assignee', 'comment')
+
+    def run(self, bug):
+        print(bug)
+        reviews = openstack_bugs.open_reviews(bug.reviews)
+        if reviews and bug.assignee:
+            self.counters['in progress'] += 1
+            bug.status = "In Progress"
+            print("... this bug is marked in progress")
+        elif reviews:
+            self.counters['in progress'] += 1
+            bug.revert_to_last_assignee()
+            bug.status = "In Progress"
+            print("... open reviews, reverting to last assignment")
+        elif bug.assignee:
+            self.counters['fixed'] += 1
+            bug.assignee = None
+            bug.add_comment(NO_REVIEWS)
+            print("... bug is assigned but should not be!")
+
+
+class FindReviews(Rule):
+    """Set bugs with open reviews in gerrit to In Progress.
+
+    This is driven from gerrit rather than the launchpad search, so
+    bugs the search didn't return are asked for with extra_links.
+    """
+    name = 'find-reviews'
+    # driven by gerrit, not bug events
+    triggers = ()
+
+    def __init__(self, project, full_scan=False, **kwargs):
+        super(FindReviews, self).__init__(project, **kwargs)
+        self.full_scan = full_scan
+        self.reviews = {}
+
+    def prepare(self, lp):
+        self.reviews = gerrit.find_reviews_for_bugs(
+            "openstack/%s" % self.project, full=self.full_scan)
+
+    def extra_links(self, seen):
+        return ["https://api.launchpad.net/1.0/bugs/%s" % bug_id
+                for bug_id in sorted(self.reviews) if bug_id not in seen]
+
+    def applies(self, bug):
+        if str(bug.bug.id) not in self.reviews:
+            return False
+        if bug.task is None:
+            print("Not a %s Bug!" % self.project)
+            return False
+        return bug.status not in ("In Progress", "Fix Released")
+
+    def run(self, bug):
+        reviews = self.reviews[str(bug.bug.id)]
+        print "Bug: %s " % bug
+        print "   Reviews: %s" % reviews
+        rev_msg = ""
+        for rev in reviews:
+            rev_msg += ("review: https://review.openstack.org/%s "
+                        "in branch: %s\n" % (rev[1], rev[0]))
+        msg = ("Found open reviews for this bug in gerrit, setting "
+               "to In Progress. \n\n" + rev_msg)
+        print msg
+        self.counters['in progress'] += 1
+        bug.status = "In Progress"
+        bug.revert_to_last_assignee()
+        bug.add_comment(msg)
+
+
+class TriageMacros(Rule):
+    """Act on the #hashtag macros left in new comments, see macros.py."""
+    name = 'triage-macros'
+    statuses = ('New', 'Incomplete', 'Confirmed', 'Triaged', 'In Progress')
+    triggers = ('comment',)
+
+    def __init__(self, project, table=macros.MACROS, index=None, **kwargs):
+        super(TriageMacros, self).__init__(project, **kwargs)
+        self.table = table
+        self.index = index if index is not None else macros.macro_index()
+        # nobody, until prepare asks launchpad
+        self.triagers = frozenset()
+        # what run found on the bug it was last given
+        self._pending = None
+
+    def prepare(self, lp):
+        self.triagers = macros.triagers(lp, self.project)
+        if not self.triagers:
+            print("%s has no bug supervisor, no macros will be acted on" %
+                  self.project)
+
+    def run(self, bug):
+        count, used, ignored = macros.scan(bug, self.index, self.triagers,
+                                           self.table)
+        self._pending = (bug.bug.id, count, used)
+        if not used and not ignored:
+            return
+        print(bug)
+        for name in ignored:
+            print("... #%s, not from a triager, ignored" % name)
+            self.counters['ignored'] += 1
+        for name in used:
+            if macros.expand(bug, name, self.project, self.table):
+                print("... #%s" % name)
+                self.counters[name] += 1
+            else:
+                print("... #%s, nothing to change" % name)
+
+    def saved(self, bug):
+        # only now have the comments scanned been acted on
+        bug_id, count, used = self._pending
+        if bug_id != bug.bug.id:
+            return
+        scanned, before = self.index.get(bug_id)
+        if count != scanned:
+            self.index.set(bug_id, count, before | set(used))
+
+    def summary(self):
+        return "%s; comments scanned %d, skipped %d" % (
+            super(TriageMacros, self).summary(), self.index.scanned,
+            self.index.skipped)
+
+
+# the order rules are applied to a bug in, macros last so that what a
+# person asked for wins
+RULES = (FindReviews, FixInProgress, UnassignNonInProgress, TagNeedsInfo,
+         CloseOldBugs, TriageMacros)
+
+
+def search_args(rules):
+    """The searchTasks arguments covering everything rules need."""
+    statuses = []
+    importances = []
+    for rule in rules:
+        statuses.extend(s for s in rule.statuses if s not in statuses)
+        if importances is not None:
+            if rule.importances is None:
+                importances = None
+            else:
+                importances.extend(i for i in rule.importances
+                                   if i not in importances)
+    kwargs = {'status': statuses, 'order_by': rules[0].order_by}
+    if importances:
+        kwargs['importance'] = importances
+    filters = rules[0].search_filters()
+    for rule in rules[1:]:
+        other = rule.search_filters()
+        filters = dict((k, v) for k, v in filters.items()
+                       if other.get(k) == v)
+    kwargs.update(filters)
+    return kwargs
+
+
+def _tasks(lp, project, rules, search, journal=None):
+    """All the tasks (or bug links) the rules want to look at."""
+    seen = set()
+    kwargs = search_args(rules)
+    if kwargs['status']:
+        tasks = throttle.call(lp.projects[project].searchTasks,
+                              search_text=search, session=lp, **kwargs)
+        for task in throttle.pages(tasks, session=lp):
+            bug_id = bug_id_from_link(task.bug_link)
+            seen.add(bug_id)
+            if journal is None or not journal.is_done(bug_id):
+                yield task
+    for rule in rules:
+        for link in rule.extra_links(seen):
+            bug_id = bug_id_from_link(link)
+            seen.add(bug_id)
+            if journal is None or not journal.is_done(bug_id):
+                yield link
+
+
+def prepare_rules(lp, rules):
+    """Prepare rules, return the ones that could be.
+
+    Errors are reported, rather than stopping the rules that don't
+    depend on what failed.
+    """
+    prepared = []
+    for rule in rules:
+        try:
+            rule.prepare(lp)
+        except Exception as e:
+            print "ERROR: couldn't prepare %s, skipping it: %s" % (
+                rule.name, e)
+        else:
+            prepared.append(rule)
+    return prepared
+
+
+def run_rules(lp, project, rules, search=None, workers=1, dryrun=False,
+              journal=None, plan=None):
+    """Apply rules to every bug any of them is interested in.
+
+    Returns the number of bugs looked at, and the plan: a list of
+    (BugRecord, Changes) for every bug that was (or with dryrun, would
+    have been) changed. Pass plan (see plans.sink) to have them go
+    somewhere other than a new list. With a journal, bugs it says are
+    done are skipped, every bug dealt with is recorded in it, and it is
+    marked finished at the end. A rule that fails to prepare is
+    reported and left out of the scan, the rest still run.
+    """
+    rules = prepare_rules(lp, rules)
+    if plan is None:
+        plan = []
+    if not rules:
+        return 0, plan
+    # the scan can stop once every rule is past what it could act on
+    order_by = search_args(rules)['order_by']
+    stoppable = all(rule.order_by == order_by for rule in rules)
+    # the search is paged in this thread, the only one using lp, as
+    # the hydrate workers load bugs ahead in sessions of their own
+    tasks = _tasks(lp, project, rules, search, journal)
+    bugs = openstack_bugs.hydrate_bugs(tasks, lp, project, workers=workers)
+    if any(rule.needs_reviews for rule in rules):
+        bugs = openstack_bugs.prefetch_reviews(bugs)
+
+    count = 0
+    try:
+        for bug in bugs:
+            if stoppable and all(rule.exhausted(bug) for rule in rules):
+                break
+            count += 1
+            changes = apply_rules(bug, rules, dryrun=dryrun)
+            if journal is not None and changes is not None:
+                journal.record(bug.bug.id, changes)
+            if changes:
+                # don't keep the launchpad objects alive to the end
+                plan.append((openstack_bugs.BugRecord.from_bug(bug),
+                             changes))
+    finally:
+        if journal is not None:
+            # if the scan dies, what it already did still needs to be on
+            # record for --resume to skip
+            journal.flush()
+    if journal is not None:
+        journal.finish()
+    return count, plan
+
+
+def apply_rules(bug, rules, dryrun=False):
+    """Run every applicable rule on a bug, saving the changes together.
+
+    Returns the Changes made (or that would be made with dryrun), or
+    None if something went wrong.
+    """
+    ran = []
+    try:
+        with bug.batch(dryrun=dryrun) as changes:
+            for rule in rules:
+                changes.rule = rule.name
+                with metrics.rule(rule.name):
+                    if rule.applies(bug):
+                        rule.run(bug)
+                        ran.append(rule)
+        if not dryrun:
+            for rule in ran:
+                rule.saved(bug)
+        return changes
+    except Exception as e:
+        print "Exception: %s" % e
+
+
+def print_plan(plan):
+    for bug, changes in plan:
+        print(bug)
+        for line in str(changes).splitlines():
+            print("    %s" % line)
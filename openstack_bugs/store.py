@@ -0,0 +1,473 @@
+"""A local snapshot of launchpad bugs, kept up to date incrementally.
+
+The store is synced from launchpad with searchTasks(modified_since=...)
+from a high water mark kept per project, so after the first full pull
+only the bugs that changed since the last sync are fetched.
+
+A BugStore quacks enough like a Launchpad object (projects[...],
+searchTasks, load) that LPBug and the scripts can read from it instead
+of the live API. Writes (lp_save, newMessage) are passed through to
+launchpad when the store was given a live Launchpad object, and refused
+otherwise.
+"""
+
+import datetime
+import itertools
+import os
+import sqlite3
+
+import openstack_bugs
+from openstack_bugs import cache
+from openstack_bugs import throttle
+from openstack_bugs import timeline
+
+
+ALL_TASK_STATUS = ("New",
+                   "Incomplete",
+                   "Opinion",
+                   "Invalid",
+                   "Won't Fix",
+                   "Expired",
+                   "Confirmed",
+                   "Triaged",
+                   "In Progress",
+                   "Fix Committed",
+                   "Fix Released")
+
+BUG_URL = "https://api.launchpad.net/1.0/bugs/%s"
+DATE_FORMAT = "%Y-%m-%dT%H:%M:%S"
+
+SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS meta ("
+    "key TEXT PRIMARY KEY, value TEXT)",
+    "CREATE TABLE IF NOT EXISTS bugs ("
+    "id INTEGER PRIMARY KEY, title TEXT, description TEXT, "
+    "date_created TEXT, date_last_updated TEXT, web_link TEXT)",
+    "CREATE TABLE IF NOT EXISTS tasks ("
+    "bug_id INTEGER, target TEXT, status TEXT, importance TEXT, "
+    "assignee TEXT, is_complete INTEGER, web_link TEXT, self_link TEXT, "
+    "PRIMARY KEY (bug_id, target))",
+    "CREATE TABLE IF NOT EXISTS tags ("
+    "bug_id INTEGER, tag TEXT)",
+    "CREATE TABLE IF NOT EXISTS messages ("
+    "bug_id INTEGER, idx INTEGER, content TEXT, date_created TEXT, "
+    "owner TEXT)",
+    "CREATE TABLE IF NOT EXISTS activity ("
+    "bug_id INTEGER, idx INTEGER, whatchanged TEXT, oldvalue TEXT, "
+    "newvalue TEXT, datechanged TEXT)",
+    "CREATE TABLE IF NOT EXISTS transitions ("
+    "bug_id INTEGER, idx INTEGER, target TEXT, field TEXT, oldvalue TEXT, "
+    "newvalue TEXT, datechanged TEXT)",
+    # bugs that failed to load during a sync, fetched first next time
+    "CREATE TABLE IF NOT EXISTS retry ("
+    "project TEXT, link TEXT, PRIMARY KEY (project, link))",
+    "CREATE INDEX IF NOT EXISTS tags_bug ON tags (bug_id)",
+    "CREATE INDEX IF NOT EXISTS messages_bug ON messages (bug_id)",
+    "CREATE INDEX IF NOT EXISTS activity_bug ON activity (bug_id)",
+    "CREATE INDEX IF NOT EXISTS transitions_bug ON transitions (bug_id)",
+    "CREATE INDEX IF NOT EXISTS tasks_target ON tasks (target, status)",
+    # covers everything a report needs from tasks
+    "CREATE INDEX IF NOT EXISTS tasks_report ON tasks "
+    "(target, bug_id, status, importance)",
+)
+
+
+class SnapshotError(Exception):
+    pass
+
+
+def default_store_path():
+    return os.path.join(cache.cache_dir(), 'bugs.sqlite')
+
+
+def _date_str(value):
+    if value is None:
+        return None
+    return value.strftime(DATE_FORMAT)
+
+
+def _date(value):
+    if value is None:
+        return None
+    return datetime.datetime.strptime(value[:19], DATE_FORMAT)
+
+
+def _link(entry):
+    """The self_link of a launchpadlib entry, or None."""
+    if entry is None:
+        return None
+    return getattr(entry, 'self_link', entry)
+
+
+def _bug_link(task):
+    if type(task) in (str, unicode):
+        return task
+    return task.bug_link
+
+
+def _skip_links(tasks, links):
+    """The tasks whose bugs aren't in links."""
+    for task in tasks:
+        if task.bug_link not in links:
+            yield task
+
+
+def fetch_bug(task, lp, project=None):
+    """Pull everything the store keeps about a bug into a plain dict.
+
+    This has the same signature as LPBug so that it can be used as the
+    factory for hydrate_bugs, and does all of its API calls in the
+    worker thread.
+    """
+    bug = throttle.call(lp.load, _bug_link(task), session=lp)
+    messages = throttle.call(lambda: [(m.content, _date_str(m.date_created),
+                                       m.owner_link)
+                                      for m in bug.messages], session=lp)
+    activity = throttle.call(lambda: [
+        (a.whatchanged, a.oldvalue, a.newvalue, _date_str(a.datechanged))
+        for a in bug.activity], session=lp)
+    tasks = throttle.call(lambda: [
+        (t.bug_target_name, t.status, t.importance, t.assignee_link,
+         int(bool(t.is_complete)), t.web_link, t.self_link)
+        for t in bug.bug_tasks], session=lp)
+    return {
+        'id': bug.id,
+        'title': bug.title,
+        'description': bug.description,
+        'date_created': _date_str(bug.date_created),
+        'date_last_updated': _date_str(bug.date_last_updated),
+        'web_link': bug.web_link,
+        'tags': list(bug.tags),
+        'messages': messages,
+        'activity': activity,
+        'tasks': tasks,
+    }
+
+
+class _Snapshot(object):
+    """Stand in for a launchpadlib entry read from the store.
+
+    Attribute writes are remembered, and lp_save() replays them on the
+    live entry, if we have a live Launchpad to talk to.
+    """
+    def __init__(self, lp, self_link, **fields):
+        self.__dict__['_lp'] = lp
+        self.__dict__['_changes'] = {}
+        self.__dict__['self_link'] = self_link
+        self.__dict__.update(fields)
+
+    def __setattr__(self, name, value):
+        self.__dict__[name] = value
+        self._changes[name] = value
+
+    def _live(self):
+        if self._lp is None:
+            raise SnapshotError("%s is a read only snapshot" %
+                                self.self_link)
+        return self._lp.load(self.self_link)
+
+    def lp_save(self):
+        live = self._live()
+        for name, value in self._changes.items():
+            setattr(live, name, value)
+        live.lp_save()
+        self._changes.clear()
+
+
+class SnapshotBug(_Snapshot):
+    def newMessage(self, **kwargs):
+        return self._live().newMessage(**kwargs)
+
+
+class SnapshotTask(_Snapshot):
+    pass
+
+
+class SnapshotEntry(object):
+    """A message or activity record, these are never written."""
+    def __init__(self, **fields):
+        self.__dict__.update(fields)
+
+
+class _StoreProject(object):
+    def __init__(self, store, name):
+        self._store = store
+        self.name = name
+
+    def searchTasks(self, **kwargs):
+        return self._store.search_tasks(self.name, **kwargs)
+
+    def getSeries(self, name):
+        return _StoreProject(self._store, "%s/%s" % (self.name, name))
+
+    @property
+    def bug_supervisor(self):
+        # who triages the project isn't kept, only launchpad knows
+        if self._store.lp is None:
+            raise SnapshotError("no live launchpad to ask who supervises "
+                                "%s bugs" % self.name)
+        return self._store.lp.projects[self.name].bug_supervisor
+
+
+class _StoreProjects(object):
+    def __init__(self, store):
+        self._store = store
+
+    def __getitem__(self, name):
+        return _StoreProject(self._store, name)
+
+
+class BugStore(object):
+    def __init__(self, path=None, lp=None):
+        self.path = path or default_store_path()
+        self.lp = lp
+        self.projects = _StoreProjects(self)
+        self._db = sqlite3.connect(self.path, timeout=cache.LOCK_TIMEOUT)
+        self._db.text_factory = unicode
+        backfill = not self._db.execute(
+            "SELECT 1 FROM sqlite_master WHERE name = 'transitions'"
+        ).fetchone()
+        for statement in SCHEMA:
+            self._db.execute(statement)
+        if 'owner' not in [row[1] for row in self._db.execute(
+                "PRAGMA table_info(messages)")]:
+            # stores made before we kept who wrote each message, the
+            # owners show up as bugs change and get fetched again
+            self._db.execute("ALTER TABLE messages ADD COLUMN owner TEXT")
+        if backfill:
+            # stores made before we kept timelines
+            self._save_transitions(self._db.execute(
+                "SELECT bug_id, idx, whatchanged, oldvalue, newvalue, "
+                "datechanged FROM activity").fetchall())
+        self._db.commit()
+
+    def new_session(self):
+        """Another BugStore on the same file, for another thread.
+
+        With its own sqlite connection, and its own session of the live
+        launchpad, if there is one (see openstack_bugs.new_session).
+        """
+        return BugStore(self.path, self.lp and openstack_bugs.new_session(
+            self.lp))
+
+    # sync
+
+    def high_water(self, project):
+        row = self._db.execute("SELECT value FROM meta WHERE key = ?",
+                               ("sync:%s" % project,)).fetchone()
+        return row[0] if row else None
+
+    def set_high_water(self, project, value):
+        self._db.execute("INSERT OR REPLACE INTO meta VALUES (?, ?)",
+                         ("sync:%s" % project, value))
+        self._db.commit()
+
+    def retries(self, project):
+        """The links of bugs the last sync of project couldn't load."""
+        return [row[0] for row in self._db.execute(
+            "SELECT link FROM retry WHERE project = ? ORDER BY link",
+            (project,))]
+
+    def set_retries(self, project, links):
+        self._db.execute("DELETE FROM retry WHERE project = ?", (project,))
+        self._db.executemany("INSERT OR IGNORE INTO retry VALUES (?, ?)",
+                             [(project, link) for link in links])
+        self._db.commit()
+
+    def save(self, record):
+        """Replace everything we know about a bug with record."""
+        bug_id = record['id']
+        db = self._db
+        for table in ('tasks', 'tags', 'messages', 'activity',
+                      'transitions'):
+            db.execute("DELETE FROM %s WHERE bug_id = ?" % table, (bug_id,))
+        db.execute("INSERT OR REPLACE INTO bugs VALUES (?, ?, ?, ?, ?, ?)",
+                   (bug_id, record['title'], record['description'],
+                    record['date_created'], record['date_last_updated'],
+                    record['web_link']))
+        db.executemany("INSERT INTO tasks VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                       [(bug_id,) + t for t in record['tasks']])
+        db.executemany("INSERT INTO tags VALUES (?, ?)",
+                       [(bug_id, t) for t in record['tags']])
+        # records made before we kept the owner don't have one
+        db.executemany("INSERT INTO messages VALUES (?, ?, ?, ?, ?)",
+                       [(bug_id, i, m[0], m[1], m[2] if len(m) > 2 else None)
+                        for i, m in enumerate(record['messages'])])
+        db.executemany("INSERT INTO activity VALUES (?, ?, ?, ?, ?, ?)",
+                       [(bug_id, i) + a
+                        for i, a in enumerate(record['activity'])])
+        self._save_transitions((bug_id, i) + tuple(a)
+                               for i, a in enumerate(record['activity']))
+
+    def _save_transitions(self, activity):
+        """Keep the timeline of (bug_id, idx, ...activity) rows."""
+        rows = []
+        for row in activity:
+            t = timeline.transition(*row[2:])
+            if t is not None:
+                rows.append(row[:2] + t)
+        self._db.executemany("INSERT INTO transitions "
+                             "VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+
+    def sync(self, project, statuses=ALL_TASK_STATUS, workers=1,
+             full=False):
+        """Bring the store up to date for project, return bugs fetched.
+
+        The high water mark is taken before the search starts, so that
+        anything that changes while we are syncing is picked up again
+        next time. Bugs that fail to load would be missed all the same,
+        until they next changed, so they are kept (see retries) and
+        fetched first by the next sync.
+        """
+        since = None if full else self.high_water(project)
+        started = datetime.datetime.utcnow().strftime(DATE_FORMAT)
+        kwargs = dict(status=statuses, order_by='date_last_updated')
+        if since:
+            kwargs['modified_since'] = since + "+00:00"
+        retries = self.retries(project)
+        tasks = throttle.call(self.lp.projects[project].searchTasks,
+                              **kwargs)
+        failed = []
+        count = 0
+        for record in openstack_bugs.hydrate_bugs(
+                itertools.chain(retries, _skip_links(throttle.pages(tasks),
+                                                     set(retries))),
+                self.lp, project, workers=workers, factory=fetch_bug,
+                failed=failed):
+            self.save(record)
+            count += 1
+            if count % 100 == 0:
+                self._db.commit()
+        self._db.commit()
+        self.set_retries(project, [_bug_link(task) for task in failed])
+        self.set_high_water(project, started)
+        return count
+
+    # reads
+
+    def load(self, link):
+        """Return a SnapshotBug for a bug (or task) link."""
+        bug_id = int(link.rstrip('/').split('/bugs/')[1].split('/')[0])
+        return self.bug(bug_id)
+
+    def bug(self, bug_id):
+        db = self._db
+        row = db.execute("SELECT title, description, date_created, "
+                         "date_last_updated, web_link FROM bugs "
+                         "WHERE id = ?", (bug_id,)).fetchone()
+        if row is None:
+            raise KeyError("bug %s is not in the store" % bug_id)
+        link = BUG_URL % bug_id
+        tasks = [SnapshotTask(self.lp, t[6], bug_link=link,
+                              bug_target_name=t[0], status=t[1],
+                              importance=t[2], assignee=t[3],
+                              assignee_link=t[3],
+                              is_complete=bool(t[4]), web_link=t[5])
+                 for t in db.execute(
+                     "SELECT target, status, importance, assignee, "
+                     "is_complete, web_link, self_link FROM tasks "
+                     "WHERE bug_id = ?", (bug_id,))]
+        tags = [t[0] for t in db.execute(
+            "SELECT tag FROM tags WHERE bug_id = ?", (bug_id,))]
+        messages = [SnapshotEntry(content=m[0], date_created=_date(m[1]),
+                                  owner_link=m[2])
+                    for m in db.execute(
+                        "SELECT content, date_created, owner FROM messages "
+                        "WHERE bug_id = ? ORDER BY idx", (bug_id,))]
+        activity = [SnapshotEntry(whatchanged=a[0], oldvalue=a[1],
+                                  newvalue=a[2], datechanged=_date(a[3]))
+                    for a in db.execute(
+                        "SELECT whatchanged, oldvalue, newvalue, "
+                        "datechanged FROM activity "
+                        "WHERE bug_id = ? ORDER BY idx", (bug_id,))]
+        history = timeline.Timeline(db.execute(
+            "SELECT target, field, oldvalue, newvalue, datechanged "
+            "FROM transitions WHERE bug_id = ? ORDER BY idx", (bug_id,)))
+        return SnapshotBug(self.lp, link, id=bug_id, title=row[0],
+                           description=row[1],
+                           date_created=_date(row[2]),
+                           date_last_updated=_date(row[3]),
+                           web_link=row[4], tags=tags, messages=messages,
+                           activity=activity, timeline=history,
+                           bug_tasks=tasks)
+
+    def search_tasks(self, project, status=None, importance=None,
+                     search_text=None, modified_since=None,
+                     created_before=None, order_by=None, **kwargs):
+        """The subset of searchTasks the tools use, against the store."""
+        query = ("SELECT tasks.bug_id, tasks.self_link FROM tasks "
+                 "JOIN bugs ON bugs.id = tasks.bug_id "
+                 "WHERE tasks.target = ?")
+        params = [project]
+        for column, values in (('tasks.status', status),
+                               ('tasks.importance', importance)):
+            if values is None:
+                continue
+            if type(values) in (str, unicode):
+                values = [values]
+            query += " AND %s IN (%s)" % (column,
+                                          ", ".join("?" for v in values))
+            params.extend(values)
+        if search_text:
+            query += " AND (bugs.title LIKE ? OR bugs.description LIKE ?)"
+            params.extend(["%%%s%%" % search_text] * 2)
+        if modified_since:
+            if hasattr(modified_since, 'strftime'):
+                modified_since = _date_str(modified_since)
+            query += " AND bugs.date_last_updated >= ?"
+            params.append(modified_since[:19])
+        if created_before:
+            if hasattr(created_before, 'strftime'):
+                created_before = _date_str(created_before)
+            query += " AND bugs.date_created < ?"
+            params.append(created_before[:19])
+        if order_by == 'date_last_updated':
+            query += " ORDER BY bugs.date_last_updated"
+        elif order_by == '-date_last_updated':
+            query += " ORDER BY bugs.date_last_updated DESC"
+        return [SnapshotEntry(bug_link=BUG_URL % row[0], self_link=row[1])
+                for row in self._db.execute(query, params).fetchall()]
+
+    def task_rows(self, project, today, statuses, importances):
+        """Yield (bug_id, status, importance, age, idle) for project.
+
+        status and importance are indexes into statuses and importances
+        (their length if they are neither), age and idle the days from
+        the bug being created and last updated to today (a date), as
+        LPBug.age and last_updated count them.
+        """
+        def code(column, names):
+            return "CASE %s %s ELSE %d END" % (
+                column, " ".join("WHEN ? THEN %d" % i
+                                 for i in range(len(names))), len(names))
+
+        today = today.strftime("%Y-%m-%d")
+        return self._db.execute(
+            "SELECT tasks.bug_id, %s, %s, "
+            "max(0, CAST(julianday(?) - "
+            "julianday(substr(bugs.date_created, 1, 10)) AS INTEGER)), "
+            "max(0, CAST(julianday(?) - "
+            "julianday(substr(bugs.date_last_updated, 1, 10)) AS INTEGER)) "
+            "FROM tasks JOIN bugs ON bugs.id = tasks.bug_id "
+            "WHERE tasks.target = ?" % (code('tasks.status', statuses),
+                                        code('tasks.importance', importances)),
+            list(statuses) + list(importances) + [today, today, project])
+
+    def tag_counts(self, project, prefixes):
+        """Return {tag: bugs} for project's tags starting with prefixes."""
+        return dict(self._db.execute(
+            "SELECT tag, COUNT(*) FROM tags WHERE (%s) AND EXISTS ("
+            "SELECT 1 FROM tasks WHERE tasks.bug_id = tags.bug_id "
+            "AND tasks.target = ?) GROUP BY tag"
+            % " OR ".join("tag LIKE ?" for p in prefixes),
+            ["%s%%" % p for p in prefixes] + [project]))
+
+    def tagged(self, tags=(), prefixes=()):
+        """The ids of bugs with any of tags, or a tag with prefixes."""
+        where = ["tag = ?" for t in tags] + ["tag LIKE ?" for p in prefixes]
+        return set(row[0] for row in self._db.execute(
+            "SELECT bug_id FROM tags WHERE %s" % " OR ".join(where),
+            list(tags) + ["%s%%" % p for p in prefixes]))
+
+    def close(self):
+        self._db.close()
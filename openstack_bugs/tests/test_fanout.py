@@ -0,0 +1,24 @@
+"""Running a tool over several projects, a process each."""
+
+import unittest
+
+from openstack_bugs import fanout
+
+
+def _scan(project):
+    if project == 'broken':
+        raise RuntimeError("no such project")
+    return {'found': len(project), 'projects': [project]}
+
+
+class RunProjectsTest(unittest.TestCase):
+    def test_a_failed_project_does_not_lose_the_others(self):
+        total = fanout.merge(fanout.run_projects(
+            _scan, ['nova', 'broken', 'glance'], processes=2))
+        self.assertEqual(10, total['found'])
+        self.assertEqual(['nova', 'glance'], total['projects'])
+        self.assertEqual(['broken'], total['failed'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,56 @@
+"""Recording the bugs a scan is done with, so it can be resumed."""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from openstack_bugs import fakes
+from openstack_bugs import journal
+from openstack_bugs import rules
+from openstack_bugs.tests.test_messages import _record
+
+
+class _Tag(rules.Rule):
+    name = 'tag'
+    statuses = ('New',)
+
+    def run(self, bug):
+        bug.add_tag('seen')
+
+
+class _FullPlan(list):
+    def append(self, item):
+        if self:
+            raise IOError("disk full")
+        super(_FullPlan, self).append(item)
+
+
+class RunRulesJournalTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'journal.sqlite')
+        self.lp = fakes.FakeLaunchpad([_record(1, ["one"]),
+                                       _record(2, ["two"]),
+                                       _record(3, ["three"])])
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def _journal(self, resume=False):
+        return journal.Journal('test', 'nova', resume=resume,
+                               path=self.path)
+
+    def test_a_failed_scan_keeps_what_it_did(self):
+        self.assertRaises(IOError, rules.run_rules, self.lp, 'nova',
+                          [_Tag('nova')], dryrun=True,
+                          journal=self._journal(), plan=_FullPlan())
+        resumed = self._journal(resume=True)
+        self.assertTrue(resumed.resumed)
+        self.assertEqual(2, len(resumed.done))
+        for bug_id in resumed.done:
+            self.assertEqual([['tags', ['seen']]], resumed.actions(bug_id))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,78 @@
+"""Fetching only the messages a bug has had since the last scan."""
+
+import unittest
+
+import openstack_bugs
+from openstack_bugs import fakes
+from openstack_bugs import store
+
+LINK = "https://review.openstack.org/%d"
+
+
+def _record(bug_id, comments):
+    when = "2016-01-01T00:00:00"
+    return {
+        'id': bug_id,
+        'title': "bug %d" % bug_id,
+        'description': comments[0],
+        'date_created': when,
+        'date_last_updated': when,
+        'web_link': "https://bugs.launchpad.net/nova/+bug/%d" % bug_id,
+        'tags': [],
+        'messages': [(c, when) for c in comments],
+        'activity': [],
+        'tasks': [("nova", "New", "Undecided", None, 0,
+                   "https://bugs.launchpad.net/nova/+bug/%d" % bug_id,
+                   "https://api.launchpad.net/1.0/nova/+bug/%d" % bug_id)],
+    }
+
+
+class MessagesAfterTest(unittest.TestCase):
+    def setUp(self):
+        self.lp = fakes.FakeLaunchpad([_record(1, [
+            "it broke", "Fix proposed: %s" % (LINK % 100),
+            "Fix proposed: %s" % (LINK % 101)])])
+        self.bug = self.lp.load(store.BUG_URL % 1)
+        self.index = openstack_bugs.configure_message_index()
+
+    def tearDown(self):
+        openstack_bugs.configure_message_index()
+
+    def test_open_slices_are_refused(self):
+        self.assertRaises(ValueError, lambda: self.bug.messages[1:])
+
+    def test_only_new_messages(self):
+        count, new = openstack_bugs.messages_after(self.bug, 2)
+        self.assertEqual(3, count)
+        self.assertEqual(["Fix proposed: %s" % (LINK % 101)],
+                         [m.content for m in new])
+
+    def test_reviews_after_an_earlier_scan(self):
+        self.index.set(1, 2, set(['100']))
+        self.assertEqual(set(['100', '101']),
+                         openstack_bugs.get_reviews_from_bug(self.bug))
+        self.assertEqual((3, set(['100', '101'])), self.index.get(1))
+
+    def test_nothing_new(self):
+        self.assertEqual((3, []),
+                         openstack_bugs.messages_after(self.bug, 3))
+
+
+class LPBugMessagesTest(unittest.TestCase):
+    def setUp(self):
+        self.lp = fakes.FakeLaunchpad([_record(1, [
+            "it broke", "Fix proposed: %s" % (LINK % 100)])])
+        openstack_bugs.configure_message_index()
+        openstack_bugs.LPBug.FETCHES.clear()
+
+    def test_first_scan_fetches_messages_once(self):
+        bug = openstack_bugs.LPBug(store.BUG_URL % 1, self.lp, 'nova')
+        self.assertEqual(set(['100']), bug.reviews)
+        self.assertEqual((2, bug.messages), bug.messages_after(0))
+        self.assertEqual("it broke", bug.description)
+        self.assertEqual(1, openstack_bugs.LPBug.FETCHES['messages'])
+        self.assertEqual(0, openstack_bugs.LPBug.FETCHES['new_messages'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,52 @@
+"""Looking up review status, and revalidating it once it expires."""
+
+import unittest
+
+import openstack_bugs
+from openstack_bugs import fakes
+from openstack_bugs import gerrit
+
+
+class ReviewStatusesTest(unittest.TestCase):
+    def setUp(self):
+        self.gerrit = fakes.FakeGerrit([
+            {'_number': 100, 'status': 'NEW', 'updated': '2016-01-01'},
+            {'_number': 101, 'status': 'NEW', 'updated': '2016-01-02'},
+        ]).start()
+        self.old_client = gerrit.client()
+        gerrit.configure_client(url=self.gerrit.url, retries=0)
+        # nothing is trusted, so every lookup after the first revalidates
+        self.cache = openstack_bugs.configure_review_cache(ttl=0)
+
+    def tearDown(self):
+        self.gerrit.stop()
+        gerrit._CLIENT = self.old_client
+        openstack_bugs.configure_review_cache()
+
+    def test_first_lookup_is_batched(self):
+        self.assertEqual({'100': 'NEW', '101': 'NEW', '102': None},
+                         openstack_bugs.get_review_statuses([100, 101, 102]))
+        self.assertEqual({'/changes/': 1}, self.gerrit.calls)
+
+    def test_unchanged_reviews_are_not_modified(self):
+        openstack_bugs.get_review_status(100)
+        self.gerrit.calls.clear()
+        self.assertEqual({'100': 'NEW'},
+                         openstack_bugs.get_review_statuses([100]))
+        self.assertEqual(1, self.gerrit.calls['not modified'])
+        self.assertEqual((1, 1), (self.cache.revalidated,
+                                  self.cache.not_modified))
+
+    def test_changed_reviews_are_fetched_again(self):
+        openstack_bugs.get_review_status(100)
+        self.gerrit.changes['100']['status'] = 'MERGED'
+        self.assertEqual({'100': 'MERGED'},
+                         openstack_bugs.get_review_statuses([100]))
+        self.assertEqual((1, 0), (self.cache.revalidated,
+                                  self.cache.not_modified))
+        # merged is for good, so there's nothing more to ask
+        self.assertEqual((True, 'MERGED'), self.cache.get('100'))
+
+
+if __name__ == '__main__':
+    unittest.main()
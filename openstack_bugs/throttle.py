@@ -0,0 +1,203 @@
+"""Keep launchpad as busy as it will tolerate, and no busier.
+
+All launchpad calls go through a shared Governor, which limits how many
+are in flight at once. The limit is adjusted AIMD style: it creeps up
+by about one for every limit's worth of calls that come back quickly,
+and is cut in half when a call is slow (over target seconds), times out
+or gets a 5xx. Reads that fail that way are retried a few times with
+jittered exponential backoff; writes that can't safely be repeated
+(newMessage) are not.
+
+With hydrate_bugs running more workers than launchpad can keep up
+with, this settles at the concurrency launchpad actually gives good
+service at, rather than piling on timeouts and skipped bugs.
+
+launchpadlib isn't thread safe, so every thread gets a session (a
+Launchpad object) of its own, see openstack_bugs.new_session. Objects
+keep using the session that loaded them though, and a bug loaded in a
+worker thread is saved from the main one, so calls name the session
+they use (call(..., session=lp)) and take turns on it.
+
+call(..., metric='lp.load') records each attempt in metrics, timing
+just the round trip, not the wait for a slot or the backoff.
+"""
+
+import collections
+import httplib
+import random
+import socket
+import threading
+import time
+import weakref
+
+from openstack_bugs import metrics
+
+
+OVERLOAD_STATUS = (429, 500, 502, 503, 504)
+# launchpad collections are fetched in pages of this many entries
+PAGE_SIZE = 75
+
+
+def is_overload(error):
+    """Whether an error means launchpad is struggling."""
+    if isinstance(error, (socket.error, httplib.HTTPException)):
+        return True
+    # lazr.restfulclient HTTPErrors carry the response
+    status = getattr(getattr(error, 'response', None), 'status', None)
+    return status in OVERLOAD_STATUS
+
+
+# {session: lock}, see session_lock
+_SESSION_LOCKS = weakref.WeakKeyDictionary()
+_SESSION_LOCKS_GUARD = threading.Lock()
+
+
+def session_lock(session):
+    """The lock to hold while using a launchpad session."""
+    with _SESSION_LOCKS_GUARD:
+        lock = _SESSION_LOCKS.get(session)
+        if lock is None:
+            lock = _SESSION_LOCKS[session] = threading.RLock()
+        return lock
+
+
+class _Unlocked(object):
+    def __enter__(self):
+        pass
+
+    def __exit__(self, *exc):
+        pass
+
+
+class Governor(object):
+    def __init__(self, limit=4, min_limit=1, max_limit=32, target=10.0,
+                 retries=3, backoff=1.0, max_backoff=60, cooldown=1.0):
+        self.limit = float(limit)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.target = target
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        # don't cut the limit again for every call that was already in
+        # flight when the trouble started
+        self.cooldown = cooldown
+        self.in_flight = 0
+        self.stats = collections.Counter()
+        self._decreased = 0
+        self._cond = threading.Condition()
+
+    def _acquire(self):
+        with self._cond:
+            while self.in_flight >= int(self.limit):
+                self._cond.wait()
+            self.in_flight += 1
+
+    def _release(self, healthy):
+        # healthy None leaves the limit alone
+        with self._cond:
+            self.in_flight -= 1
+            if healthy is None:
+                pass
+            elif healthy:
+                self.limit = min(self.max_limit,
+                                 self.limit + 1.0 / self.limit)
+            elif time.time() - self._decreased > self.cooldown:
+                self.limit = max(self.min_limit, self.limit / 2)
+                self._decreased = time.time()
+                self.stats['decreases'] += 1
+            self._cond.notify_all()
+
+    def call(self, fn, *args, **kwargs):
+        """Call fn(*args, **kwargs) when there is room, retrying reads.
+
+        Pass idempotent=False for calls that must not be repeated,
+        session=lp to use lp only while no other thread is, and metric
+        to record each attempt in metrics under that call type, with
+        measure(result) as the bytes if given.
+        """
+        idempotent = kwargs.pop('idempotent', True)
+        session = kwargs.pop('session', None)
+        metric = kwargs.pop('metric', None)
+        measure = kwargs.pop('measure', None)
+        lock = _Unlocked() if session is None else session_lock(session)
+        attempt = 0
+        while True:
+            # the session is taken before a slot, and let go of while
+            # backing off
+            with lock:
+                self._acquire()
+                self.stats['calls'] += 1
+                start = time.time()
+                try:
+                    result = fn(*args, **kwargs)
+                except Exception as e:
+                    if metric:
+                        metrics.observe(metric, time.time() - start,
+                                        error=True)
+                    overloaded = is_overload(e)
+                    # other errors say nothing about launchpad's load
+                    self._release(False if overloaded else None)
+                    if not overloaded:
+                        raise
+                    if not idempotent or attempt >= self.retries:
+                        self.stats['failures'] += 1
+                        raise
+                    self.stats['retries'] += 1
+                else:
+                    elapsed = time.time() - start
+                    if metric:
+                        metrics.observe(metric, elapsed,
+                                        measure(result) if measure else 0)
+                    slow = elapsed > self.target
+                    self.stats['slow'] += int(slow)
+                    self._release(not slow)
+                    return result
+            time.sleep(random.uniform(
+                0, min(self.max_backoff, self.backoff * 2 ** attempt)))
+            attempt += 1
+
+    def summary(self):
+        return ("Launchpad concurrency limit %.1f; %s" % (
+            self.limit, ", ".join("%s %d" % (k, v)
+                                  for k, v in sorted(self.stats.items()))))
+
+
+_GOVERNOR = None
+
+
+def governor():
+    """Return the Governor shared by all launchpad calls."""
+    global _GOVERNOR
+    if _GOVERNOR is None:
+        _GOVERNOR = Governor()
+    return _GOVERNOR
+
+
+def configure(**kwargs):
+    """Replace the shared Governor, see Governor for options."""
+    global _GOVERNOR
+    _GOVERNOR = Governor(**kwargs)
+    return _GOVERNOR
+
+
+def call(fn, *args, **kwargs):
+    return governor().call(fn, *args, **kwargs)
+
+
+def pages(collection, size=PAGE_SIZE, session=None):
+    """Iterate over a launchpad collection, a governed page at a time.
+
+    Each page is its own slice of the collection, so a page that times
+    out is simply asked for again. session is the one the collection
+    came from.
+    """
+    start = 0
+    while True:
+        page = call(lambda: list(collection[start:start + size]),
+                    session=session)
+        for item in page:
+            yield item
+        if len(page) < size:
+            return
+        start += size
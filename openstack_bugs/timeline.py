@@ -0,0 +1,66 @@
+"""Status and assignee history of a bug, out of its activity log.
+
+The activity log has every change ever made to a bug, with people as
+display strings ("Name (launchpad-id)"). A Timeline goes through it
+once and keeps only the status and assignee transitions of each task,
+with people resolved to API links, and what each task's previous
+status and assignee were, so looking those up is just a dict lookup.
+"""
+
+PERSON_URL = "https://api.launchpad.net/1.0/~%s"
+FIELDS = ('status', 'assignee')
+
+
+def person_link(display):
+    """The API link for a person as the activity log shows them."""
+    if not display:
+        return None
+    start = display.rfind('(')
+    end = display.rfind(')')
+    if start == -1 or end < start:
+        return None
+    return PERSON_URL % display[start + 1:end]
+
+
+def transition(whatchanged, oldvalue, newvalue, datechanged):
+    """Return (target, field, old, new, when) for an activity, or None."""
+    target, sep, field = whatchanged.rpartition(': ')
+    if not sep or field not in FIELDS:
+        return None
+    if field == 'assignee':
+        oldvalue = person_link(oldvalue)
+        newvalue = person_link(newvalue)
+    return (target, field, oldvalue, newvalue, datechanged)
+
+
+class Timeline(object):
+    def __init__(self, transitions=()):
+        self.transitions = []
+        self._last = {}
+        for t in transitions:
+            self.add(*t)
+
+    @classmethod
+    def from_activity(cls, activity):
+        timeline = cls()
+        for a in activity:
+            t = transition(a.whatchanged, a.oldvalue, a.newvalue,
+                           a.datechanged)
+            if t is not None:
+                timeline.add(*t)
+        return timeline
+
+    def add(self, target, field, old, new, when=None):
+        """Add a transition, they have to be added oldest first."""
+        self.transitions.append((target, field, old, new, when))
+        # nobody being assigned before isn't worth going back to
+        if field == 'status' or old is not None:
+            self._last[(target, field)] = old
+
+    def last_status(self, target):
+        """The status target had before the last change to it."""
+        return self._last.get((target, 'status'), "New")
+
+    def last_assignee(self, target):
+        """The link of the last person unassigned from target, or None."""
+        return self._last.get((target, 'assignee'))
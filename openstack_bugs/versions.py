@@ -0,0 +1,202 @@
+"""Heuristic discovery of OpenStack and OS versions in bug descriptions.
+
+Each detector is a list of regexes in order of how much we trust
+them, compiled once and cached. A description is ASCII lower cased in
+a single pass, after which every pattern is matched case sensitively
+against it (which is a lot cheaper than re.IGNORECASE), and only if
+the literal text the pattern needs shows up in the description at
+all. The most trusted pattern that found something wins, which gives
+exactly the answer of trying every pattern with re.search in turn.
+"""
+
+import bisect
+import re
+
+
+# release number prefixes (before and after the versioning scheme
+# change) to release names. It's hardcoded to nova numbering.
+#
+# TODO(sdague): project specific mapping.
+RELEASES = (
+    ("2013.1", "grizzly"),
+    ("2013.2", "havana"),
+    ("2014.1", "icehouse"),
+    ("2014.2", "juno"),
+    ("2015.1", "kilo"),
+    ("2015.2", "liberty"),
+    ("12.", "liberty"),
+    ("13.", "mitaka"),
+    ("14.", "newton"),
+    ("15.", "ocata"),
+    ("16.", "pike"),
+)
+KNOWN_VERSIONS = ("grizzly", "havana", "icehouse", "juno",
+                  "kilo", "liberty", "mitaka", "newton", "ocata", "pike")
+KNOWN_DISTROS = ("ubuntu", "debian", "red\s*hat", "centos",
+                 "fedora", "(open)?suse")
+
+# No prefix in RELEASES is a prefix of another one, so the only one
+# that can match a version is the greatest prefix sorting <= it.
+_PREFIXES = tuple(sorted(RELEASES))
+_PREFIX_KEYS = tuple(p[0] for p in _PREFIXES)
+_RELEASE_NAMES = frozenset(name for prefix, name in RELEASES)
+
+
+def _release_for_prefix(version):
+    i = bisect.bisect_right(_PREFIX_KEYS, version) - 1
+    if i >= 0 and version.startswith(_PREFIX_KEYS[i]):
+        return _PREFIXES[i][1]
+
+
+def version_normalize(version):
+    """A set of normalizations found based on the info.
+
+    This normalizes data based on the project in question to get back
+    to an openstack release for tag name. It's hardcoded to nova after
+    we change versioning schemes.
+
+    """
+    if not version:
+        return
+
+    version = version.rstrip().lstrip()
+    # split off some very standard compound versions markers
+    version = version.split(" ")[0].split("(")[0]
+    # this is a url and not even a git sha
+    if len(version) > 40:
+        return None
+
+    # master is not useful, given that it requires understanding point
+    # in time of the bug. Maybe some day we can manage to make this
+    # detect when it was, and bucket it. That's a whole different beast.
+    if version.lower() == "master":
+        return None
+
+    release = _release_for_prefix(version)
+    if release:
+        return release
+
+    if version.lower() in _RELEASE_NAMES:
+        return version.lower()
+
+    if version.startswith("stable/"):
+        strip_vers = version[7:]
+        if strip_vers.lower() in _RELEASE_NAMES:
+            return strip_vers.lower()
+
+    return version
+
+
+# str.translate table to lower case ASCII only, which is what
+# re.IGNORECASE does for str patterns
+_ASCII_LOWER = "".join(chr(c).lower() if c < 128 else chr(c)
+                       for c in range(256))
+_ASCII_LOWER_UNICODE = dict((ord(c), ord(c.lower()))
+                            for c in map(chr, range(65, 91)))
+
+
+def ascii_lower(text):
+    if isinstance(text, unicode):
+        return text.translate(_ASCII_LOWER_UNICODE)
+    return text.translate(_ASCII_LOWER)
+
+
+class Detector(object):
+    """Find the most trusted of a list of patterns in a text.
+
+    rules is a list of (pattern, triggers) in order of trust. Patterns
+    are lower case and must have a 'version' group, which is what gets
+    returned. A pattern is only tried if at least one of its trigger
+    strings is in the (lower cased) text, or always if triggers is None.
+    """
+    def __init__(self, rules):
+        self.rules = [(re.compile(pattern),
+                       None if triggers is None else tuple(triggers))
+                      for pattern, triggers in rules]
+
+    def search(self, text):
+        folded = ascii_lower(text)
+        found = None
+        for regex, triggers in self.rules:
+            if triggers is not None:
+                for trigger in triggers:
+                    if trigger in folded:
+                        break
+                else:
+                    continue
+            m = regex.search(folded)
+            if m:
+                start, end = m.span('version')
+                found = text[start:end]
+                if found:
+                    break
+        return found
+
+
+_STACK_DETECTORS = {}
+_OS_DETECTOR = None
+_REGEX_CHARS = frozenset(".^$*+?{}[]\\|()")
+
+
+def stack_version_detector(project):
+    """Return the (cached) OpenStack version Detector for a project."""
+    detector = _STACK_DETECTORS.get(project)
+    if detector is None:
+        name = project.lower()
+        # the project name has always been used as regex text, so
+        # oslo.messaging matches oslo_messaging too; only gate on it
+        # when it means just itself
+        if _REGEX_CHARS.intersection(name):
+            literal = lambda trigger: None
+        else:
+            literal = lambda trigger: (trigger,)
+        detector = Detector((
+            # the ideal version is Openstack Version: ....
+            ("(^|\n)openstack\s*version\s*:(?P<version>.*)",
+             ("version",)),
+            # nova version
+            ("(^|\n)%s(\s*version)?\s*:(?P<version>.*)" % name,
+             literal(name)),
+            # rhel version
+            ("(^|\n)openstack-%s-common-(?P<version>.*)" % name,
+             literal("openstack-%s-common-" % name)),
+            ("(^|\n)openstack-%s-compute-(?P<version>.*)" % name,
+             literal("openstack-%s-compute-" % name)),
+            # ubuntu dpkg -l version
+            (r"\b%s-common\s+\d\:(?P<version>.*)" % name,
+             literal("%s-common" % name)),
+            # keywords
+            (r"(?P<version>\b(%s)\b)" % ("|".join(KNOWN_VERSIONS)),
+             KNOWN_VERSIONS),
+        ))
+        _STACK_DETECTORS[project] = detector
+    return detector
+
+
+def os_version_detector():
+    global _OS_DETECTOR
+    if _OS_DETECTOR is None:
+        _OS_DETECTOR = Detector((
+            # the ideal version is OS Version: ....
+            ("(^|\n)(os|linux)\s*version\s*:(?P<version>.*)",
+             ("version",)),
+            (r"(?P<version>\b(%s))" % ("|".join(KNOWN_DISTROS)),
+             ("ubuntu", "debian", "red", "centos", "fedora", "suse")),
+        ))
+    return _OS_DETECTOR
+
+
+def discover_stack_version(project, desc):
+    """Discover the OpenStack Version.
+
+    This attempts to pillage the bug description looking for things
+    that might indicate the version. The patterns near the top of
+    stack_version_detector are a lot more trust worthy, and win over
+    the ones below them.
+    """
+    return version_normalize(stack_version_detector(project).search(desc))
+
+
+def discover_os_version(desc):
+    """Discover operating system version heuristically"""
+    return os_version_detector().search(desc)
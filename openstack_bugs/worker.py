@@ -0,0 +1,270 @@
+"""A long running worker the tools can hand their runs to.
+
+Run from cron, every tool pays the same start up cost each time:
+importing launchpadlib, logging in, fetching launchpad's service
+description and opening new TLS connections to launchpad and gerrit,
+often to then change a handful of bugs. run-bug-worker.py starts a
+worker that does all that once, then runs the tools in its own process
+as they ask, keeping the login, the pooled connections and the caches
+warm in between.
+
+With OPENSTACK_BUGS_WORKER set to the worker's socket, a tool sends
+its command line (and working directory) there instead of running it
+itself, and passes through the output and exit code it gets back. If
+no worker is listening the tool runs as usual.
+
+The protocol is a line of JSON each way: the job {"script", "argv",
+"cwd"}, then {"stdout": text} and {"stderr": text} as the script
+prints, and {"exit": code} when it is done. Jobs run one at a time, in
+the order they arrive, since the scripts share the process (sys.argv,
+the working directory, the module level caches); the per run counters
+and caches are reset before each one, so a run through the worker
+reports and behaves just like one on its own. Only the tools next to
+openstack_bugs can be run, and the socket is only open to its owner.
+"""
+
+import errno
+import json
+import os
+import runpy
+import signal
+import socket
+import SocketServer
+import sys
+import threading
+import traceback
+
+import openstack_bugs
+from openstack_bugs import cache
+from openstack_bugs import gerrit
+from openstack_bugs import metrics
+from openstack_bugs import throttle
+
+
+ENV = 'OPENSTACK_BUGS_WORKER'
+# where the tools are
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# set in the worker process, so the scripts it runs don't try to hand
+# themselves to it again
+_IN_WORKER = False
+
+
+def default_socket_path():
+    return os.path.join(cache.cache_dir(), 'worker.sock')
+
+
+def run(main):
+    """Run a tool's main(), in the worker if there is one."""
+    path = os.environ.get(ENV)
+    if path and not _IN_WORKER:
+        code = submit(path, os.path.abspath(sys.argv[0]), sys.argv[1:])
+        if code is not None:
+            sys.exit(code)
+        sys.stderr.write("No worker at %s, running here\n" % path)
+    main()
+
+
+def submit(path, script, argv, cwd=None, stdout=None, stderr=None):
+    """Run script with argv in the worker listening at path.
+
+    The script's output is written to stdout and stderr as it comes.
+    Returns its exit code, or None if there is no worker to run it.
+    """
+    stdout = stdout or sys.stdout
+    stderr = stderr or sys.stderr
+    conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        conn.connect(path)
+    except socket.error as e:
+        conn.close()
+        if e.errno in (errno.ENOENT, errno.ECONNREFUSED):
+            return None
+        raise
+    try:
+        conn.sendall(json.dumps({'script': script, 'argv': argv,
+                                 'cwd': cwd or os.getcwd()}) + "\n")
+        for line in conn.makefile('r'):
+            message = json.loads(line)
+            if 'exit' in message:
+                return message['exit']
+            for name, stream in (('stdout', stdout), ('stderr', stderr)):
+                if name in message:
+                    stream.write(message[name].encode('utf-8'))
+                    stream.flush()
+    finally:
+        conn.close()
+    # the worker went away part way through
+    stderr.write("Worker at %s closed the connection\n" % path)
+    return 1
+
+
+class _Stream(object):
+    """A file like object sending whole lines back to the client.
+
+    Writes after the client has gone are dropped rather than failing
+    the job, which carries on to the end.
+    """
+    def __init__(self, conn, name):
+        self.conn = conn
+        self.name = name
+        self.closed = False
+        self._buffer = []
+        self._lock = threading.Lock()
+
+    def write(self, text):
+        with self._lock:
+            self._buffer.append(text)
+            if '\n' in text:
+                self._send()
+
+    def writelines(self, lines):
+        for line in lines:
+            self.write(line)
+
+    def flush(self):
+        with self._lock:
+            self._send()
+
+    def isatty(self):
+        return False
+
+    def _send(self):
+        text = "".join(
+            t if isinstance(t, unicode) else t.decode('utf-8', 'replace')
+            for t in self._buffer)
+        self._buffer = []
+        if text and not self.closed:
+            try:
+                self.conn.sendall(json.dumps({self.name: text}) + "\n")
+            except socket.error:
+                self.closed = True
+
+
+def _reset():
+    """Start a run with fresh per run counters and caches."""
+    openstack_bugs.LPBug.FETCHES.clear()
+    openstack_bugs.LPBug.WRITES.clear()
+    openstack_bugs.configure_review_cache()
+    openstack_bugs.configure_message_index()
+    metrics.REGISTRY = metrics.Metrics()
+    # keep what has been learnt about launchpad's limit, and the pooled
+    # gerrit connections
+    throttle.configure(limit=throttle.governor().limit)
+    gerrit.configure_client(session=gerrit.client().session)
+
+
+def run_job(job, stdout, stderr):
+    """Run a job's script as __main__, return its exit code."""
+    script = os.path.abspath(job['script'])
+    if os.path.dirname(script) != ROOT or not script.endswith('.py'):
+        stderr.write("Not one of the tools: %s\n" % script)
+        return 2
+    saved = sys.argv, sys.stdout, sys.stderr, os.getcwd()
+    code = 0
+    try:
+        _reset()
+        os.chdir(job.get('cwd') or ROOT)
+        sys.argv = [script] + list(job.get('argv', []))
+        sys.stdout, sys.stderr = stdout, stderr
+        runpy.run_path(script, run_name='__main__')
+    except SystemExit as e:
+        if e.code is None:
+            code = 0
+        elif isinstance(e.code, int):
+            code = e.code
+        else:
+            stderr.write("%s\n" % e.code)
+            code = 1
+    except KeyboardInterrupt:
+        # the worker is being stopped
+        raise
+    except BaseException:
+        traceback.print_exc(file=stderr)
+        code = 1
+    finally:
+        try:
+            metrics.write_reports()
+        finally:
+            stdout.flush()
+            stderr.flush()
+            sys.argv, sys.stdout, sys.stderr = saved[:3]
+            os.chdir(saved[3])
+    return code
+
+
+class _Handler(SocketServer.StreamRequestHandler):
+    def handle(self):
+        stdout = _Stream(self.request, 'stdout')
+        stderr = _Stream(self.request, 'stderr')
+        try:
+            job = json.loads(self.rfile.readline())
+        except ValueError:
+            stderr.write("Bad job\n")
+            code = 2
+        else:
+            code = run_job(job, stdout, stderr)
+        stderr.flush()
+        try:
+            self.request.sendall(json.dumps({'exit': code}) + "\n")
+        except socket.error:
+            pass
+
+
+class Worker(SocketServer.UnixStreamServer):
+    """Runs jobs sent to a unix socket, one at a time."""
+    def __init__(self, path):
+        if os.path.exists(path):
+            probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                probe.connect(path)
+            except socket.error:
+                # left over from a worker that died
+                os.unlink(path)
+            else:
+                raise RuntimeError("A worker is already running at %s" %
+                                   path)
+            finally:
+                probe.close()
+        self.path = path
+        umask = os.umask(0o077)
+        try:
+            SocketServer.UnixStreamServer.__init__(self, path, _Handler)
+        finally:
+            os.umask(umask)
+
+    def handle_error(self, request, client_address):
+        # called from a bare except, which would swallow our stopping
+        if sys.exc_info()[0] is KeyboardInterrupt:
+            raise
+        SocketServer.UnixStreamServer.handle_error(self, request,
+                                                   client_address)
+
+    def server_close(self):
+        SocketServer.UnixStreamServer.server_close(self)
+        try:
+            os.unlink(self.path)
+        except OSError:
+            pass
+
+
+def _interrupt(signum, frame):
+    raise KeyboardInterrupt()
+
+
+def serve(path=None):
+    """Log in, then run jobs at path until interrupted or terminated."""
+    global _IN_WORKER
+    _IN_WORKER = True
+    signal.signal(signal.SIGTERM, _interrupt)
+    openstack_bugs.keep_login()
+    openstack_bugs.launchpad_login()
+    server = Worker(path or default_socket_path())
+    print "Worker listening on %s" % server.path
+    sys.stdout.flush()
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+
+import argparse
+import time
+
+from openstack_bugs import report
+from openstack_bugs import store
+from openstack_bugs import worker
+
+
+def int_list(value):
+    return [int(v) for v in value.split(',') if v.strip()]
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description=("Summarize a project's backlog from the local bug "
+                     "store, to help pick thresholds for the other tools"))
+    parser.add_argument('--project', required=True,
+                        help='The project to act on')
+    parser.add_argument('--store',
+                        help=('Path of the bug store (see sync-bug-store.py). '
+                              'Default: %s' % store.default_store_path()))
+    parser.add_argument('--no-activity', type=int_list,
+                        default=[30, 90, 180, 365, 730],
+                        help=('Comma separated --no-activity values to count '
+                              'close-old-bugs.py closures for. '
+                              'Default: 30,90,180,365,730'))
+    parser.add_argument('--age', type=int_list,
+                        default=[7, 30, 90, 180, 365],
+                        help=('Comma separated --age values to count '
+                              'tag-needs-info.py Incomplete bugs for. '
+                              'Default: 7,30,90,180,365'))
+    return parser.parse_args()
+
+
+def print_histogram(title, counts):
+    print "%s:" % title
+    for label, count in counts:
+        print "  %-10s %7d" % (label, count)
+
+
+def print_matrix(backlog):
+    matrix = backlog.status_importance()
+    importances = [i for i in backlog.importances
+                   if any(k[1] == i for k in matrix)]
+    print "Status by importance:"
+    print "  %-14s" % "" + "".join("%10s" % i for i in importances) + \
+        "%10s" % "Total"
+    for status in backlog.statuses:
+        row = [matrix.get((status, i), 0) for i in importances]
+        if sum(row):
+            print "  %-14s" % status + "".join("%10d" % n for n in row) + \
+                "%10d" % sum(row)
+
+
+def main():
+    args = parse_args()
+    start = time.time()
+    bugs = store.BugStore(args.store)
+    backlog = report.Backlog.load(bugs, args.project)
+    bugs.close()
+
+    print "%d %s bugs in the store" % (len(backlog), args.project)
+    print
+    print_histogram("Days since created", backlog.histogram('age'))
+    print
+    print_histogram("Days since last updated", backlog.histogram('idle'))
+    print
+    print_matrix(backlog)
+    for prefix in report.TAG_PREFIXES:
+        print
+        print "%s* tags:" % prefix
+        counts = backlog.tag_counts(prefix)
+        for tag, count in counts:
+            print "  %-30s %7d" % (tag, count)
+        if not counts:
+            print "  none"
+    print
+    print "close-old-bugs.py would close:"
+    for days, count in backlog.close_old(args.no_activity):
+        print "  --no-activity %-5d %7d" % (days, count)
+    print
+    print "tag-needs-info.py would mark Incomplete at most:"
+    for days, count in backlog.needs_info(args.age):
+        print "  --age %-5d %7d" % (days, count)
+    print
+    print "Report took %.2fs" % (time.time() - start)
+
+
+if __name__ == "__main__":
+    worker.run(main)
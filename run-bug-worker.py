@@ -0,0 +1,25 @@
+#!/usr/bin/env python
+
+import argparse
+
+from openstack_bugs import worker
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description=("Log in once and run the tools as they ask, see "
+                     "openstack_bugs/worker.py. Tools hand their runs to "
+                     "it when %s is set to its socket" % worker.ENV))
+    parser.add_argument('--socket',
+                        help=('Path of the socket to listen on. '
+                              'Default: %s' % worker.default_socket_path()))
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    worker.serve(args.socket)
+
+
+if __name__ == "__main__":
+    main()
@@ -4,26 +4,17 @@
 
 import argparse
 import datetime
-import json
-import re
-import requests
 import sys
 
+import openstack_bugs
+from openstack_bugs import throttle
+from openstack_bugs import worker
 
-from launchpadlib.launchpad import Launchpad
-RE_LINK = re.compile(' https://review.openstack.org/(\d+)')
-
-ALL_STATUS = ["New",
-              "Incomplete",
-              "Opinion",
-              "Invalid",
-              "Won't Fix",
-              "Expired",
-              "Confirmed",
-              "Triaged",
-              "In Progress",
-              "Fix Committed",
-              "Fix Released"]
+OPEN_STATUS = ["New",
+               "Incomplete",
+               "Confirmed",
+               "Triaged",
+               "In Progress"]
 
 
 def delta(date_value):
@@ -31,36 +22,14 @@ def delta(date_value):
     return delta.days
 
 
-def get_reviews_from_bug(bug):
-    """Return a list of gerrit reviews extracted from the bug's comments."""
-    reviews = set()
-    for comment in bug.messages:
-        reviews |= set(RE_LINK.findall(comment.content))
-    return reviews
-
-
-def get_review_status(review_number):
-    """Return status of a given review number."""
-    r = requests.get("https://review.openstack.org:443/changes/%s"
-                     % review_number)
-    # strip off first few chars because 'the JSON response body starts with a
-    # magic prefix line that must be stripped before feeding the rest of the
-    # response body to a JSON parser'
-    # https://review.openstack.org/Documentation/rest-api.html
-    status = None
-    try:
-        status = json.loads(r.text[4:])['status']
-    except ValueError:
-        status = r.text
-    return status
-
-
 class LPBug(object):
     def __init__(self, task, lp, project=None):
+        self.session = lp
         self._project = project
-        self.bug = lp.load(task.bug_link)
+        self.bug = throttle.call(lp.load, task.bug_link, session=lp)
         self.task = None
-        for task in self.bug.bug_tasks:
+        for task in throttle.call(lambda: list(self.bug.bug_tasks),
+                                  session=lp):
             if task.bug_target_name == project:
                 self.task = task
 
@@ -75,10 +44,11 @@ class LPBug(object):
     @status.setter
     def status(self, value):
         self.task.status = value
-        self.task.lp_save()
+        throttle.call(self.task.lp_save, session=self.session)
 
     def add_comment(self, msg):
-        self.bug.newMessage(content=msg)
+        throttle.call(self.bug.newMessage, content=msg, idempotent=False,
+                      session=self.session)
 
     @property
     def age(self):
@@ -95,11 +65,12 @@ class LPBug(object):
     @assignee.setter
     def assignee(self, name):
         self.task.assignee = name
-        self.task.lp_save()
+        throttle.call(self.task.lp_save, session=self.session)
 
     @property
     def reviews(self):
-        return get_reviews_from_bug(self.bug)
+        return openstack_bugs.get_reviews_from_bug(self.bug,
+                                                   session=self.session)
 
     def __repr__(self):
         return '<LPBug title="%s" status="%s" link="%s">' % \
@@ -116,22 +87,32 @@ def parse_args():
     parser.add_argument('--since', required=True,
                         help='Date to start with')
     parser.add_argument('--close-all', action="store_true", default=False)
+    parser.add_argument('--workers', type=int, default=1,
+                        help=('Number of bugs to load from launchpad in '
+                              'parallel. Default: 1'))
     parser.add_argument('--dryrun', action="store_true", default=False)
     return parser.parse_args()
 
 
 def main():
     args = parse_args()
-    launchpad = Launchpad.login_with('openstack-bugs', 'production')
-    project = launchpad.projects[args.project]
+    launchpad = openstack_bugs.launchpad_login()
+    # only bugs with a task on the series, in the statuses we'd change
+    statuses = ["Fix Committed"]
+    if args.close_all:
+        statuses.extend(OPEN_STATUS)
+    series = throttle.call(launchpad.projects[args.project].getSeries,
+                           name=args.series)
     count = 0
-    for task in project.searchTasks(status=ALL_STATUS,
-                                modified_since=args.since,
-                                order_by='date_last_updated'):
+    tasks = throttle.call(series.searchTasks, status=statuses,
+                          modified_since=args.since,
+                          order_by='date_last_updated')
+    target = "%s/%s" % (args.project, args.series)
+    for bug in openstack_bugs.hydrate_bugs(throttle.pages(tasks), launchpad,
+                                           target, workers=args.workers,
+                                           factory=LPBug):
         try:
             count += 1
-            bug = LPBug(task, launchpad,
-                        project=("%s/%s" % (args.project, args.series)))
             if bug.task:
                 print "Found a %s task: %s (%d)" % (args.series, bug, count)
                 # we've found something related here
@@ -148,4 +129,4 @@ def main():
 
 
 if __name__ == "__main__":
-    main()
+    worker.run(main)
@@ -0,0 +1,44 @@
+#!/usr/bin/env python
+
+import argparse
+
+import openstack_bugs
+from openstack_bugs import store
+from openstack_bugs import worker
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Update the local snapshot of a project's bugs")
+    parser.add_argument('--project', required=True,
+                        help='The project to act on')
+    parser.add_argument('--store',
+                        help=('Path of the bug store. Default: %s'
+                              % store.default_store_path()))
+    parser.add_argument('--full', action="store_true", default=False,
+                        help='Ignore the last sync time and fetch all bugs')
+    parser.add_argument('--workers', type=int, default=1,
+                        help=('Number of bugs to load from launchpad in '
+                              'parallel. Default: 1'))
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    launchpad = openstack_bugs.launchpad_login()
+    bugs = store.BugStore(args.store, lp=launchpad)
+    since = bugs.high_water(args.project)
+    if since and not args.full:
+        print "Fetching %s bugs changed since %s" % (args.project, since)
+    else:
+        print "Fetching all %s bugs" % args.project
+    count = bugs.sync(args.project, workers=args.workers, full=args.full)
+    print "Total fetched: %s" % count
+    failed = bugs.retries(args.project)
+    if failed:
+        print "Failed to fetch %d, the next sync will try them again" % (
+            len(failed))
+
+
+if __name__ == "__main__":
+    worker.run(main)
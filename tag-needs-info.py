@@ -3,15 +3,12 @@
 import argparse
 
 import openstack_bugs
-from openstack_bugs.messages import DISCOVERED_STACK_VERS, NO_STACK_VERS_FOUND
-
-from launchpadlib.launchpad import Launchpad
-
-ALL_STATUS = ["New",
-              "In Progress",
-              "Incomplete",
-              "Confirmed",
-              "Triaged"]
+from openstack_bugs import journal
+from openstack_bugs import metrics
+from openstack_bugs import plans
+from openstack_bugs import rules
+from openstack_bugs import store
+from openstack_bugs import worker
 
 
 def parse_args():
@@ -21,10 +18,30 @@ def parse_args():
                         help='The project to act on')
     parser.add_argument('--search',
                         help='Custom search terms for bug')
-    parser.add_argument('--age', default=0,
+    parser.add_argument('--age', type=int, default=0,
                         help=('Bugs that are less than this number of '
                               'days old require versions to not be marked '
                               'incomplete. Default: 0'))
+    parser.add_argument('--workers', type=int, default=1,
+                        help=('Number of bugs to load from launchpad in '
+                              'parallel. Default: 1'))
+    parser.add_argument('--from-store', action="store_true", default=False,
+                        help=('Read bugs from the local bug store (see '
+                              'sync-bug-store.py) instead of launchpad. '
+                              'Changes are still made in launchpad.'))
+    parser.add_argument('--resume', action="store_true", default=False,
+                        help=('Carry on with an earlier run with the same '
+                              'options that did not finish, skipping the '
+                              'bugs it already dealt with'))
+    parser.add_argument('--plan-out', metavar='FILE',
+                        help=('Write the changes that would be made to '
+                              'FILE as a plan for apply-plan.py, instead '
+                              'of making them. Implies --dryrun.'))
+    parser.add_argument('--metrics-out', metavar='FILE',
+                        help=('Write API call counts, bytes and latencies '
+                              'to FILE at exit, as JSON, or in the '
+                              'Prometheus text format if FILE ends in '
+                              '.prom'))
     parser.add_argument('--dryrun', action="store_true", default=False)
     parser.add_argument('--verbose', action="store_true", default=False)
     return parser.parse_args()
@@ -32,57 +49,38 @@ def parse_args():
 
 def main():
     args = parse_args()
-    launchpad = Launchpad.login_with('openstack-bugs', 'production')
-    project = launchpad.projects[args.project]
-    count = 0
-    fixed = 0
-    incomp = 0
-    for task in project.searchTasks(status=ALL_STATUS,
-                                search_text=args.search,
-                                order_by='date_last_updated'):
-        try:
-            count += 1
-            bug = openstack_bugs.LPBug(task, launchpad, project=args.project)
-            print(bug)
-            version = openstack_bugs.discover_stack_version(
-                args.project, bug.description)
-            opsys = openstack_bugs.discover_os_version(bug.description)
-            if args.verbose:
-                print(bug.description)
-
-            tags = bug.tags
-            if opsys is not None:
-                new_tag = "opsys-type.%s" % opsys
-                print("Found operating system: %s" % new_tag)
-
-            if version is not None:
-                new_tag = "openstack-version.%s" % version
-                print("Found tags: %s" % tags)
-                fixed += 1
-                if new_tag not in tags:
-                    print("Adding %s to tags" % new_tag)
-                    if not args.dryrun:
-                        bug.add_tag(new_tag)
-                        bug.add_comment(DISCOVERED_STACK_VERS
-                                        % (version, args.project))
-            if version is None and args.age and bug.age <= args.age:
-                if (bug.status != "Incomplete" and
-                    "needs.openstack-version" not in bug.tags):
-                    incomp += 1
-                    print("Marking bug incomplete - no openstack version specified")
-                    if not args.dryrun:
-                        if bug.add_tag("needs.openstack-version"):
-                            bug.status = "Incomplete"
-                            bug.add_comment(NO_STACK_VERS_FOUND
-                                            % (args.project))
-            if args.verbose:
-                # make it easier to sort out bugs
-                print("\n\n")
-
-        except Exception as e:
-            print "Exception: %s" % e
-    print "Total found: %s, tagging %s, incomplete %s" % (count, fixed, incomp)
+    if args.metrics_out:
+        metrics.report_at_exit(args.metrics_out)
+    if args.plan_out:
+        args.dryrun = True
+    launchpad = openstack_bugs.launchpad_login()
+    if args.from_store:
+        launchpad = store.BugStore(lp=launchpad)
+    rule = rules.TagNeedsInfo(args.project, age=args.age,
+                              verbose=args.verbose)
+    checkpoints = None
+    if not args.dryrun:
+        checkpoints = journal.Journal(
+            'tag-needs-info', args.project,
+            {'search': args.search, 'age': args.age},
+            resume=args.resume)
+        if checkpoints.resumed:
+            print "Resuming, %d bugs already done" % len(checkpoints.done)
+    plan = plans.sink(args.plan_out, keep=args.dryrun and args.verbose)
+    count, plan = rules.run_rules(launchpad, args.project, [rule],
+                                  search=args.search, workers=args.workers,
+                                  dryrun=args.dryrun,
+                                  journal=checkpoints, plan=plan)
+    if args.plan_out:
+        plan.close()
+        print "Wrote %d actions to %s" % (plan.actions, args.plan_out)
+    if args.dryrun and args.verbose:
+        rules.print_plan(plan)
+    print "Total found: %s, tagging %s, incomplete %s" % (
+        count, rule.counters['tagged'], rule.counters['incomplete'])
+    if args.verbose:
+        print openstack_bugs.LPBug.fetch_summary()
 
 
 if __name__ == "__main__":
-    main()
+    worker.run(main)
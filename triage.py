@@ -0,0 +1,195 @@
+#!/usr/bin/env python
+
+import argparse
+import functools
+import sys
+
+import openstack_bugs
+from openstack_bugs import cache
+from openstack_bugs import fanout
+from openstack_bugs import journal
+from openstack_bugs import metrics
+from openstack_bugs import plans
+from openstack_bugs import rules
+from openstack_bugs import store
+from openstack_bugs import throttle
+from openstack_bugs import worker
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description=("Run several of the triage tools in a single pass "
+                     "over the bugs"))
+    parser.add_argument('--project',
+                        help=('The project to act on, or a comma separated '
+                              'list of them'))
+    parser.add_argument('--project-group',
+                        help='Act on all the projects of a project group')
+    parser.add_argument('--processes', type=int,
+                        help=('With several projects, the number of them '
+                              'to triage at once, each in its own process. '
+                              'Default: the number of CPUs'))
+    parser.add_argument('--search',
+                        help='Custom search terms for bug')
+    for rule in rules.RULES:
+        parser.add_argument('--%s' % rule.name, action="append_const",
+                            dest='rules', const=rule,
+                            help='Run the %s rule' % rule.name)
+    parser.add_argument('--all', action="store_true", default=False,
+                        help='Run all the rules')
+    parser.add_argument('--no-activity', type=int, default=180,
+                        help=('close-old-bugs: Bugs that have no activity '
+                              'in the last N days will be closed. '
+                              'Default: 180'))
+    parser.add_argument('--age', type=int, default=0,
+                        help=('tag-needs-info: Bugs that are less than this '
+                              'number of days old require versions to not '
+                              'be marked incomplete. Default: 0'))
+    parser.add_argument('--full-scan', action="store_true", default=False,
+                        help=('For find-reviews, rebuild the gerrit review '
+                              'index instead of updating it'))
+    parser.add_argument('--workers', type=int, default=1,
+                        help=('Number of bugs to load from launchpad in '
+                              'parallel. Default: 1'))
+    parser.add_argument('--review-ttl', type=int,
+                        default=cache.DEFAULT_REVIEW_TTL,
+                        help=('Seconds to trust the cached status of a '
+                              'review that is still open. Default: %s'
+                              % cache.DEFAULT_REVIEW_TTL))
+    parser.add_argument('--no-review-cache', action="store_true",
+                        default=False,
+                        help=("Don't keep review status, or the reviews "
+                              "linked from bug comments, between runs"))
+    parser.add_argument('--from-store', action="store_true", default=False,
+                        help=('Read bugs from the local bug store (see '
+                              'sync-bug-store.py) instead of launchpad. '
+                              'Changes are still made in launchpad.'))
+    parser.add_argument('--resume', action="store_true", default=False,
+                        help=('Carry on with an earlier run with the same '
+                              'options that did not finish, skipping the '
+                              'bugs it already dealt with'))
+    parser.add_argument('--plan-out', metavar='FILE',
+                        help=('Write the changes that would be made to '
+                              'FILE as a plan for apply-plan.py, instead '
+                              'of making them. Implies --dryrun.'))
+    parser.add_argument('--metrics-out', metavar='FILE',
+                        help=('Write API call counts, bytes and latencies '
+                              'to FILE at exit, as JSON, or in the '
+                              'Prometheus text format if FILE ends in '
+                              '.prom'))
+    parser.add_argument('--dryrun', action="store_true", default=False)
+    parser.add_argument('--verbose', action="store_true", default=False)
+    args = parser.parse_args()
+    if not args.project and not args.project_group:
+        parser.error("pass --project and/or --project-group")
+    if args.all:
+        args.rules = list(rules.RULES)
+    if not args.rules:
+        parser.error("no rules to run, pass --all or some of: %s" %
+                     ", ".join("--%s" % r.name for r in rules.RULES))
+    return args
+
+
+def make_rules(args, project):
+    options = {
+        rules.CloseOldBugs: {'no_activity': args.no_activity},
+        rules.TagNeedsInfo: {'age': args.age},
+        rules.FindReviews: {'full_scan': args.full_scan},
+    }
+    # always in the RULES order, no matter the order on the command line
+    return [rule(project, verbose=args.verbose,
+                 **options.get(rule, {}))
+            for rule in rules.RULES if rule in args.rules]
+
+
+def triage(args, project, launchpad=None, collect=False):
+    """Run the enabled rules over a project, return what happened.
+
+    With collect, the actions for --plan-out are returned rather than
+    written, for merging with those of other projects.
+    """
+    if launchpad is None:
+        launchpad = openstack_bugs.launchpad_login()
+    if args.from_store:
+        launchpad = store.BugStore(lp=launchpad)
+    if not args.no_review_cache:
+        openstack_bugs.configure_review_cache(
+            cache.default_review_cache_path(), args.review_ttl)
+        openstack_bugs.configure_message_index(
+            cache.default_message_index_path())
+    enabled = make_rules(args, project)
+    checkpoints = None
+    if not args.dryrun:
+        checkpoints = journal.Journal(
+            'triage', project,
+            {'search': args.search,
+             'rules': [rule.name for rule in enabled],
+             'no_activity': args.no_activity, 'age': args.age},
+            resume=args.resume)
+        if checkpoints.resumed:
+            print "Resuming, %d bugs already done" % len(checkpoints.done)
+    plan = plans.sink(None if collect else args.plan_out, keep=args.dryrun)
+    count, plan = rules.run_rules(launchpad, project, enabled,
+                                  search=args.search, workers=args.workers,
+                                  dryrun=args.dryrun,
+                                  journal=checkpoints, plan=plan)
+    if args.plan_out and not collect:
+        plan.close()
+        print "Wrote %d actions to %s" % (plan.actions, args.plan_out)
+    elif args.dryrun:
+        print "Plan:"
+        rules.print_plan(plan)
+    print "Total found: %s, changed %s" % (count, len(plan))
+    for rule in enabled:
+        print rule.summary()
+    print openstack_bugs.review_cache().summary()
+    print openstack_bugs.message_index().summary()
+    print openstack_bugs.LPBug.fetch_summary()
+    print throttle.governor().summary()
+    actions = []
+    if args.plan_out and collect:
+        actions = [action for bug, changes in plan
+                   for action in plans.plan_actions(bug, changes)]
+    return {'found': count, 'changed': len(plan),
+            'rules': dict((rule.name, dict(rule.counters))
+                          for rule in enabled),
+            'actions': actions}
+
+
+def main():
+    args = parse_args()
+    if args.metrics_out:
+        metrics.report_at_exit(args.metrics_out)
+    if args.plan_out:
+        args.dryrun = True
+    launchpad = openstack_bugs.launchpad_login()
+    projects = fanout.project_names(launchpad, args.project,
+                                    args.project_group)
+    if len(projects) == 1:
+        result = triage(args, projects[0], launchpad)
+    else:
+        result = fanout.merge(fanout.run_projects(
+            functools.partial(triage, args, collect=True), projects,
+            args.processes))
+        print "All %d projects (%s):" % (len(projects), ", ".join(projects))
+        print "Total found: %s, changed %s" % (result.get('found', 0),
+                                               result.get('changed', 0))
+        for rule in rules.RULES:
+            if rule.name in result.get('rules', {}):
+                print "%s: %s" % (rule.name, ", ".join(
+                    "%s %s" % (k, v)
+                    for k, v in sorted(result['rules'][rule.name].items())))
+        if args.plan_out:
+            print "Wrote %d actions to %s" % (
+                plans.write_actions(result.get('actions', []),
+                                    args.plan_out),
+                args.plan_out)
+        if result.get('failed'):
+            print "ERROR: %d of %d projects failed: %s" % (
+                len(result['failed']), len(projects),
+                ", ".join(result['failed']))
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    worker.run(main)
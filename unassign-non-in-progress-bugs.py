@@ -2,15 +2,13 @@
 
 import argparse
 
-from launchpadlib.launchpad import Launchpad
-
 import openstack_bugs
-from openstack_bugs.messages import NO_REVIEWS
-
-ALL_STATUS = ["New",
-              "Incomplete",
-              "Confirmed",
-              "Triaged"]
+from openstack_bugs import cache
+from openstack_bugs import metrics
+from openstack_bugs import plans
+from openstack_bugs import rules
+from openstack_bugs import store
+from openstack_bugs import worker
 
 
 def parse_args():
@@ -20,47 +18,62 @@ def parse_args():
                         help='The project to act on')
     parser.add_argument('--search',
                         help='Custom search terms for bug')
+    parser.add_argument('--workers', type=int, default=1,
+                        help=('Number of bugs to load from launchpad in '
+                              'parallel. Default: 1'))
+    parser.add_argument('--review-ttl', type=int,
+                        default=cache.DEFAULT_REVIEW_TTL,
+                        help=('Seconds to trust the cached status of a '
+                              'review that is still open. Default: %s'
+                              % cache.DEFAULT_REVIEW_TTL))
+    parser.add_argument('--no-review-cache', action="store_true",
+                        default=False,
+                        help=("Don't keep review status, or the reviews "
+                              "linked from bug comments, between runs"))
+    parser.add_argument('--from-store', action="store_true", default=False,
+                        help=('Read bugs from the local bug store (see '
+                              'sync-bug-store.py) instead of launchpad. '
+                              'Changes are still made in launchpad.'))
+    parser.add_argument('--plan-out', metavar='FILE',
+                        help=('Write the changes that would be made to '
+                              'FILE as a plan for apply-plan.py, instead '
+                              'of making them. Implies --dryrun.'))
+    parser.add_argument('--metrics-out', metavar='FILE',
+                        help=('Write API call counts, bytes and latencies '
+                              'to FILE at exit, as JSON, or in the '
+                              'Prometheus text format if FILE ends in '
+                              '.prom'))
     parser.add_argument('--dryrun', action="store_true", default=False)
     return parser.parse_args()
 
 
 def main():
     args = parse_args()
-    launchpad = Launchpad.login_with('openstack-bugs', 'production')
-    project = launchpad.projects[args.project]
-    count = 0
-    fixed = 0
-    inprog = 0
-    for task in project.searchTasks(status=ALL_STATUS,
-                                search_text=args.search,
-                                order_by='-date_last_updated'):
-        try:
-            count += 1
-            inprog
-            bug = openstack_bugs.LPBug(task, launchpad, project=args.project)
-            print(bug)
-            reviews = openstack_bugs.open_reviews(bug.reviews)
-            if reviews and bug.assignee:
-                inprog += 1
-                if not args.dryrun:
-                    bug.status = "In Progress"
-                print("... this bug is marked in progress")
-            elif reviews:
-                inprog += 1
-                if not args.dryrun:
-                    bug.revert_to_last_assignee()
-                    bug.status = "In Progress"
-                print("... open reviews, reverting to last assignment")
-            elif bug.assignee:
-                fixed += 1
-                if not args.dryrun:
-                    bug.assignee = None
-                    bug.add_comment(NO_REVIEWS)
-                print("... bug is assigned but should not be!")
-        except Exception as e:
-            print "Exception: %s" % e
-    print "Total found: %s, would fix %s, in prog %s" % (count, fixed, inprog)
+    if args.metrics_out:
+        metrics.report_at_exit(args.metrics_out)
+    if args.plan_out:
+        args.dryrun = True
+    launchpad = openstack_bugs.launchpad_login()
+    if args.from_store:
+        launchpad = store.BugStore(lp=launchpad)
+    if not args.no_review_cache:
+        openstack_bugs.configure_review_cache(
+            cache.default_review_cache_path(), args.review_ttl)
+        openstack_bugs.configure_message_index(
+            cache.default_message_index_path())
+    rule = rules.UnassignNonInProgress(args.project)
+    plan = plans.sink(args.plan_out)
+    count, plan = rules.run_rules(launchpad, args.project, [rule],
+                                  search=args.search, workers=args.workers,
+                                  dryrun=args.dryrun, plan=plan)
+    if args.plan_out:
+        plan.close()
+        print "Wrote %d actions to %s" % (plan.actions, args.plan_out)
+    print "Total found: %s, would fix %s, in prog %s" % (
+        count, rule.counters['fixed'], rule.counters['in progress'])
+    print openstack_bugs.review_cache().summary()
+    print openstack_bugs.message_index().summary()
 
 
 if __name__ == "__main__":
-    main()
+    worker.run(main)